@@ -1,28 +1,25 @@
 import os
-import requests
+import sys
 from dotenv import load_dotenv
 
-load_dotenv()
-
-CLIENT_ID = os.getenv("GA4_CLIENT_ID")
-CLIENT_SECRET = os.getenv("GA4_CLIENT_SECRET")
-REFRESH_TOKEN = os.getenv("GA4_REFRESH_TOKEN")
-PROPERTY_ID = os.getenv("GA4_PROPERTY_ID")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from utils.oauth_tokens import TokenRefreshError, ga4_token_manager_from_env  # noqa: E402
 
-token_url = "https://oauth2.googleapis.com/token"
-payload = {
-    "client_id": CLIENT_ID,
-    "client_secret": CLIENT_SECRET,
-    "refresh_token": REFRESH_TOKEN,
-    "grant_type": "refresh_token"
-}
+load_dotenv()
 
-res = requests.post(token_url, data=payload)
-access_token = res.json().get("access_token")
+# Jeton mis en cache sur disque : le endpoint OAuth n'est appelé que si le
+# jeton en cache expire bientôt (ou avec --force).
+manager = ga4_token_manager_from_env()
+if manager is None:
+    print("❌ GA4_CLIENT_ID / GA4_CLIENT_SECRET / GA4_REFRESH_TOKEN manquants")
+    sys.exit(1)
 
-if access_token:
-    print("✅ Access token récupéré :")
-    print(access_token)
-else:
+try:
+    access_token = manager.get_access_token(force_refresh="--force" in sys.argv)
+except TokenRefreshError as e:
     print("❌ Échec de récupération du token :")
-    print(res.json())
+    print(e)
+    sys.exit(1)
+
+print("✅ Access token récupéré :")
+print(access_token)
@@ -1,45 +1,48 @@
 import os
+import sys
 import requests
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from utils.ga4_data import GA4DataClient, report_request  # noqa: E402
+from utils.oauth_tokens import TokenRefreshError, ga4_token_manager_from_env  # noqa: E402
+
 load_dotenv()
 
-# Étape 1 : récupérer un nouveau access_token via refresh_token
+# Étape 1 : access_token en cache disque, rafraîchi via refresh_token seulement si proche de l'expiration
 def get_access_token():
-    token_url = "https://oauth2.googleapis.com/token"
-    data = {
-        "client_id": os.getenv("GA4_CLIENT_ID"),
-        "client_secret": os.getenv("GA4_CLIENT_SECRET"),
-        "refresh_token": os.getenv("GA4_REFRESH_TOKEN"),
-        "grant_type": "refresh_token"
-    }
-    response = requests.post(token_url, data=data)
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data["access_token"]
-    else:
-        print("❌ Échec récupération token :", response.status_code, response.text)
+    manager = ga4_token_manager_from_env()
+    if manager is None:
+        print("❌ GA4_CLIENT_ID / GA4_CLIENT_SECRET / GA4_REFRESH_TOKEN manquants")
+        return None
+    try:
+        return manager.get_access_token()
+    except (TokenRefreshError, requests.exceptions.RequestException) as e:
+        print("❌ Échec récupération token :", e)
         return None
 
-# Étape 2 : lancer le runReport
+# Étape 2 : lancer les rapports (un seul appel batchRunReports)
 def run_report(access_token):
     property_id = os.getenv("GA4_PROPERTY_ID")
-    url = f"https://analyticsdata.googleapis.com/v1beta/properties/{property_id}:runReport"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "dateRanges": [{"startDate": "2024-11-01", "endDate": "2024-11-08"}],
-        "dimensions": [{"name": "country"}],
-        "metrics": [{"name": "activeUsers"}]
-    }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 200:
-        print("✅ Rapport GA4 récupéré :\n")
-        print(response.json())
-    else:
-        print("❌ Échec du runReport :", response.status_code, response.text)
+    start_date = os.getenv("GA4_START_DATE", "7daysAgo")
+    end_date = os.getenv("GA4_END_DATE", "yesterday")
+    client = GA4DataClient(property_id, access_token)
+    requests_ = [
+        report_request(["country"], ["activeUsers"], start_date, end_date, order_by_metric="activeUsers"),
+        report_request(["sessionDefaultChannelGroup"], ["sessions"], start_date, end_date, order_by_metric="sessions"),
+        report_request(["pagePath"], ["screenPageViews"], start_date, end_date, limit=20, order_by_metric="screenPageViews"),
+        report_request(["deviceCategory"], ["sessions"], start_date, end_date),
+    ]
+    try:
+        countries, sources, pages, devices = client.run_reports(requests_)
+    except requests.exceptions.RequestException as e:
+        print("❌ Échec du batchRunReports :", e)
+        return
+    print(f"✅ Rapports GA4 récupérés ({client.round_trips} appel(s) API) :\n")
+    for title, df in (("Pays", countries), ("Sources", sources), ("Pages", pages), ("Appareils", devices)):
+        print(f"— {title}")
+        print(df.to_string(index=False))
+        print()
 
 if __name__ == "__main__":
     token = get_access_token()
@@ -23,20 +23,40 @@ Usage:
 import os
 import json
 import requests
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Any, Optional
 import base64
 
+import numpy as np
+
+from utils.amplitude_export import fetch_export_aggregates
+from utils.clarity_snapshots import clarity_week
+from utils.ga4_data import GA4DataClient, report_request
+from utils.http_transport import get_transport
+from utils.oauth_tokens import TokenRefreshError, get_ga4_access_token, has_ga4_credentials
+from utils.sentry_issues import collect_sentry_errors
+from utils.shopify_orders import ingest_orders
+
 class BaseAnalyticsConnector:
     """Base class for all analytics connectors"""
 
+    # Provider name used by the response cache (settle lag, key namespace)
+    provider: Optional[str] = None
+
     def __init__(self, credentials: Dict[str, str]):
         self.credentials = credentials
         self.base_url = ""
+        # Shared keep-alive pools + retry/backoff for every connector
+        self.transport = get_transport()
 
-    def _make_request(self, endpoint: str, params: Dict = None, headers: Dict = None) -> Dict:
-        """Make authenticated API request"""
-        url = f"{self.base_url}{endpoint}"
+    def _send(self, endpoint: str, params: Dict = None, headers: Dict = None,
+              method: str = "GET", json_body: Dict = None, as_of: Optional[date] = None) -> requests.Response:
+        """Send an authenticated request and return the raw response
+
+        ``as_of`` is the last day the request covers; passing it makes the
+        response cacheable (forever once that day is closed).
+        """
+        url = endpoint if endpoint.startswith("http") else f"{self.base_url}{endpoint}"
 
         default_headers = {
             'Content-Type': 'application/json',
@@ -46,11 +66,18 @@ class BaseAnalyticsConnector:
         if headers:
             default_headers.update(headers)
 
+        response = self.transport.request(method, url, params=params, json=json_body, headers=default_headers,
+                                          provider=self.provider, as_of=as_of)
+        response.raise_for_status()
+        return response
+
+    def _make_request(self, endpoint: str, params: Dict = None, headers: Dict = None,
+                      method: str = "GET", json_body: Dict = None, as_of: Optional[date] = None) -> Dict:
+        """Make authenticated API request"""
         try:
-            response = requests.get(url, params=params, headers=default_headers, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return self._send(endpoint, params=params, headers=headers, method=method,
+                              json_body=json_body, as_of=as_of).json()
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"API Request failed: {e}")
             return {}
 
@@ -58,6 +85,8 @@ class BaseAnalyticsConnector:
 class GA4Connector(BaseAnalyticsConnector):
     """Google Analytics 4 API Connector"""
 
+    provider = 'ga4'
+
     def __init__(self, credentials_file: str):
         # Load service account credentials
         with open(credentials_file, 'r') as f:
@@ -69,69 +98,93 @@ class GA4Connector(BaseAnalyticsConnector):
 
     def _get_access_token(self) -> str:
         """Get OAuth2 access token for GA4 API"""
-        # Implementation for service account authentication
-        # This would use google-auth library in production
-        return os.getenv('GA4_ACCESS_TOKEN', 'mock-token')
+        # Disk-cached and refreshed shortly before expiry (one refresh across processes)
+        return get_ga4_access_token() or 'mock-token'
+
+    def weekly_report_requests(self, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """The five reports behind the weekly GA4 section (one batch call)"""
+        start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+        return [
+            # Totals
+            report_request([], ["sessions", "totalUsers", "newUsers", "screenPageViews", "bounceRate",
+                                "averageSessionDuration", "transactions", "totalRevenue"], start, end),
+            # Daily sessions
+            report_request(["date"], ["sessions"], start, end, orderBys=[{"dimension": {"dimensionName": "date"}}]),
+            # Traffic sources
+            report_request(["sessionDefaultChannelGroup"], ["sessions"], start, end, order_by_metric="sessions"),
+            # Top pages
+            report_request(["pagePath"], ["screenPageViews"], start, end, limit=10, order_by_metric="screenPageViews"),
+            # Device split
+            report_request(["deviceCategory"], ["sessions"], start, end),
+        ]
 
     def fetch_weekly_data(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Fetch comprehensive GA4 data for the week"""
 
-        access_token = self._get_access_token()
-        headers = {'Authorization': f'Bearer {access_token}'}
-
-        # GA4 Reporting API request structure
-        request_body = {
-            "requests": [
-                {
-                    "entity": {"propertyId": self.property_id},
-                    "dateRanges": [
-                        {
-                            "startDate": start_date.strftime("%Y-%m-%d"),
-                            "endDate": end_date.strftime("%Y-%m-%d")
-                        }
-                    ],
-                    "dimensions": [
-                        {"name": "date"},
-                        {"name": "pagePath"},
-                        {"name": "sessionDefaultChannelGroup"},
-                        {"name": "deviceType"}
-                    ],
-                    "metrics": [
-                        {"name": "sessions"},
-                        {"name": "users"},
-                        {"name": "pageviews"},
-                        {"name": "bounceRate"},
-                        {"name": "averageSessionDuration"},
-                        {"name": "conversions"},
-                        {"name": "totalRevenue"},
-                        {"name": "transactions"}
-                    ]
-                }
-            ]
-        }
+        if not self.property_id or not has_ga4_credentials():
+            # Not configured: structured mock data that matches the real shape
+            return {
+                'sessions': 1847,
+                'users': 1234,
+                'pageviews': 5678,
+                'bounce_rate': 0.42,
+                'avg_session_duration': 245.3,
+                'conversion_rate': 0.034,
+                'revenue': 8432.50,
+                'transactions': 45,
+                'new_users_percentage': 0.73,
+                'mobile_percentage': 0.68,
+                # ... rest of the data structure
+            }
+
+        client = GA4DataClient(self.property_id, self._get_access_token, transport=self.transport)
+        try:
+            totals, daily, sources, pages, devices = client.run_reports(
+                self.weekly_report_requests(start_date, end_date)
+            )
+        except (requests.exceptions.RequestException, TokenRefreshError, ValueError) as e:
+            print(f"API Request failed: {e}")
+            return {}
+
+        def total(metric: str) -> float:
+            return float(totals[metric].iloc[0]) if len(totals) else 0.0
 
-        # In production, make actual API call
-        # response = self._make_request("reports:batchGet", json=request_body, headers=headers)
+        sessions = total("sessions")
+        users = total("totalUsers")
+        transactions = total("transactions")
+        source_sessions = sources["sessions"].to_numpy() if len(sources) else np.array([])
+        device_sessions = devices["sessions"].to_numpy() if len(devices) else np.array([])
+        mobile = device_sessions[(devices["deviceCategory"] == "mobile").to_numpy()].sum() if len(devices) else 0.0
 
-        # For now, return structured mock data that matches GA4 API format
         return {
-            'sessions': 1847,
-            'users': 1234,
-            'pageviews': 5678,
-            'bounce_rate': 0.42,
-            'avg_session_duration': 245.3,
-            'conversion_rate': 0.034,
-            'revenue': 8432.50,
-            'transactions': 45,
-            'new_users_percentage': 0.73,
-            'mobile_percentage': 0.68,
-            # ... rest of the data structure
+            'sessions': int(sessions),
+            'users': int(users),
+            'pageviews': int(total("screenPageViews")),
+            'bounce_rate': round(total("bounceRate"), 3),
+            'avg_session_duration': round(total("averageSessionDuration"), 2),
+            'conversion_rate': round(transactions / sessions, 4) if sessions else 0.0,
+            'revenue': round(total("totalRevenue"), 2),
+            'transactions': int(transactions),
+            'new_users_percentage': round(total("newUsers") / users, 3) if users else 0.0,
+            'mobile_percentage': round(float(mobile / device_sessions.sum()), 3) if device_sessions.sum() else 0.0,
+            'top_pages': [
+                {'page': page, 'views': int(views)}
+                for page, views in zip(pages["pagePath"].to_numpy(), pages["screenPageViews"].to_numpy())
+            ] if len(pages) else [],
+            'traffic_sources': dict(zip(
+                (name.lower() for name in sources["sessionDefaultChannelGroup"].to_numpy()),
+                np.round(source_sessions / source_sessions.sum(), 3).tolist()
+            )) if source_sessions.sum() else {},
+            'daily_sessions': daily["sessions"].astype(int).tolist() if len(daily) else [],
+            'api_round_trips': client.round_trips,
         }
 
 
 class AmplitudeConnector(BaseAnalyticsConnector):
     """Amplitude Product Analytics API Connector"""
 
+    provider = 'amplitude'
+
     def __init__(self):
         super().__init__({})
         self.base_url = "https://amplitude.com/api/2/"
@@ -151,32 +204,34 @@ class AmplitudeConnector(BaseAnalyticsConnector):
     def fetch_events_data(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Fetch event tracking data from Amplitude"""
 
-        params = {
-            'start': start_date.strftime("%Y%m%d"),
-            'end': end_date.strftime("%Y%m%d"),
-            'metrics': 'totals,uniques,revenue',
-            'group_by': 'event_type'
-        }
-
-        headers = self._get_auth_headers()
+        if not (self.api_key and self.secret_key):
+            return {
+                'events_tracked': 18500,
+                'unique_users': 987,
+                'user_retention': {
+                    'day_1': 0.52,
+                    'day_7': 0.28,
+                    'day_30': 0.12
+                },
+                # ... rest of Amplitude data
+            }
+
+        # Raw event export (zip of gzipped NDJSON), decoded and aggregated as it streams
+        try:
+            aggregates = fetch_export_aggregates(self.api_key, self.secret_key, start_date, end_date,
+                                                 transport=self.transport)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"API Request failed: {e}")
+            return {}
 
-        # In production: response = self._make_request("events/list", params=params, headers=headers)
-
-        return {
-            'events_tracked': 18500,
-            'unique_users': 987,
-            'user_retention': {
-                'day_1': 0.52,
-                'day_7': 0.28,
-                'day_30': 0.12
-            },
-            # ... rest of Amplitude data
-        }
+        return aggregates.as_dict()
 
 
 class HotjarConnector(BaseAnalyticsConnector):
     """Hotjar User Behavior API Connector"""
 
+    provider = 'hotjar'
+
     def __init__(self):
         super().__init__({})
         self.base_url = "https://insights.hotjar.com/api/v1/"
@@ -194,7 +249,8 @@ class HotjarConnector(BaseAnalyticsConnector):
             'date_to': end_date.strftime("%Y-%m-%d")
         }
 
-        # In production: response = self._make_request("heatmaps", params=params, headers=headers)
+        # In production: response = self._make_request("heatmaps", params=params, headers=headers,
+        #                                              as_of=end_date.date())
 
         return {
             'sessions_recorded': 245,
@@ -208,6 +264,8 @@ class HotjarConnector(BaseAnalyticsConnector):
 class ClarityConnector(BaseAnalyticsConnector):
     """Microsoft Clarity API Connector"""
 
+    provider = 'clarity'
+
     def __init__(self):
         super().__init__({})
         self.base_url = "https://www.clarity.ms/api/"
@@ -215,18 +273,15 @@ class ClarityConnector(BaseAnalyticsConnector):
         self.project_id = os.getenv('CLARITY_PROJECT_ID')
 
     def fetch_session_data(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
-        """Fetch Clarity session and user behavior data"""
+        """Clarity session and user behavior data for the period
 
-        headers = {'Authorization': f'Bearer {self.api_key}'}
-
-        # Clarity API structure (hypothetical - check actual API docs)
-        params = {
-            'projectId': self.project_id,
-            'startDate': start_date.isoformat(),
-            'endDate': end_date.isoformat()
-        }
-
-        # In production: response = self._make_request("sessions", params=params, headers=headers)
+        Read from the daily snapshots taken by ``scripts/ingest_history.py``
+        (the export API allows 10 calls a day and only covers the last 3
+        days), so this never spends Clarity quota.
+        """
+        summary = clarity_week(start_date.date(), end_date.date())
+        if summary:
+            return summary
 
         return {
             'total_sessions': 1456,
@@ -240,6 +295,8 @@ class ClarityConnector(BaseAnalyticsConnector):
 class SentryConnector(BaseAnalyticsConnector):
     """Sentry Error Tracking API Connector"""
 
+    provider = 'sentry'
+
     def __init__(self):
         super().__init__({})
         self.base_url = "https://sentry.io/api/0/"
@@ -250,31 +307,30 @@ class SentryConnector(BaseAnalyticsConnector):
     def fetch_error_data(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Fetch error tracking and performance data"""
 
-        headers = {'Authorization': f'Bearer {self.auth_token}'}
-
-        # Get project issues
-        params = {
-            'start': start_date.isoformat(),
-            'end': end_date.isoformat(),
-            'statsPeriod': '7d'
-        }
-
-        endpoint = f"projects/{self.organization}/{self.project}/issues/"
-
-        # In production: response = self._make_request(endpoint, params=params, headers=headers)
+        if not (self.auth_token and self.organization and self.project):
+            return {
+                'total_errors': 34,
+                'unique_errors': 12,
+                'crash_free_sessions': 0.987,
+                'performance_score': 92.3,
+                # ... rest of Sentry data
+            }
 
-        return {
-            'total_errors': 34,
-            'unique_errors': 12,
-            'crash_free_sessions': 0.987,
-            'performance_score': 92.3,
-            # ... rest of Sentry data
-        }
+        # Issue list (cursor-paginated) + per-issue daily counts on a bounded pool
+        try:
+            return collect_sentry_errors(self.organization, self.project, self.auth_token,
+                                         start_date, end_date, api_root=self.base_url,
+                                         transport=self.transport)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"API Request failed: {e}")
+            return {}
 
 
 class ShopifyConnector(BaseAnalyticsConnector):
     """Shopify Store Analytics Connector"""
 
+    provider = 'shopify'
+
     def __init__(self):
         super().__init__({})
         self.base_url = f"https://{os.getenv('SHOPIFY_STORE')}.myshopify.com/admin/api/2023-07/"
@@ -285,21 +341,19 @@ class ShopifyConnector(BaseAnalyticsConnector):
 
         headers = {'X-Shopify-Access-Token': self.access_token}
 
-        # Fetch orders, products, customers data
-        orders_response = self._make_request(
-            "orders.json",
-            params={
-                'created_at_min': start_date.isoformat(),
-                'created_at_max': end_date.isoformat(),
-                'status': 'any'
-            },
-            headers=headers
-        )
+        # Stream every orders page (cursor pagination) into running totals
+        try:
+            totals = ingest_orders(self.base_url, headers, start_date, end_date, transport=self.transport)
+        except requests.exceptions.RequestException as e:
+            print(f"API Request failed: {e}")
+            totals = {}
 
         return {
-            'total_orders': len(orders_response.get('orders', [])),
-            'total_revenue': sum(float(order['total_price']) for order in orders_response.get('orders', [])),
-            'avg_order_value': 0,  # Calculate from orders
+            'total_orders': totals.get('total_orders', 0),
+            'total_revenue': totals.get('total_revenue', 0.0),
+            'avg_order_value': totals.get('avg_order_value', 0.0),
+            'total_refunds': totals.get('total_refunds', 0.0),
+            'net_revenue': totals.get('net_revenue', 0.0),
             'abandoned_carts': 0,  # Fetch from abandoned checkouts endpoint
             # ... rest of Shopify data
         }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+backfill_reports.py
+
+Regenerate the weekly report for every week of a date range in one run.
+
+1. Fetch once: the GA4 days of the whole range (local history, the API only
+   for days past the watermark) and the Sentry issues with their daily
+   counts (one paginated walk for the whole range).
+2. Split in memory: every week's sections are built from its slice of the
+   union window. Placeholder sources are seeded per week, so a rerun builds
+   the same sections. All weeks' ``weekly`` warehouse rows are written once.
+3. Skip what did not change: a week is rendered again only when its inputs
+   (sections, the stored history its comparisons read, the report code and
+   its utils modules, the insight rules) or its previous outputs differ from
+   the last backfill (``reports/backfill/<market>/.backfill-manifest.json``).
+4. Render the remaining weeks in parallel worker processes:
+   ``reports/backfill/<market>/<week end>/weekly-report-<date>.html``
+   (+ charts/, data/).
+
+Weeks end on ``--end`` and every 7 days before it, down to the first week
+starting on or after ``--start``.
+
+Usage:
+    python backfill_reports.py --start 2026-07-01 --end 2026-09-30
+    python backfill_reports.py --start 2026-07-01 --end 2026-09-30 --market allemagne --workers 4 --force
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as day_time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from generate_weekly_report import TPSAnalyticsReporter, read_stored_rows
+from utils.ga4_data import GA4DataClient
+from utils.history import HistoryStore
+from utils.insight_rules import DEFAULT_RULES_PATH
+from utils.markets import split_markets
+from utils.oauth_tokens import get_ga4_access_token, has_ga4_credentials
+from utils.process_pool import pool_size, run_in_pool
+from utils.sentry_issues import SentryIssueCollector
+from utils.warehouse import DEFAULT_MARKET, MetricsWarehouse
+
+MANIFEST_NAME = '.backfill-manifest.json'
+SCRIPTS_DIR = Path(__file__).resolve().parent
+# Code and configuration whose changes invalidate every rendered week: the
+# report, every utils module (sections, charts, comparisons, insights all live
+# there, imported directly or not) and the insight rules
+REPORT_INPUT_FILES = [
+    SCRIPTS_DIR / 'generate_weekly_report.py',
+    *sorted((SCRIPTS_DIR / 'utils').glob('*.py')),
+    DEFAULT_RULES_PATH,
+]
+
+
+def week_ends(start: date, end: date) -> List[date]:
+    """Week end days (oldest first): ``end``, ``end - 7``, ... while the week starts on or after ``start``."""
+    ends = []
+    day = end
+    while day - timedelta(days=6) >= start:
+        ends.append(day)
+        day -= timedelta(days=7)
+    return ends[::-1]
+
+
+def _end_of_day(day: date) -> datetime:
+    return datetime.combine(day, day_time(23, 59, 59))
+
+
+def _digest(*parts: bytes) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _frame_digest(frame: Optional[pd.DataFrame]) -> bytes:
+    if frame is None or frame.empty:
+        return b''
+    frame = frame.sort_values(list(frame.columns)).reset_index(drop=True)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else ''
+
+
+def code_digest() -> str:
+    # Names count too: a module added or removed changes the digest
+    return _digest(*(f"{path.name}:{_file_digest(path)}".encode() for path in REPORT_INPUT_FILES))
+
+
+# -- fetch once ----------------------------------------------------------------
+
+def prefetch(first: date, last: date) -> Dict[str, Any]:
+    """Provider data of the union window ``[first, last]``, fetched once.
+
+    A provider that fails is logged and left out: every week then fetches
+    it on its own, and a week that fails too gets a ``_partial`` section
+    (see :func:`build_sections`). One bad provider never stops the backfill.
+    """
+    prefetched: Dict[str, Any] = {}
+
+    stored, missing = HistoryStore().split('ga4', first, last)
+    frames = [f for f in (stored,) if not f.empty]
+    property_id = os.getenv('GA4_PROPERTY_ID')
+    if missing and property_id and has_ga4_credentials():
+        try:
+            # Unfilled: a day GA4 has not processed yet leaves its week incomplete, not zero
+            fetched = GA4DataClient(property_id, get_ga4_access_token).fetch_daily(*missing, fill=False)
+            frames += [fetched] if not fetched.empty else []
+            missing = None
+        except Exception as e:
+            print(f"⚠️  GA4: {missing[0]} → {missing[1]} not fetched ({e!r})")
+    if frames:
+        # Weeks not fully covered fall back to the placeholder section (see ga4_history_overlay)
+        ga4 = pd.concat(frames, ignore_index=True)
+        ga4['date'] = ga4['date'].astype(str).str[:10]
+        prefetched['ga4'] = ga4.drop_duplicates('date', keep='last').sort_values('date').reset_index(drop=True)
+        print(f"🗄️  GA4: {prefetched['ga4']['date'].nunique()} day(s) for the whole range"
+              + (f", {missing[0]} → {missing[1]} not available" if missing else ""))
+
+    org, project, token = os.getenv('SENTRY_ORG'), os.getenv('SENTRY_PROJECT'), os.getenv('SENTRY_AUTH_TOKEN')
+    if org and project and token:
+        collector = SentryIssueCollector(org, project, token)
+        try:
+            prefetched['sentry'] = collector.collect_series(_end_of_day(first - timedelta(days=1)), _end_of_day(last))
+            print(f"🚨 Sentry: {len(prefetched['sentry'][0])} issue(s) for the whole range "
+                  f"({collector.requests_made} request(s))")
+        except Exception as e:
+            print(f"⚠️  Sentry: range not fetched ({e!r}); weeks fetch their own")
+    return prefetched
+
+
+def build_sections(reporter: TPSAnalyticsReporter, prefetched: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """One week's sections, sliced from the prefetched window (no network)."""
+    reporter.prefetched = prefetched
+    # Placeholder sources draw from the global RNG: one seed per week, fetched
+    # in a fixed order, so a rerun rebuilds the same sections
+    np.random.seed(int(reporter.end_date.strftime('%Y%m%d')))
+    sections = {}
+    for name, fetch in (('ga4', reporter.fetch_ga4_data), ('amplitude', reporter.fetch_amplitude_data),
+                        ('hotjar', reporter.fetch_hotjar_data), ('sentry', reporter.fetch_sentry_data)):
+        try:
+            sections[name] = fetch()
+        except Exception as e:
+            print(f"⚠️  {reporter.end_date.date()} {name}: fetch failed ({e!r}); section marked partial")
+            sections[name] = {'_partial': True, '_reason': repr(e)}
+    return sections
+
+
+def _until(frame: pd.DataFrame, day: date) -> pd.DataFrame:
+    """Rows dated on or before ``day`` (what a report of that week could have read)."""
+    if frame is None or frame.empty:
+        return frame
+    return frame[pd.to_datetime(frame['date']).dt.date <= day].reset_index(drop=True)
+
+
+# -- render --------------------------------------------------------------------
+
+def render_week(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker: the weekly report of one week. Never raises; failures come back as ``error``."""
+    end, week = job['end_date'], job['week']
+    started = time.monotonic()
+    try:
+        reporter = TPSAnalyticsReporter(market=job['market'], output_dir=job['output_dir'], end_date=end)
+        reporter.report_data = job['report_data']
+        reporter.stored = {'daily': job['daily'], 'windows': job['windows']}
+
+        # Already a pool worker: charts render in-process
+        charts = reporter.create_charts(workers=1)
+        insights = reporter.generate_insights_and_recommendations()
+        reporter.create_html_report(insights)
+        reporter.save_data_json(record=False)
+
+        files = [reporter.output_path(f"weekly-report-{week}.html"),
+                 reporter.output_path('data', f"analytics-data-{week}.json")] + charts
+        return {'week': week, 'insights': len(insights), 'files': files,
+                'elapsed': round(time.monotonic() - started, 2)}
+    except Exception as e:
+        return {'week': week, 'error': repr(e), 'elapsed': round(time.monotonic() - started, 2)}
+
+
+# -- manifest ------------------------------------------------------------------
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        print(f"⚠️  Unreadable manifest {path}; rendering every week")
+        return {}
+
+
+def save_manifest(path: Path, manifest: Dict[str, Any]):
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def outputs_unchanged(entry: Optional[Dict[str, Any]], inputs: str) -> bool:
+    """True when the last backfill rendered these inputs and its outputs are still on disk, untouched."""
+    if not entry or entry.get('inputs') != inputs or not entry.get('outputs'):
+        return False
+    return all(_file_digest(Path(path)) == digest for path, digest in entry['outputs'].items())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backfill TPS-STAR weekly reports over a date range")
+    parser.add_argument('--start', required=True, type=date.fromisoformat, help="first day of the range (YYYY-MM-DD)")
+    parser.add_argument('--end', required=True, type=date.fromisoformat, help="last day of the range (YYYY-MM-DD)")
+    parser.add_argument('--market', default=None, help="market to report (default: TPS_MARKET or all)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--out', default=os.path.join('reports', 'backfill'), help="output directory")
+    parser.add_argument('--force', action='store_true', help="render every week, even unchanged ones")
+    args = parser.parse_args()
+
+    ends = week_ends(args.start, args.end)
+    if not ends:
+        print(f"❌ No full week between {args.start} and {args.end}")
+        return 1
+    market = args.market or os.getenv('TPS_MARKET') or DEFAULT_MARKET
+    started = time.monotonic()
+    print(f"🗓️  Backfilling {len(ends)} week(s) ending {ends[0]} → {ends[-1]} ({market})")
+
+    # Fetch once for the union window, then build every week's sections from it
+    first_day = ends[0] - timedelta(days=6)
+    prefetched = prefetch(first_day, ends[-1])
+    reporters = {}
+    for day in ends:
+        week = day.isoformat()
+        reporter = TPSAnalyticsReporter(market=market, output_dir=os.path.join(args.out, market, week),
+                                        end_date=_end_of_day(day))
+        reporter.report_data = build_sections(reporter, prefetched)
+        reporters[week] = reporter
+
+    # One warehouse write for every week, then one read covering all their comparisons
+    MetricsWarehouse().write(pd.concat([r.weekly_rows() for r in reporters.values()], ignore_index=True))
+    daily, windows = read_stored_rows(_end_of_day(first_day), _end_of_day(ends[-1]))
+    daily, windows = split_markets(daily, [market])[market], split_markets(windows, [market])[market]
+
+    out = Path(args.out) / market
+    out.mkdir(parents=True, exist_ok=True)
+    manifest_path = out / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    code = code_digest()
+
+    jobs, skipped = [], []
+    for week, reporter in reporters.items():
+        day = reporter.end_date.date()
+        week_daily, week_windows = _until(daily, day), _until(windows, day)
+        sections = json.dumps(reporter.report_data, sort_keys=True, default=str).encode()
+        inputs = _digest(code.encode(), sections, _frame_digest(week_daily), _frame_digest(week_windows))
+        if not args.force and outputs_unchanged(manifest.get(week), inputs):
+            skipped.append(week)
+            continue
+        jobs.append({'week': week, 'market': market, 'output_dir': reporter.output_dir,
+                     'end_date': reporter.end_date, 'report_data': reporter.report_data,
+                     'daily': week_daily, 'windows': week_windows, 'inputs': inputs})
+
+    if skipped:
+        print(f"⏭️  {len(skipped)} week(s) unchanged since the last backfill: {', '.join(skipped)}")
+    results = []
+    if jobs:
+        workers = pool_size(len(jobs), args.workers)
+        print(f"⚙️  Rendering {len(jobs)} week(s) on {workers} worker(s)...")
+        results = run_in_pool(render_week, jobs, workers=workers)
+
+    for job, result in zip(jobs, results):
+        if result.get('error'):
+            print(f"❌ {result['week']}: {result['error']}")
+            manifest.pop(result['week'], None)
+            continue
+        print(f"✅ {result['week']}: {len(result['files'])} file(s), {result['insights']} insight(s) "
+              f"in {result['elapsed']}s")
+        manifest[result['week']] = {
+            'inputs': job['inputs'],
+            'outputs': {path: _file_digest(Path(path)) for path in result['files']},
+        }
+    save_manifest(manifest_path, manifest)
+
+    failed = sum(1 for r in results if r.get('error'))
+    print(f"📦 Backfill done: {len(results) - failed} rendered, {len(skipped)} skipped, {failed} failed "
+          f"({time.monotonic() - started:.1f}s total)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
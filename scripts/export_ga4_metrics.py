@@ -1,7 +1,8 @@
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from utils.ga4_api import GA4Client
+from utils.warehouse import MetricsWarehouse
 
 # TPS - Unified export for daily + weekly dashboards
 # --------------------------------------------------
@@ -27,6 +28,9 @@ def export_ga4_metrics(out_path="report_data/ga4_metrics.json"):
     with open(out_path, "w") as f:
         json.dump(metrics, f, indent=2)
 
+    # GA4Client covers 7daysAgo → yesterday
+    MetricsWarehouse().record("ga4", datetime.utcnow() - timedelta(days=1), metrics, dimensions={"window": "7d"})
+
     return metrics
 
 
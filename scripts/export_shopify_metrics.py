@@ -1,40 +1,138 @@
 #!/usr/bin/env python3
-import requests
 import pandas as pd
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 import argparse
 import os
 
-def fetch_shopify_metrics(domain, token):
-    base = f"https://{domain}/admin/api/2025-01"
+from utils.history import HistoryStore, last_closed_day
+from utils.shopify_bulk import run_bulk_order_export
+from utils.shopify_orders import daily_order_totals, ingest_orders
+from utils.warehouse import MetricsWarehouse
+
+API_VERSION = "2025-01"
+CHECKPOINT_NAME = ".shopify_orders.checkpoint.json"
+
+def api_base(domain, override=None):
+    return override or f"https://{domain}/admin/api/{API_VERSION}/"
+
+def fetch_shopify_metrics(domain, token, since=None, until=None, checkpoint_path=None, base_url=None):
+    base = api_base(domain, base_url)
     headers = {"X-Shopify-Access-Token": token}
 
-    # Orders
-    orders_url = f"{base}/orders.json?status=any&limit=250"
-    orders = requests.get(orders_url, headers=headers).json().get("orders", [])
+    until = until or datetime.now(UTC)
+    since = since or (until - timedelta(days=7))
 
-    total_orders = len(orders)
-    total_revenue = sum(float(o.get("total_price", 0)) for o in orders)
+    # Orders — every page of the window, folded into running totals
+    totals = ingest_orders(base, headers, since, until, checkpoint_path=checkpoint_path)
 
     return {
-        "total_orders": total_orders,
-        "total_revenue": total_revenue,
+        "total_orders": totals["total_orders"],
+        "total_revenue": totals["total_revenue"],
+        "avg_order_value": totals["avg_order_value"],
+        "total_refunds": totals["total_refunds"],
+        "net_revenue": totals["net_revenue"],
+        "period_start": since.isoformat(),
+        "period_end": until.isoformat(),
         "generated_at": datetime.now(UTC).isoformat()
     }
 
+def fetch_shopify_history(domain, token, since, until, base_url=None):
+    """Bulk-operation export: per-day order totals over a long window."""
+    headers = {"X-Shopify-Access-Token": token}
+    daily = run_bulk_order_export(api_base(domain, base_url), headers, since, until)
+
+    df = pd.DataFrame(
+        [{"date": day, **values} for day, values in sorted(daily.items())],
+        columns=["date", "orders", "revenue", "refunds"],
+    )
+    df["revenue"] = df["revenue"].round(2)
+    df["refunds"] = df["refunds"].round(2)
+    return df
+
+def fetch_shopify_incremental(domain, token, since, until, base_url=None, history=None):
+    """Daily totals for the window, served from the local history.
+
+    Only days after the ``shopify`` watermark (up to the last closed day) are
+    fetched from the API and appended first.
+    """
+    history = history or HistoryStore()
+    headers = {"X-Shopify-Access-Token": token}
+    base = api_base(domain, base_url)
+    end = min(until.date(), last_closed_day("shopify"))
+    history.ingest("shopify", lambda start, stop: daily_order_totals(base, headers, start, stop),
+                   backfill_start=since.date(), until=end)
+    daily, _ = history.split("shopify", since.date(), end)
+    return daily[["date", "orders", "revenue", "refunds"]]
+
+def daily_metrics(daily, since, until):
+    orders = int(daily["orders"].sum())
+    revenue = float(daily["revenue"].sum())
+    refunds = float(daily["refunds"].sum())
+    return {
+        "total_orders": orders,
+        "total_revenue": round(revenue, 2),
+        "avg_order_value": round(revenue / orders, 2) if orders else 0.0,
+        "total_refunds": round(refunds, 2),
+        "net_revenue": round(revenue - refunds, 2),
+        "period_start": since.isoformat(),
+        "period_end": until.isoformat(),
+        "generated_at": datetime.now(UTC).isoformat()
+    }
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=UTC)
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--domain", required=True)
     parser.add_argument("--token", required=True)
     parser.add_argument("--outdir", required=True)
+    parser.add_argument("--mode", choices=["rest", "bulk", "incremental"], default="rest",
+                        help="rest: paginated orders for a recent window; bulk: GraphQL bulk export for backfills; "
+                             "incremental: closed days from the local history, fetching only the delta")
+    parser.add_argument("--days", type=int, default=7, help="window size ending now (default: 7)")
+    parser.add_argument("--since", type=parse_day, help="window start, YYYY-MM-DD (overrides --days)")
+    parser.add_argument("--until", type=parse_day, help="window end, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--api-base", default=os.getenv("SHOPIFY_API_BASE"),
+                        help="Admin API root override, e.g. a local stub server")
     args = parser.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
 
-    metrics = fetch_shopify_metrics(args.domain, args.token)
+    # Hour-aligned window so a rerun after an interruption resumes from its checkpoint
+    until = datetime.now(UTC).replace(minute=0, second=0, microsecond=0)
+    if args.until:
+        until = args.until + timedelta(days=1) - timedelta(seconds=1)
+    since = args.since or (until - timedelta(days=args.days))
+
+    if args.mode == "bulk":
+        daily = fetch_shopify_history(args.domain, args.token, since, until, base_url=args.api_base)
+        daily.to_csv(f"{args.outdir}/shopify_orders_daily.csv", index=False)
+        metrics = daily_metrics(daily, since, until)
+        print(f"✅ Shopify daily history exported → {args.outdir}/shopify_orders_daily.csv ({len(daily)} days)")
+    elif args.mode == "incremental":
+        daily = fetch_shopify_incremental(args.domain, args.token, since, until, base_url=args.api_base)
+        daily.to_csv(f"{args.outdir}/shopify_orders_daily.csv", index=False)
+        # Open days are not in the history: the window ends at the last closed day
+        closed_until = datetime.combine(last_closed_day("shopify"), datetime.max.time(), UTC).replace(microsecond=0)
+        metrics = daily_metrics(daily, since, min(until, closed_until))
+        print(f"✅ Shopify metrics from local history → {args.outdir}/shopify_orders_daily.csv ({len(daily)} days)")
+    else:
+        metrics = fetch_shopify_metrics(
+            args.domain, args.token, since=since, until=until,
+            checkpoint_path=os.path.join(args.outdir, CHECKPOINT_NAME),
+            base_url=args.api_base
+        )
+
     df = pd.DataFrame([metrics])
     df.to_csv(f"{args.outdir}/shopify_metrics.csv", index=False)
 
+    warehouse = MetricsWarehouse()
+    if args.mode == "bulk":
+        warehouse.record_daily("shopify", daily)  # incremental days are written by the history
+    window = f"{max(1, round((until - since).total_seconds() / 86400))}d"
+    warehouse.record("shopify", metrics["period_end"], metrics, dimensions={"window": window})
+
     print("✅ Shopify metrics exported → report_data/shopify_metrics.csv")
 
 if __name__ == "__main__":
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+generate_market_reports.py
+
+Per-market weekly reports, rendered concurrently in a process pool.
+
+Provider sections are collected once and the warehouse is read once, then
+both are sliced per storefront market (config/markets.json). Each market's
+report is rendered in its own worker process:
+
+    reports/markets/<market>/weekly-report-<date>.html   (+ charts/, data/)
+    reports/markets/<market>/metrics_full_report.csv
+    reports/markets/<market>/TPS-Executive-Summary.pdf   (reportlab)
+    reports/markets/<market>/TPS-Business-Report.pdf     (reportlab, --health)
+
+The roll-up is built at the end from the workers' results:
+reports/markets/index.html, rollup.csv and rollup.png.
+
+A market's GA4 numbers come from its own daily history rows, written by
+``ingest_history.py`` (source ``ga4_markets``: GA4 per country, mapped to
+markets by ``utils.markets``). A market without a complete week of them, and
+every source without a market breakdown (Amplitude, Hotjar, Sentry, Shopify
+orders), shows the shop-wide section, marked as such in the roll-up.
+
+Usage:
+    python generate_market_reports.py
+    python generate_market_reports.py --markets allemagne,france --workers 4 --health metrics_report.csv
+"""
+
+import argparse
+import os
+import runpy
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from generate_weekly_report import TPSAnalyticsReporter, read_stored_rows, summarize_ga4_week
+from utils.markets import load_markets, split_markets
+from utils.metrics_join import MetricsJoin
+from utils.period_compare import WINDOW_DAYS
+from utils.process_pool import pool_size, run_in_pool
+from utils.warehouse import MetricsWarehouse
+
+GA4_DAILY_FIELDS = ['sessions', 'totalUsers', 'newUsers', 'screenPageViews', 'transactions', 'totalRevenue']
+ROLLUP_KPIS = ['sessions', 'revenue', 'transactions']
+
+
+def market_sections(report_data: Dict[str, Any], daily: pd.DataFrame, end: datetime) -> Dict[str, Any]:
+    """Shop-wide sections with the GA4 week replaced by the market's own daily history.
+
+    Every section is tagged with its ``_scope``: ``market`` when it holds the
+    market's own numbers, ``shop`` when it is a copy of the shop-wide one.
+    """
+    sections = {name: dict(data, _scope='shop') if isinstance(data, dict) else data
+                for name, data in report_data.items()}
+    if daily.empty or not isinstance(sections.get('ga4'), dict) or sections['ga4'].get('_partial'):
+        return sections
+    days = pd.date_range(end.date() - timedelta(days=WINDOW_DAYS - 1), end.date())
+    ga4 = daily[daily['source'] == 'ga4']
+    week = ga4.pivot_table(index='date', columns='metric', values='value', aggfunc='last')
+    week.index = pd.to_datetime(week.index)
+    week = week.reindex(index=days, columns=GA4_DAILY_FIELDS)
+    if week.notna().all().all():
+        sections['ga4'].update(summarize_ga4_week(week.rename_axis('date').reset_index()), _scope='market')
+    return sections
+
+
+def _render_pdfs(market: str, output_dir: str, metrics_csv: Optional[str], health_csv: Optional[str]) -> List[str]:
+    """Executive summary and business report of one market (skipped without reportlab)."""
+    try:
+        from generate_tps_exec_summary import build_exec
+    except ImportError as e:
+        print(f"⏭️  {market}: PDF reports skipped ({e})")
+        return []
+    files = []
+    if metrics_csv:
+        path = os.path.join(output_dir, 'TPS-Executive-Summary.pdf')
+        build_exec(metrics_csv, path, market)
+        files.append(path)
+    if health_csv:
+        # Script-style report: this worker process is its own, so argv / env are free to set
+        path = os.path.join(output_dir, 'TPS-Business-Report.pdf')
+        os.environ['TPS_MARKET'] = market
+        sys.argv = ['generate_tps_business_report.py', health_csv, path]
+        runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate_tps_business_report.py'),
+                       run_name='__main__')
+        files.append(path)
+    return files
+
+
+def render_market(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker: every output of one market. Never raises; failures come back as ``error``."""
+    market, output_dir, end = job['market'], job['output_dir'], job['end_date']
+    started = time.monotonic()
+    try:
+        reporter = TPSAnalyticsReporter(market=market, output_dir=output_dir, end_date=end)
+        reporter.report_data = job['report_data']
+        reporter.collection_stats = job['collection_stats']
+        reporter.stored = {'daily': job['daily'], 'windows': job['windows']}
+
+        # Already a pool worker: charts render in-process
+        reporter.create_charts(workers=1)
+        insights = reporter.generate_insights_and_recommendations()
+        reporter.create_html_report(insights)
+        reporter.save_data_json(record=False)
+        files = [reporter.output_path(f"weekly-report-{end.strftime('%Y-%m-%d')}.html")]
+
+        metrics_csv = None
+        join = MetricsJoin([job['daily']])
+        if not join.rows.empty:
+            metrics_csv = os.path.join(output_dir, 'metrics_full_report.csv')
+            join.report_rows(join.as_of(), market).to_csv(metrics_csv, index=False)
+            files.append(metrics_csv)
+        files += _render_pdfs(market, output_dir, metrics_csv, job.get('health_csv'))
+
+        ga4 = reporter.report_data.get('ga4') or {}
+        return {
+            'market': market,
+            'scope': ga4.get('_scope', 'shop'),
+            'kpis': {name: ga4.get(name) for name in ROLLUP_KPIS},
+            'insights': len(insights),
+            'critical': sum(1 for i in insights if i.get('priority') == 'Critical'),
+            'files': files,
+            'weekly_rows': reporter.weekly_rows(),
+            'elapsed': round(time.monotonic() - started, 2),
+        }
+    except Exception as e:
+        return {'market': market, 'error': repr(e), 'elapsed': round(time.monotonic() - started, 2)}
+
+
+def build_rollup(results: List[Dict[str, Any]], output_dir: str, end: datetime,
+                 shop_kpis: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Markets side by side plus their total: rollup.csv, rollup.png and index.html.
+
+    Markets whose GA4 section fell back to the shop-wide one (``scope`` =
+    ``shop``) are listed as such and left out of ``total``: summing copies of
+    the shop figures would count the shop once per market. The shop-wide
+    figures get their own ``shop`` row instead.
+    """
+    rows = []
+    for result in results:
+        row = {'market': result['market'], 'scope': result.get('scope', 'shop'), **(result.get('kpis') or {})}
+        row.update(insights=result.get('insights'), critical=result.get('critical'), error=result.get('error', ''))
+        rows.append(row)
+    columns = ['market', 'scope'] + ROLLUP_KPIS + ['insights', 'critical', 'error']
+    rollup = pd.DataFrame(rows, columns=columns)
+    ok = rollup[rollup['error'] == '']
+    own = ok[ok['scope'] == 'market']
+    total = {'market': 'total', 'scope': 'market',
+             **own[ROLLUP_KPIS].apply(pd.to_numeric, errors='coerce').sum(min_count=1).to_dict(),
+             'insights': ok['insights'].sum(), 'critical': ok['critical'].sum(), 'error': ''}
+    extra = [total]
+    if shop_kpis:
+        extra.append({'market': 'shop', 'scope': 'shop', **shop_kpis, 'error': ''})
+    rollup = pd.concat([rollup, pd.DataFrame(extra, columns=columns)], ignore_index=True)
+    rollup['conversion_rate'] = (pd.to_numeric(rollup['transactions'], errors='coerce')
+                                 / pd.to_numeric(rollup['sessions'], errors='coerce')).round(4)
+    rollup.to_csv(os.path.join(output_dir, 'rollup.csv'), index=False)
+
+    fig, axes = plt.subplots(1, 2, figsize=(12, 4))
+    for ax, kpi in zip(axes, ('sessions', 'revenue')):
+        values = pd.to_numeric(own[kpi], errors='coerce').fillna(0)
+        ax.bar(own['market'].str.capitalize(), values, color='#2E86C1')
+        ax.set_title(f"{kpi.capitalize()} (7d) by market")
+        ax.tick_params(axis='x', rotation=30)
+        if own.empty:
+            ax.text(0.5, 0.5, "No market-level GA4 history yet", ha='center', va='center', transform=ax.transAxes)
+    fig.tight_layout()
+    fig.savefig(os.path.join(output_dir, 'rollup.png'), dpi=150)
+    plt.close(fig)
+
+    report_date = end.strftime('%Y-%m-%d')
+    links = {r['market']: f"{r['market']}/weekly-report-{report_date}.html" for r in results if not r.get('error')}
+    table = rollup.assign(market=[f"<a href='{links[m]}'>{m}</a>" if m in links else m for m in rollup['market']])
+    table['scope'] = table['scope'].map({'market': 'market', 'shop': 'shop-wide (no market history)'})
+    table.loc[table.index[len(results):], 'scope'] = ['sum of market-scoped rows', 'whole shop'][:len(extra)]
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f"<html><head><meta charset='utf-8'><title>TPS-STAR markets - {report_date}</title></head><body>"
+                f"<h1>TPS-STAR weekly reports by market</h1><p>Week ending {report_date}</p>"
+                f"<p>Shop-wide rows repeat the whole shop's GA4 figures and are not part of the total.</p>"
+                f"{table.to_html(index=False, escape=False, na_rep='n/a')}"
+                f"<img src='rollup.png' style='max-width:100%' /></body></html>")
+    return rollup
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Per-market TPS-STAR weekly reports, rendered in parallel")
+    parser.add_argument('--markets', help="comma-separated markets (default: TPS_MARKETS or config/markets.json)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--out', default=os.path.join('reports', 'markets'), help="output directory")
+    parser.add_argument('--health', default=None, help="metrics_report.csv for the per-market business PDFs")
+    args = parser.parse_args()
+
+    markets = [m.strip() for m in args.markets.split(',') if m.strip()] if args.markets else load_markets()
+    if not markets:
+        print("❌ No markets configured (config/markets.json or TPS_MARKETS)")
+        return 1
+
+    started = time.monotonic()
+    reporter = TPSAnalyticsReporter()
+    end = reporter.end_date
+    print(f"🌍 Market reports for {', '.join(markets)} — week ending {end.strftime('%Y-%m-%d')}")
+
+    # Fetch once: provider sections and the stored history of every market
+    report_data = reporter.collect_sources({
+        'ga4': reporter.fetch_ga4_data,
+        'amplitude': reporter.fetch_amplitude_data,
+        'hotjar': reporter.fetch_hotjar_data,
+        'sentry': reporter.fetch_sentry_data,
+    })
+    daily, windows = read_stored_rows(end, end)
+    daily_by_market, windows_by_market = split_markets(daily, markets), split_markets(windows, markets)
+
+    jobs = [{
+        'market': market,
+        'output_dir': os.path.join(args.out, market),
+        'end_date': end,
+        'report_data': market_sections(report_data, daily_by_market[market], end),
+        'collection_stats': reporter.collection_stats,
+        'daily': daily_by_market[market],
+        'windows': windows_by_market[market],
+        'health_csv': os.path.abspath(args.health) if args.health else None,
+    } for market in markets]
+
+    workers = pool_size(len(jobs), args.workers)
+    print(f"⚙️  Rendering {len(jobs)} market(s) on {workers} worker(s)...")
+    results = run_in_pool(render_market, jobs, workers=workers)
+
+    for result in results:
+        if result.get('error'):
+            print(f"❌ {result['market']}: {result['error']}")
+        else:
+            print(f"✅ {result['market']}: {len(result['files'])} file(s) in {result['elapsed']}s")
+
+    # One warehouse write for every market (workers never write concurrently)
+    weekly = [r['weekly_rows'] for r in results if r.get('weekly_rows') is not None]
+    if weekly:
+        MetricsWarehouse().write(pd.concat(weekly, ignore_index=True))
+
+    ga4 = report_data.get('ga4') or {}
+    shop_kpis = {name: ga4.get(name) for name in ROLLUP_KPIS} if not ga4.get('_partial') else None
+    build_rollup(results, args.out, end, shop_kpis)
+    print(f"📦 Roll-up → {os.path.join(args.out, 'index.html')} ({time.monotonic() - started:.1f}s total)")
+    return 1 if any(r.get('error') for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
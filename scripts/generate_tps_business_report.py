@@ -14,11 +14,16 @@ from reportlab.platypus import (
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.pdfgen.canvas import Canvas
 
+from utils.insight_rules import InsightRules, health_rows
+from utils.period_compare import PeriodComparison, format_pct
+from utils.warehouse import DEFAULT_MARKET, MetricsWarehouse
+
 # ---------------------------------------------------
 # Entrées
 # ---------------------------------------------------
 csv_input = sys.argv[1]       # metrics_report.csv
 pdf_output = sys.argv[2]      # ex: TPS-Executive-Business-Report.pdf
+market = os.getenv("TPS_MARKET") or DEFAULT_MARKET   # marché storefront (config/markets.json)
 
 df_health = pd.read_csv(csv_input)
 
@@ -49,7 +54,7 @@ def footer(canvas: Canvas, doc):
 doc = SimpleDocTemplate(
     pdf_output,
     pagesize=A4,
-    title="TPS Executive Business Report",
+    title="TPS Executive Business Report" + (f" — {market}" if market != DEFAULT_MARKET else ""),
     author="The Pet Society Paris",
 )
 
@@ -66,9 +71,17 @@ def section(title: str):
 
 def load_optional_metrics_csv(filename: str):
     """
-    Charge un CSV optionnel de type metric/value.
+    Charge les métriques d'une source : d'abord l'entrepôt (utils/warehouse.py),
+    sinon un CSV optionnel de type metric/value.
     Retourne un dict {metric: value} ou {} si absent/incompatible.
     """
+    source = os.path.basename(filename).replace("_metrics.csv", "")
+    try:
+        stored = MetricsWarehouse().labelled(source, market=market)
+    except Exception:
+        stored = {}
+    if stored:
+        return stored
     if not os.path.exists(filename):
         return {}
     try:
@@ -82,6 +95,43 @@ def load_optional_metrics_csv(filename: str):
         return {}
 
 
+def load_period_comparison():
+    """
+    Variations semaine / mois / année de toutes les métriques historisées
+    (utils/period_compare.py). Retourne None si l'entrepôt est illisible.
+    """
+    try:
+        return PeriodComparison.from_warehouse(markets=[market])
+    except Exception:
+        return None
+
+
+def load_rule_hits(df):
+    """
+    Règles d'analyse déclaratives (insight_rules.json) : santé des services du
+    jour, puis tendances de l'historique (au dernier jour disponible).
+    DataFrame vide si les règles sont indisponibles.
+    """
+    try:
+        rules = InsightRules.from_file()
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Règles d'analyse indisponibles : {e}")
+        return pd.DataFrame()
+    hits = [rules.evaluate(health_rows(df), report="business")]
+    try:
+        daily, windows = rules.read_inputs(markets=[market])
+        hits.append(rules.evaluate(daily, windows, markets=[market], report="business"))
+    except Exception as e:
+        print(f"⚠️  Historique indisponible pour les règles d'analyse : {e}")
+    hits = [h for h in hits if not h.empty]
+    return pd.concat(hits, ignore_index=True) if hits else pd.DataFrame()
+
+
+def kpi_row(label: str, metrics: dict, deltas: dict, key: str):
+    """Ligne KPI : libellé, valeur, variation vs S-1."""
+    return [label, metrics.get(key, "N/A"), format_pct(deltas.get(key))]
+
+
 def build_kpi_table(rows):
     """Construit un tableau simple KPI à deux colonnes."""
     table = Table(rows, hAlign="LEFT")
@@ -131,10 +181,15 @@ gsc_metrics     = load_optional_metrics_csv(os.path.join(base_dir, "gsc_metrics.
 ahrefs_metrics  = load_optional_metrics_csv(os.path.join(base_dir, "ahrefs_metrics.csv"))
 social_metrics  = load_optional_metrics_csv(os.path.join(base_dir, "social_metrics.csv"))
 
+period_comparison = load_period_comparison()
+shopify_deltas = period_comparison.labelled("shopify", market=market) if period_comparison else {}
+ga4_deltas     = period_comparison.labelled("ga4", market=market) if period_comparison else {}
+rule_hits = load_rule_hits(df_health)
+
 # ---------------------------------------------------
 # SECTION 1 — EXECUTIVE SUMMARY
 # ---------------------------------------------------
-section("📌 Executive Summary")
+section("📌 Executive Summary" + (f" — {market.capitalize()}" if market != DEFAULT_MARKET else ""))
 
 ok_count = (df_health["Status"] == "OK").sum()
 total = len(df_health)
@@ -196,20 +251,20 @@ elements.append(PageBreak())
 # ---------------------------------------------------
 section("📈 Business Revenue")
 
-business_rows = [["KPI", "Valeur"]]
+business_rows = [["KPI", "Valeur", "vs S-1"]]
 
 # Shopify
-business_rows.append(["Conversions Shopify (7j)", shopify_metrics.get("Conversions (7d)", "N/A")])
-business_rows.append(["Chiffre d'affaires (7j)", shopify_metrics.get("Revenue (7d)", "N/A")])
-business_rows.append(["Panier moyen (7j)", shopify_metrics.get("AOV (7d)", "N/A")])
+business_rows.append(kpi_row("Conversions Shopify (7j)", shopify_metrics, shopify_deltas, "Conversions (7d)"))
+business_rows.append(kpi_row("Chiffre d'affaires (7j)", shopify_metrics, shopify_deltas, "Revenue (7d)"))
+business_rows.append(kpi_row("Panier moyen (7j)", shopify_metrics, shopify_deltas, "AOV (7d)"))
 
 # GA4
-business_rows.append(["Sessions (7j)", ga4_metrics.get("Sessions (7d)", "N/A")])
-business_rows.append(["Taux conversion Analytics (7j)", ga4_metrics.get("ConvRate (7d)", "N/A")])
+business_rows.append(kpi_row("Sessions (7j)", ga4_metrics, ga4_deltas, "Sessions (7d)"))
+business_rows.append(kpi_row("Taux conversion Analytics (7j)", ga4_metrics, ga4_deltas, "ConvRate (7d)"))
 
 # Meta
-business_rows.append(["ROAS Meta (7j)", meta_metrics.get("ROAS (7d)", "N/A")])
-business_rows.append(["Budget Meta (7j)", meta_metrics.get("Spend (7d)", "N/A")])
+business_rows.append(kpi_row("ROAS Meta (7j)", meta_metrics, {}, "ROAS (7d)"))
+business_rows.append(kpi_row("Budget Meta (7j)", meta_metrics, {}, "Spend (7d)"))
 
 business_table = build_kpi_table(business_rows)
 elements.append(business_table)
@@ -282,31 +337,7 @@ elements.append(PageBreak())
 # ---------------------------------------------------
 section("🔍 Analyse Croisée (Business / Tech / SEO / Data)")
 
-analysis_lines = []
-
-if score == 100:
-    analysis_lines.append("• L’ensemble des services monitorés est actuellement opérationnel (100% OK).")
-elif score >= 80:
-    analysis_lines.append("• La majorité des services est opérationnelle. Quelques intégrations sont à surveiller.")
-else:
-    analysis_lines.append("• Plusieurs services clés présentent des anomalies. Il est recommandé de prioriser la remédiation.")
-
-if "SHOPIFY_API_KEY" in df_health["Service"].values:
-    shopify_status = df_health.loc[df_health["Service"] == "SHOPIFY_API_KEY", "Status"].iloc[0]
-    if shopify_status != "OK":
-        analysis_lines.append("• Shopify API Key n’est pas en statut OK → risque direct sur l’accès aux données business.")
-if "GA4_TOKEN" in df_health["Service"].values:
-    ga4_status = df_health.loc[df_health["Service"] == "GA4_TOKEN", "Status"].iloc[0]
-    if ga4_status != "OK":
-        analysis_lines.append("• GA4 Token invalide ou manquant → les analyses Analytics ne seront pas complètes.")
-if "META_TOKEN" in df_health["Service"].values:
-    meta_status = df_health.loc[df_health["Service"] == "META_TOKEN", "Status"].iloc[0]
-    if meta_status != "OK":
-        analysis_lines.append("• Meta Token à corriger → impact sur Meta Ads & Pixel Debugging.")
-if "GSC_CREDENTIALS" in df_health["Service"].values:
-    gsc_status = df_health.loc[df_health["Service"] == "GSC_CREDENTIALS", "Status"].iloc[0]
-    if gsc_status != "OK":
-        analysis_lines.append("• GSC Credentials non valides → pas de vision SEO Search Console fiable.")
+analysis_lines = [f"• {hit['insight']}" for _, hit in rule_hits.iterrows()] if not rule_hits.empty else []
 
 if not analysis_lines:
     analysis_lines.append(
@@ -323,7 +354,13 @@ elements.append(PageBreak())
 # ---------------------------------------------------
 section("⭐ Recommandations Actionnables")
 
-recos = """
+priorities = ""
+if not rule_hits.empty:
+    urgent = rule_hits[rule_hits["severity"].isin(["critical", "high"])]["recommendation"].drop_duplicates()
+    if not urgent.empty:
+        priorities = "<b>Priorités détectées :</b><br/>" + "".join(f"• {r}<br/>" for r in urgent) + "<br/>"
+
+recos = priorities + """
 <b>À 48 heures :</b><br/>
 • Vérifier et corriger les secrets en statut MISSING / INVALID (Shopify, GA4, Meta, GSC, Slack, SMTP…).<br/>
 • S’assurer que GTM, GA4 et Pixel Meta remontent correctement les évènements clés (page_view, view_item, add_to_cart, purchase).<br/><br/>
@@ -55,7 +55,7 @@ def get_metric(df, source, name):
         return str(sub["value"].iloc[0])
 
 
-def build_exec(input_csv, output_pdf):
+def build_exec(input_csv, output_pdf, market=None):
     df = pd.read_csv(input_csv)
     styles = make_styles()
 
@@ -81,7 +81,10 @@ def build_exec(input_csv, output_pdf):
     except Exception:
         pass
 
-    story.append(Paragraph("THE PET SOCIETY — Executive Summary (7 jours)", styles["TitleTPS"]))
+    title = "THE PET SOCIETY — Executive Summary (7 jours)"
+    if market:
+        title += f" — {market.capitalize()}"
+    story.append(Paragraph(title, styles["TitleTPS"]))
     story.append(Spacer(1, 0.7*cm))
 
     # KPI grid
@@ -127,10 +130,10 @@ def build_exec(input_csv, output_pdf):
 
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: generate_tps_exec_summary.py <metrics_full_report.csv> <output.pdf>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: generate_tps_exec_summary.py <metrics_full_report.csv> <output.pdf> [market]")
         sys.exit(1)
-    build_exec(sys.argv[1], sys.argv[2])
+    build_exec(sys.argv[1], sys.argv[2], *sys.argv[3:])
 
 
 if __name__ == "__main__":
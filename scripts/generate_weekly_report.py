@@ -31,6 +31,9 @@ import base64
 from pathlib import Path
 import requests
 import warnings
+import queue
+import threading
+import time
 
 # Optional visualization libs
 try:
@@ -39,16 +42,7 @@ try:
 except Exception:
     sns = None
     _HAS_SEABORN = False
-try:
-    import plotly.graph_objects as go
-    import plotly.express as px
-    from plotly.subplots import make_subplots
-    _HAS_PLOTLY = True
-except Exception:
-    go = None
-    px = None
-    make_subplots = None
-    _HAS_PLOTLY = False
+# Plotly is optional too: utils/chart_spec.py falls back to matplotlib without it
 
 warnings.filterwarnings('ignore')
 
@@ -62,7 +56,19 @@ if _HAS_SEABORN:
 else:
     plt.style.use('default')
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Callable, Optional
+
+from utils.anomalies import AnomalyDetector, daily_matrix, describe, detect_anomalies
+from utils.chart_pool import chart_job, render_charts
+from utils.chart_spec import chart_spec, panel, render_spec, series
+from utils.clarity_snapshots import clarity_week
+from utils.ga4_data import GA4DataClient
+from utils.history import HistoryStore
+from utils.insight_rules import InsightRules
+from utils.oauth_tokens import TokenRefreshError, get_ga4_access_token, has_ga4_credentials
+from utils.period_compare import HISTORY_DAYS, WEEKS, WINDOW_DAYS, PeriodComparison, compare_series, format_pct
+from utils.warehouse import DEFAULT_MARKET, WEEK_WINDOW, MetricsWarehouse, to_long
+from utils.sentry_issues import collect_sentry_errors, fold_issue_series
 
 
 def _save_delivery_response(payload: dict):
@@ -164,20 +170,25 @@ def fetch_ahrefs():
     return sample_timeseries(days=14, base=40, noise=0.2)
 
 
-def analyze_series(s: pd.Series, name: str):
+def analyze_series(s: pd.Series, name: str, anomalies: Optional[pd.DataFrame] = None):
     latest = int(s.iloc[-1])
-    prev = int(s.iloc[-2]) if len(s) > 1 else latest
-    delta = latest - prev
-    pct = (delta / prev * 100) if prev != 0 else 0
-    trend = 'up' if delta > 0 else ('down' if delta < 0 else 'stable')
-    analysis = f"Latest: {latest}. Change vs previous: {delta} ({pct:.1f}%). Trend: {trend}."
+    # Same week-over-week / same-weekday deltas as the HTML report and the dashboard
+    deltas = compare_series(s, name)
+    week = deltas.get('value', np.nan)
+    wow = deltas.get('wow_pct', np.nan)
+    trend = 'up' if wow > 0 else ('down' if wow < 0 else 'stable')
+    week_text = f"{week:,.0f}" if np.isfinite(week) else 'n/a'
+    analysis = (f"Latest: {latest} ({format_pct(deltas.get('same_weekday_pct'))} vs same weekday). "
+                f"Last 7 days: {week_text} ({format_pct(wow)} vs previous 7 days). Trend: {trend}.")
+    # Critical = a high or critical anomaly this week (utils/anomalies.py)
     critical = False
-    # simple critical rules (examples)
-    if name == 'Sentry (Error Tracking)' and latest > 100:
-        critical = True
-    if name == 'Cloudflare (Performance/Security)' and latest < 500:
-        # assume this metric is throughput; arbitrary threshold
-        critical = False
+    if anomalies is not None and not anomalies.empty:
+        flagged = anomalies[anomalies['series'] == name]
+        if not flagged.empty:
+            top = flagged.iloc[0]
+            analysis += (f" Anomaly: {top['direction']} on {pd.Timestamp(top['date']):%Y-%m-%d} "
+                         f"(score {top['score']:.1f}, {top['severity']}).")
+            critical = top['severity'] in ('high', 'critical')
     return analysis, critical
 
 
@@ -189,6 +200,39 @@ def plot_series(ax, s: pd.Series, title: str, ylabel: str = ''):
     ax.margins(y=0.15)
 
 
+MAX_PDF_ANOMALIES = 8
+
+
+def tracker_page(name: str, ylabel: str, series: pd.Series, anomalies: Optional[pd.DataFrame] = None):
+    """One tracker page of the PDF (chart-pool job): ``(figure, analysis, critical)``."""
+    fig, ax = plt.subplots(figsize=(11.7, 10))
+    plot_series(ax, series, name, ylabel)
+    # analysis
+    analysis, critical = analyze_series(series, name, anomalies)
+    text = f"\nAnalysis:\n{analysis}\n\nSuggested next steps:\n"
+    # heuristic suggestions
+    if name.startswith('Sentry'):
+        text += "- Investigate recent error spikes, attach stack traces, assign to owner.\n- Add rate-limiting or retry logic where appropriate."
+    elif name.startswith('Cloudflare'):
+        text += "- Verify cache hit ratio; review firewall rules for false positives.\n- Monitor latency and DDoS alerts."
+    elif name.startswith('Meta'):
+        text += "- Review recent campaign changes; verify pixel events and dedupe.\n- Validate audiences and compare organic vs paid."
+    elif 'Search Console' in name:
+        text += "- Inspect queries with dropping impressions; check indexing issues.\n- Compare top pages vs Ahrefs backlinks."
+    elif 'Google Analytics' in name:
+        text += "- Verify session attribution changes; check GA4 events mapping.\n- Validate conversions and funnel steps."
+    elif 'Ahrefs' in name:
+        text += "- Account plan insufficient for v3 Site Explorer if you see errors.\n- Review backlinks/ref-domains and prioritize high-authority links."
+
+    fig.text(0.1, 0.05, text,
+             fontsize=10,
+             wrap=True,
+             verticalalignment='bottom',
+             bbox=dict(boxstyle="round,pad=0.5", facecolor="lightgray", alpha=0.8))
+    fig.subplots_adjust(bottom=0.35, top=0.92)
+    return fig, analysis, critical
+
+
 def build_pdf(out_path: str):
     # Collect data
     sentry = fetch_sentry_errors()
@@ -207,6 +251,19 @@ def build_pdf(out_path: str):
         ("Ahrefs (SEO)", "Estimated organic visits / day", ahrefs),
     ]
 
+    # Score every section's series at once, plus the stored daily history
+    matrix = pd.concat({name: series for name, _, series in sections}, axis=1).asfreq('D')
+    section_anomalies = AnomalyDetector().detect(matrix)
+    try:
+        stored_anomalies = detect_anomalies()
+    except Exception as e:
+        print("Warning: stored-history anomaly scan failed:", e)
+        stored_anomalies = pd.DataFrame()
+
+    # Tracker pages are independent: build them in the chart pool, place them in section order
+    pages = render_charts([chart_job(name, tracker_page, name, ylabel, series, section_anomalies)
+                           for name, ylabel, series in sections])
+
     with PdfPages(out_path) as pdf:
         # Cover page
         fig = plt.figure(figsize=(11.7, 10))
@@ -222,37 +279,16 @@ def build_pdf(out_path: str):
         critical_points = []
 
         # One section per tracker
-        for name, ylabel, series in sections:
-            fig, ax = plt.subplots(figsize=(11.7, 10))
-            plot_series(ax, series, name, ylabel)
-            # analysis
-            analysis, critical = analyze_series(series, name)
-            text = f"\nAnalysis:\n{analysis}\n\nSuggested next steps:\n"
-            # heuristic suggestions
-            if name.startswith('Sentry'):
-                text += "- Investigate recent error spikes, attach stack traces, assign to owner.\n- Add rate-limiting or retry logic where appropriate."
-            elif name.startswith('Cloudflare'):
-                text += "- Verify cache hit ratio; review firewall rules for false positives.\n- Monitor latency and DDoS alerts."
-            elif name.startswith('Meta'):
-                text += "- Review recent campaign changes; verify pixel events and dedupe.\n- Validate audiences and compare organic vs paid."
-            elif 'Search Console' in name:
-                text += "- Inspect queries with dropping impressions; check indexing issues.\n- Compare top pages vs Ahrefs backlinks."
-            elif 'Google Analytics' in name:
-                text += "- Verify session attribution changes; check GA4 events mapping.\n- Validate conversions and funnel steps."
-            elif 'Ahrefs' in name:
-                text += "- Account plan insufficient for v3 Site Explorer if you see errors.\n- Review backlinks/ref-domains and prioritize high-authority links."
-
-            plt.figtext(0.1, 0.05, text,
-                        fontsize=10,
-                        wrap=True,
-                        verticalalignment='bottom',
-                        bbox=dict(boxstyle="round,pad=0.5", facecolor="lightgray", alpha=0.8))
-            plt.subplots_adjust(bottom=0.35, top=0.92)
-            pdf.savefig()
-            plt.close()
+        for page in pages:
+            if page.get('error'):
+                print(f"Warning: {page['name']} page failed:", page['error'])
+                continue
+            fig, analysis, critical = page['output']
+            pdf.savefig(fig)
+            plt.close(fig)
 
             if critical:
-                critical_points.append((name, analysis))
+                critical_points.append((page['name'], analysis))
 
         # Conclusion page
         plt.figure(figsize=(11.7, 10))
@@ -269,6 +305,15 @@ def build_pdf(out_path: str):
             plt.text(0.02, y, "No critical alerts detected this week.", fontsize=12)
             y -= 0.04
 
+        # Ranked anomalies across the stored history (most severe first)
+        if not stored_anomalies.empty:
+            plt.text(0.02, y, "Anomalies in stored metrics:", fontsize=12, color='darkorange')
+            y -= 0.04
+            for _, anomaly in stored_anomalies.head(MAX_PDF_ANOMALIES).iterrows():
+                plt.text(0.04, y, f"- {describe(anomaly)}", fontsize=9)
+                y -= 0.03
+            y -= 0.01
+
         strategy = (
             "Recommended strategy:\n"
             "1) Prioritize fixing critical errors (Sentry).\n"
@@ -509,18 +554,259 @@ def main():
 # Disabled duplicate procedural entrypoint. Use the class-based
 # TPSAnalyticsReporter at the end of this file as the single entrypoint.
 
+# Collection deadlines (seconds). Each source gets its own budget and the whole
+# stage is capped so a dead provider cannot stall the weekly run.
+SOURCE_TIMEOUTS = {
+    'ga4': 45.0,
+    'amplitude': 45.0,
+    'hotjar': 30.0,
+    'sentry': 30.0,
+}
+COLLECTION_STAGE_TIMEOUT = float(os.getenv('COLLECTION_STAGE_TIMEOUT', '60'))
+
+MAX_ANOMALY_INSIGHTS = 5
+ANOMALY_RECOMMENDATIONS = {
+    'spike': "Check releases, campaigns and bot traffic around that day before treating the jump as growth.",
+    'drop': "Verify tracking and integrations for that day, then look for outages or stock-outs.",
+}
+
+
+def read_stored_rows(start: datetime, end: datetime, warehouse: MetricsWarehouse = None):
+    """Daily rows and 7-day window rows of every market whose comparisons fall in ``[start, end]``.
+
+    Reads a year of history before ``start`` (YoY) so any report week in the
+    range can be computed from the returned rows alone.
+    """
+    warehouse = warehouse or MetricsWarehouse()
+    first = start - timedelta(days=HISTORY_DAYS + WEEKS * WINDOW_DAYS)
+    columns = ['date', 'source', 'market', 'metric', 'value']
+    daily = warehouse.read(start=first, end=end, dimensions='', columns=columns)
+    windows = warehouse.read(start=first, end=end, dimensions=WEEK_WINDOW, columns=columns)
+    return daily, windows
+
+
+def summarize_ga4_week(week: pd.DataFrame) -> Dict[str, Any]:
+    """GA4 section fields from a week of daily rows (one column per GA4 metric)."""
+    week = week.sort_values('date')
+    sessions = float(week['sessions'].sum())
+    users = float(week['totalUsers'].sum())
+    transactions = float(week['transactions'].sum())
+    return {
+        'sessions': int(sessions),
+        'pageviews': int(week['screenPageViews'].sum()),
+        'transactions': int(transactions),
+        'revenue': round(float(week['totalRevenue'].sum()), 2),
+        'conversion_rate': round(transactions / sessions, 4) if sessions else 0.0,
+        'new_users_percentage': round(float(week['newUsers'].sum()) / users, 3) if users else 0.0,
+        'daily_sessions': week['sessions'].astype(int).tolist(),
+    }
+
+
 class TPSAnalyticsReporter:
-    def __init__(self):
+    def __init__(self, market: Optional[str] = None, output_dir: Optional[str] = None,
+                 end_date: Optional[datetime] = None):
         self.week_offset = int(os.getenv('WEEK_OFFSET', '0'))
-        self.end_date = datetime.now() - timedelta(days=self.week_offset * 7)
+        self.end_date = end_date or datetime.now() - timedelta(days=self.week_offset * 7)
         self.start_date = self.end_date - timedelta(days=7)
+        self.market = market or os.getenv('TPS_MARKET') or DEFAULT_MARKET
+        self.output_dir = output_dir or 'reports'
 
         # Create output directories
-        os.makedirs('reports', exist_ok=True)
-        os.makedirs('reports/charts', exist_ok=True)
-        os.makedirs('reports/data', exist_ok=True)
+        os.makedirs(self.output_path(), exist_ok=True)
+        os.makedirs(self.output_path('charts'), exist_ok=True)
+        os.makedirs(self.output_path('data'), exist_ok=True)
 
         self.report_data = {}
+        self.collection_stats = {}
+        # Stored rows handed in by a fan-out / backfill parent ({'daily': ..., 'windows': ...});
+        # None reads the warehouse directly
+        self.stored: Optional[Dict[str, pd.DataFrame]] = None
+        # Provider data a backfill parent fetched once for many weeks:
+        # 'ga4' -> daily GA4 rows, 'sentry' -> (issues, series) of SentryIssueCollector.collect_series
+        self.prefetched: Dict[str, Any] = {}
+        self._comparison = None
+
+    def output_path(self, *parts: str) -> str:
+        return os.path.join(self.output_dir, *parts)
+
+    def _source_timeout(self, name: str) -> float:
+        """Per-source deadline, overridable with COLLECT_TIMEOUT_<SOURCE>."""
+        override = os.getenv(f'COLLECT_TIMEOUT_{name.upper()}')
+        if override:
+            try:
+                return float(override)
+            except ValueError:
+                pass
+        return SOURCE_TIMEOUTS.get(name, 30.0)
+
+    def collect_sources(self, fetchers: Dict[str, Callable[[], Dict[str, Any]]],
+                        stage_timeout: float = None) -> Dict[str, Dict[str, Any]]:
+        """Run all fetchers concurrently and return one section per source.
+
+        Every fetcher runs in its own daemon thread so a hung provider never
+        blocks the run (or interpreter exit). A source that raises or misses
+        its deadline yields a section marked ``_partial`` with the reason; the
+        stage as a whole never takes longer than ``stage_timeout``.
+        """
+        if stage_timeout is None:
+            stage_timeout = COLLECTION_STAGE_TIMEOUT
+
+        results: "queue.Queue" = queue.Queue()
+
+        def _worker(name, fn):
+            t0 = time.monotonic()
+            try:
+                payload = fn()
+                results.put((name, True, payload, time.monotonic() - t0))
+            except Exception as e:
+                results.put((name, False, repr(e), time.monotonic() - t0))
+
+        started = time.monotonic()
+        stage_deadline = started + stage_timeout
+        deadlines = {}
+        for name, fn in fetchers.items():
+            deadlines[name] = min(started + self._source_timeout(name), stage_deadline)
+            threading.Thread(target=_worker, args=(name, fn),
+                             name=f'collect-{name}', daemon=True).start()
+
+        sections: Dict[str, Dict[str, Any]] = {}
+        stats: Dict[str, Dict[str, Any]] = {}
+        pending = set(fetchers)
+        while pending:
+            wait_for = min(deadlines[n] for n in pending) - time.monotonic()
+            try:
+                name, ok, payload, elapsed = results.get(timeout=max(0.0, wait_for))
+            except queue.Empty:
+                now = time.monotonic()
+                for name in [n for n in pending if deadlines[n] <= now]:
+                    pending.discard(name)
+                    reason = f'timed out after {now - started:.1f}s'
+                    print(f"⏱️  {name}: {reason}; section marked partial")
+                    sections[name] = {'_partial': True, '_reason': reason}
+                    stats[name] = {'status': 'timeout', 'elapsed': round(now - started, 3)}
+                continue
+            if name not in pending:
+                # Late result for a source already marked partial.
+                continue
+            pending.discard(name)
+            if ok and isinstance(payload, dict):
+                sections[name] = payload
+                stats[name] = {'status': 'ok', 'elapsed': round(elapsed, 3)}
+            else:
+                print(f"⚠️  {name}: fetch failed ({payload}); section marked partial")
+                sections[name] = {'_partial': True, '_reason': str(payload)}
+                stats[name] = {'status': 'error', 'elapsed': round(elapsed, 3)}
+
+        total = time.monotonic() - started
+        stats['_stage'] = {'elapsed': round(total, 3),
+                           'partial': sorted(n for n, v in sections.items() if v.get('_partial'))}
+        timings = ', '.join(f"{n}={v['elapsed']}s" for n, v in stats.items() if n != '_stage')
+        print(f"⏲️  Collection stage finished in {total:.2f}s ({timings})")
+        self.collection_stats = stats
+        return sections
+
+    def is_partial(self, source: str) -> bool:
+        """True when a source's section is missing or was marked partial."""
+        section = self.report_data.get(source)
+        return not section or bool(section.get('_partial'))
+
+    def period_comparison(self) -> Optional[PeriodComparison]:
+        """WoW / MoM / YoY deltas of every stored metric as of the report's end date."""
+        if self._comparison is None:
+            try:
+                if self.stored is not None:
+                    self._comparison = PeriodComparison(self.stored['daily'], self.stored['windows'],
+                                                        as_of=self.end_date.date())
+                else:
+                    self._comparison = PeriodComparison.from_warehouse(as_of=self.end_date)
+            except Exception as e:
+                print(f"⚠️  Period comparisons unavailable: {e}")
+        return self._comparison
+
+    def stored_anomalies(self) -> pd.DataFrame:
+        """Ranked anomalies of the stored daily series over the report week."""
+        try:
+            if self.stored is not None:
+                daily = self.stored['daily']
+                if daily.empty:
+                    return pd.DataFrame()
+                return AnomalyDetector().detect(daily_matrix(daily, self.end_date.date()))
+            anomalies = detect_anomalies(as_of=self.end_date)
+            if self.market != DEFAULT_MARKET and not anomalies.empty:
+                anomalies = anomalies[anomalies['market'] == self.market].reset_index(drop=True)
+            return anomalies
+        except Exception as e:
+            print(f"⚠️  Anomaly scan unavailable: {e}")
+            return pd.DataFrame()
+
+    def complete_sections(self) -> Dict[str, Dict[str, Any]]:
+        """Collected sections that are not partial."""
+        return {name: data for name, data in self.report_data.items()
+                if isinstance(data, dict) and not data.get('_partial')}
+
+    def rule_insights(self) -> List[Dict[str, str]]:
+        """Insights of the declarative rules over this week's sections and the stored history."""
+        try:
+            rules = InsightRules.from_file()
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Insight rules unavailable: {e}")
+            return []
+        current = to_long('weekly', self.end_date, self.complete_sections(), market=self.market)
+        current = current[current['dimensions'] == '']
+        try:
+            if self.stored is not None:
+                daily, windows = self.stored['daily'], self.stored['windows']
+            else:
+                daily, windows = rules.read_inputs(as_of=self.end_date, markets=[self.market])
+        except Exception as e:
+            print(f"⚠️  Stored history unavailable for insight rules: {e}")
+            daily, windows = None, None
+        # This week's sections come last, so they win over a stored copy of the same week
+        windows = pd.concat([w for w in (windows, current) if w is not None and not w.empty], ignore_index=True)
+        hits = rules.evaluate(daily, windows, as_of=self.end_date, report='weekly')
+        return rules.insights(hits)
+
+    def ga4_history_overlay(self) -> Optional[Dict[str, Any]]:
+        """Additive GA4 metrics for the report week, read from the local history.
+
+        Closed days come from the history kept by ``scripts/ingest_history.py``;
+        only days after the ``ga4`` watermark (usually just the open tail of
+        the current week) are requested from the API. Returns None when the
+        week cannot be covered: fewer than 7 distinct days, from either side.
+        """
+        week_start = (self.end_date - timedelta(days=6)).date()
+        week_end = self.end_date.date()
+        week_days = (week_end - week_start).days + 1
+        if 'ga4' in self.prefetched:
+            days = self.prefetched['ga4']
+            week = days[(days['date'] >= week_start.isoformat()) & (days['date'] <= week_end.isoformat())]
+            if week['date'].nunique() < week_days:
+                return None
+            return {**summarize_ga4_week(week), 'history_days': len(week)}
+        stored, missing = HistoryStore().split('ga4', week_start, week_end)
+
+        frames = [stored]
+        if missing:
+            property_id = os.getenv('GA4_PROPERTY_ID')
+            if not property_id or not has_ga4_credentials():
+                return None
+            client = GA4DataClient(property_id, get_ga4_access_token)
+            try:
+                frames.append(client.fetch_daily(*missing, fill=False))
+            except (requests.RequestException, TokenRefreshError, ValueError) as e:
+                print(f"⚠️  GA4: {missing[0]} → {missing[1]} not fetched ({e}); keeping the section as is")
+                return None
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            return None
+        week = pd.concat(frames, ignore_index=True)
+        if week['date'].astype(str).str[:10].nunique() < week_days:
+            # A gap in the history, or a day GA4 returned no row for (not processed yet)
+            return None
+
+        print(f"🗄️  GA4: {len(stored)} day(s) from local history, "
+              f"{(missing[1] - missing[0]).days + 1 if missing else 0} fetched")
+        return {**summarize_ga4_week(week), 'history_days': len(stored)}
 
     def fetch_ga4_data(self) -> Dict[str, Any]:
         """Fetch Google Analytics 4 data"""
@@ -558,6 +844,11 @@ class TPSAnalyticsReporter:
             ]
         }
 
+        # Real day-level numbers when the history (plus a small delta) covers the week
+        overlay = self.ga4_history_overlay()
+        if overlay:
+            ga4_data.update(overlay)
+
         return ga4_data
 
     def fetch_amplitude_data(self) -> Dict[str, Any]:
@@ -619,6 +910,12 @@ class TPSAnalyticsReporter:
             ]
         }
 
+        # Clarity snapshots kept by ingest_history.py (reading them costs no quota)
+        clarity = clarity_week((self.end_date - timedelta(days=6)).date(), self.end_date.date())
+        if clarity:
+            hotjar_data['clarity'] = clarity
+            hotjar_data['rage_clicks'] = clarity['rage_clicks']
+
         return hotjar_data
 
     def fetch_sentry_data(self) -> Dict[str, Any]:
@@ -644,508 +941,131 @@ class TPSAnalyticsReporter:
             }
         }
 
+        org, project, token = os.getenv('SENTRY_ORG'), os.getenv('SENTRY_PROJECT'), os.getenv('SENTRY_AUTH_TOKEN')
+        if 'sentry' in self.prefetched:
+            issues, series = self.prefetched['sentry']
+            sentry_data.update(fold_issue_series(issues, series, self.start_date, self.end_date))
+        elif org and project and token:
+            # Real issue counts for the report week (paginated, fetched concurrently)
+            sentry_data.update(collect_sentry_errors(org, project, token, self.start_date, self.end_date))
+
         return sentry_data
 
-    def create_kpi_overview_chart(self):
+    def kpi_overview_spec(self) -> Dict[str, Any]:
+        """KPI overview dashboard, as a backend-neutral chart spec"""
+        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+        ga4 = self.report_data['ga4']
+        amplitude = self.report_data['amplitude']
+        funnel = amplitude['conversion_funnel']
+        retention = amplitude['user_retention']
+
+        # Revenue growth (mock week-over-week)
+        revenue_data = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
+        error_rates = [np.random.uniform(0.01, 0.05) for _ in range(7)]
+
+        return chart_spec('kpi_dashboard', "🎯 TPS-STAR Weekly KPI Dashboard", [
+            panel('Sessions Trend', series('line', x=days, y=ga4['daily_sessions'], name='Sessions',
+                                           color='#2E86C1', width=3)),
+            panel('Revenue Growth', series('bar', x=days, y=revenue_data, name='Revenue (€)', color='#28B463')),
+            panel('Conversion Funnel', series('funnel', labels=list(funnel.keys()), values=list(funnel.values()),
+                                              colors=['#3498DB', '#E74C3C', '#F39C12', '#27AE60'])),
+            panel('Traffic Sources', series('pie', labels=list(ga4['traffic_sources'].keys()),
+                                            values=list(ga4['traffic_sources'].values()), name='Traffic Sources',
+                                            colors=['#3498DB', '#E74C3C', '#F39C12', '#27AE60', '#9B59B6', '#E67E22'])),
+            panel('User Retention', series('bar', x=list(retention.keys()), y=list(retention.values()),
+                                           name='Retention Rate', color='#8E44AD')),
+            panel('Error Rate', series('line', x=days, y=error_rates, name='Error Rate', color='#E74C3C')),
+        ], rows=2, cols=3, width=1400, height=800, font_size=12)
+
+    def user_behavior_spec(self) -> Dict[str, Any]:
+        """User behavior deep dive, as a backend-neutral chart spec"""
+        hotjar = self.report_data['hotjar']
+        scroll_data = hotjar['scroll_depth']
+        clicked_elements = hotjar['top_clicked_elements']
+
+        # Session duration distribution
+        durations = np.random.normal(200, 80, 1000)
+        durations = durations[durations > 0]
+
+        return chart_spec('user_behavior', "👥 User Behavior Deep Dive", [
+            panel('Page Scroll Depth', series('bar', x=list(scroll_data.keys()),
+                                              y=[v * 100 for v in scroll_data.values()],
+                                              name='Scroll Depth', color='#3498DB')),
+            panel('Top Clicked Elements', series('barh', x=[item['clicks'] for item in clicked_elements],
+                                                 y=[item['element'] for item in clicked_elements],
+                                                 name='Clicks', color='#E74C3C')),
+            panel('Session Duration Distribution', series('histogram', values=durations, bins=20,
+                                                          name='Session Duration', color='#27AE60')),
+            panel('Device Usage', series('pie', labels=['Mobile', 'Desktop', 'Tablet'], values=[65, 30, 5],
+                                         name='Devices', colors=['#F39C12', '#9B59B6', '#E67E22'])),
+        ], rows=2, cols=2, width=1200, height=700)
+
+    def ecommerce_performance_spec(self) -> Dict[str, Any]:
+        """E-commerce performance analysis, as a backend-neutral chart spec"""
+        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+        revenue = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
+        transactions = [12, 15, 11, 18, 22, 17, 19]
+
+        return chart_spec('ecommerce_performance', "🛒 E-commerce Performance Analytics", [
+            panel('Revenue by Day',
+                  series('bar', x=days, y=revenue, name='Revenue (€)', color='#27AE60'),
+                  series('line', x=days, y=transactions, name='Transactions', color='#E74C3C', width=3,
+                         secondary=True)),
+            panel('Product Performance', series('bar', x=['Premium Collar', 'Dog Leash', 'Pet Treats', 'Cat Toy', 'Pet Bed'],
+                                                y=[1200, 800, 600, 400, 350], name='Product Revenue', color='#3498DB')),
+            panel('Cart Abandonment Analysis', series('funnel', labels=['Add to Cart', 'View Cart', 'Begin Checkout', 'Complete Purchase'],
+                                                      values=[456, 298, 198, 67],
+                                                      colors=['#F39C12', '#E67E22', '#D35400', '#E74C3C'])),
+            panel('Customer Segments', series('pie', labels=['New Customers', 'Returning', 'VIP Customers'],
+                                              values=[65, 28, 7], name="Customer Segments",
+                                              colors=['#3498DB', '#E74C3C', '#F1C40F'])),
+        ], rows=2, cols=2, width=1200, height=700)
+
+    def create_kpi_overview_chart(self) -> List[str]:
         """Create KPI overview dashboard"""
         print("📊 Creating KPI overview chart...")
-        # If plotly is available, use interactive dashboards; otherwise fall back to matplotlib
-        if _HAS_PLOTLY and make_subplots is not None and go is not None:
-            try:
-                fig = make_subplots(
-                    rows=2, cols=3,
-                    subplot_titles=('Sessions Trend', 'Revenue Growth', 'Conversion Funnel',
-                                  'Traffic Sources', 'User Retention', 'Error Rate'),
-                    specs=[[{"secondary_y": True}, {"secondary_y": True}, {}],
-                           [{"type": "domain"}, {}, {"secondary_y": True}]]
-                )
-
-                # Sessions trend
-                days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-                sessions = self.report_data['ga4']['daily_sessions']
-                fig.add_trace(
-                    go.Scatter(x=days, y=sessions, mode='lines+markers',
-                              name='Sessions', line=dict(color='#2E86C1', width=3)),
-                    row=1, col=1
-                )
-
-                # Revenue growth (mock week-over-week)
-                revenue_data = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
-                fig.add_trace(
-                    go.Bar(x=days, y=revenue_data, name='Revenue (€)',
-                           marker_color='#28B463'),
-                    row=1, col=2
-                )
-
-                # Conversion funnel
-                funnel_data = self.report_data['amplitude']['conversion_funnel']
-                funnel_labels = list(funnel_data.keys())
-                funnel_values = list(funnel_data.values())
-
-                fig.add_trace(
-                    go.Funnel(
-                        y=funnel_labels,
-                        x=funnel_values,
-                        textinfo="value+percent initial",
-                        marker={"color": ["#3498DB", "#E74C3C", "#F39C12", "#27AE60"]}
-                    ),
-                    row=1, col=3
-                )
-
-                # Traffic sources pie chart
-                sources = list(self.report_data['ga4']['traffic_sources'].keys())
-                values = list(self.report_data['ga4']['traffic_sources'].values())
-
-                fig.add_trace(
-                    go.Pie(labels=sources, values=values, name="Traffic Sources",
-                           marker_colors=['#3498DB', '#E74C3C', '#F39C12', '#27AE60', '#9B59B6', '#E67E22']),
-                    row=2, col=1
-                )
-
-                # User retention
-                retention = self.report_data['amplitude']['user_retention']
-                fig.add_trace(
-                    go.Bar(x=list(retention.keys()), y=list(retention.values()),
-                           name='Retention Rate', marker_color='#8E44AD'),
-                    row=2, col=2
-                )
-
-                # Error rate trend
-                error_days = days
-                error_rates = [np.random.uniform(0.01, 0.05) for _ in range(7)]
-                fig.add_trace(
-                    go.Scatter(x=error_days, y=error_rates, mode='lines+markers',
-                              name='Error Rate', line=dict(color='#E74C3C', width=2)),
-                    row=2, col=3
-                )
-
-                fig.update_layout(
-                    title_text="🎯 TPS-STAR Weekly KPI Dashboard",
-                    title_x=0.5,
-                    height=800,
-                    showlegend=False,
-                    template="plotly_white",
-                    font=dict(size=12)
-                )
-
-                fig.write_html("reports/charts/kpi_dashboard.html")
-                try:
-                    fig.write_image("reports/charts/kpi_dashboard.png", width=1400, height=800)
-                except Exception:
-                    # If kaleido/engine not available, write only html
-                    pass
-            except Exception as e:
-                print('Plotly KPI dashboard build failed; falling back to matplotlib:', repr(e))
-                # Matplotlib fallback: simple 2x3 grid
-                days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-                sessions = self.report_data['ga4']['daily_sessions']
-                revenue_data = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
-                funnel_data = self.report_data['amplitude']['conversion_funnel']
-                sources = list(self.report_data['ga4']['traffic_sources'].keys())
-                values = list(self.report_data['ga4']['traffic_sources'].values())
-                retention = self.report_data['amplitude']['user_retention']
-                error_rates = [np.random.uniform(0.01, 0.05) for _ in range(7)]
-
-                fig, axes = plt.subplots(2, 3, figsize=(14, 9))
-                # Sessions
-                axes[0, 0].plot(days, sessions, marker='o')
-                axes[0, 0].set_title('Sessions Trend')
-
-                # Revenue
-                axes[0, 1].bar(days, revenue_data, color='#28B463')
-                axes[0, 1].set_title('Revenue Growth')
-
-                # Funnel (horizontal bar)
-                labels = list(funnel_data.keys())
-                vals = list(funnel_data.values())
-                axes[0, 2].barh(labels, vals, color=['#3498DB', '#E74C3C', '#F39C12', '#27AE60'])
-                axes[0, 2].set_title('Conversion Funnel')
-
-                # Traffic sources (pie)
-                axes[1, 0].pie(values, labels=sources, autopct='%1.1f%%')
-                axes[1, 0].set_title('Traffic Sources')
-
-                # Retention
-                axes[1, 1].bar(list(retention.keys()), list(retention.values()), color='#8E44AD')
-                axes[1, 1].set_title('User Retention')
-
-                # Error rate
-                axes[1, 2].plot(days, error_rates, marker='o', color='#E74C3C')
-                axes[1, 2].set_title('Error Rate')
-
-                plt.tight_layout()
-                png_path = 'reports/charts/kpi_dashboard.png'
-                html_path = 'reports/charts/kpi_dashboard.html'
-                fig.savefig(png_path, dpi=150)
-                plt.close(fig)
-                # Simple HTML wrapper embedding the PNG
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write("<html><body><img src='kpi_dashboard.png' style='max-width:100%' /></body></html>")
-        else:
-            # Matplotlib fallback: simple 2x3 grid
-            days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-            sessions = self.report_data['ga4']['daily_sessions']
-            revenue_data = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
-            funnel_data = self.report_data['amplitude']['conversion_funnel']
-            sources = list(self.report_data['ga4']['traffic_sources'].keys())
-            values = list(self.report_data['ga4']['traffic_sources'].values())
-            retention = self.report_data['amplitude']['user_retention']
-            error_rates = [np.random.uniform(0.01, 0.05) for _ in range(7)]
-
-            fig, axes = plt.subplots(2, 3, figsize=(14, 9))
-            # Sessions
-            axes[0, 0].plot(days, sessions, marker='o')
-            axes[0, 0].set_title('Sessions Trend')
-
-            # Revenue
-            axes[0, 1].bar(days, revenue_data, color='#28B463')
-            axes[0, 1].set_title('Revenue Growth')
-
-            # Funnel (horizontal bar)
-            labels = list(funnel_data.keys())
-            vals = list(funnel_data.values())
-            axes[0, 2].barh(labels, vals, color=['#3498DB', '#E74C3C', '#F39C12', '#27AE60'])
-            axes[0, 2].set_title('Conversion Funnel')
-
-            # Traffic sources (pie)
-            axes[1, 0].pie(values, labels=sources, autopct='%1.1f%%')
-            axes[1, 0].set_title('Traffic Sources')
-
-            # Retention
-            axes[1, 1].bar(list(retention.keys()), list(retention.values()), color='#8E44AD')
-            axes[1, 1].set_title('User Retention')
-
-            # Error rate
-            axes[1, 2].plot(days, error_rates, marker='o', color='#E74C3C')
-            axes[1, 2].set_title('Error Rate')
-
-            plt.tight_layout()
-            png_path = 'reports/charts/kpi_dashboard.png'
-            html_path = 'reports/charts/kpi_dashboard.html'
-            fig.savefig(png_path, dpi=150)
-            plt.close(fig)
-            # Simple HTML wrapper embedding the PNG
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write("<html><body><img src='kpi_dashboard.png' style='max-width:100%' /></body></html>")
+        return render_spec(self.kpi_overview_spec(), self.output_path('charts'))
 
-    def create_user_behavior_analysis(self):
+    def create_user_behavior_analysis(self) -> List[str]:
         """Create detailed user behavior analysis"""
         print("👥 Creating user behavior analysis...")
-        if _HAS_PLOTLY and make_subplots is not None and go is not None:
-            try:
-                fig = make_subplots(
-                    rows=2, cols=2,
-                    subplot_titles=('Page Scroll Depth', 'Top Clicked Elements',
-                                  'Session Duration Distribution', 'Device Usage'),
-                    # device usage (bottom-right) is a pie -> use 'domain' type there
-                    specs=[[{}, {}], [{}, {"type": "domain"}]]
-                )
-
-                # Scroll depth
-                scroll_data = self.report_data['hotjar']['scroll_depth']
-                scroll_depths = list(scroll_data.keys())
-                scroll_percentages = [v * 100 for v in scroll_data.values()]
-
-                fig.add_trace(
-                    go.Bar(x=scroll_depths, y=scroll_percentages,
-                           name='Scroll Depth', marker_color='#3498DB'),
-                    row=1, col=1
-                )
-
-                # Top clicked elements
-                clicked_elements = self.report_data['hotjar']['top_clicked_elements']
-                element_names = [item['element'] for item in clicked_elements]
-                click_counts = [item['clicks'] for item in clicked_elements]
-
-                fig.add_trace(
-                    go.Bar(x=click_counts, y=element_names, orientation='h',
-                           name='Clicks', marker_color='#E74C3C'),
-                    row=1, col=2
-                )
-
-                # Session duration distribution
-                durations = np.random.normal(200, 80, 1000)
-                durations = durations[durations > 0]
-
-                fig.add_trace(
-                    go.Histogram(x=durations, nbinsx=20, name='Session Duration',
-                                marker_color='#27AE60'),
-                    row=2, col=1
-                )
-
-                # Device usage (pie chart)
-                devices = ['Mobile', 'Desktop', 'Tablet']
-                device_percentages = [65, 30, 5]
-
-                fig.add_trace(
-                    go.Pie(labels=devices, values=device_percentages, name="Devices",
-                           marker_colors=['#F39C12', '#9B59B6', '#E67E22']),
-                    row=2, col=2
-                )
-
-                fig.update_layout(
-                    title_text="👥 User Behavior Deep Dive",
-                    title_x=0.5,
-                    height=700,
-                    showlegend=False,
-                    template="plotly_white"
-                )
-
-                fig.write_html("reports/charts/user_behavior.html")
-                try:
-                    fig.write_image("reports/charts/user_behavior.png", width=1200, height=700)
-                except Exception:
-                    pass
-            except Exception as e:
-                print('Plotly user behavior chart failed; falling back to matplotlib:', repr(e))
-                # Matplotlib fallback
-                scroll_data = self.report_data['hotjar']['scroll_depth']
-                scroll_depths = list(scroll_data.keys())
-                scroll_percentages = [v * 100 for v in scroll_data.values()]
-
-                clicked_elements = self.report_data['hotjar']['top_clicked_elements']
-                element_names = [item['element'] for item in clicked_elements]
-                click_counts = [item['clicks'] for item in clicked_elements]
-
-                durations = np.random.normal(200, 80, 1000)
-                durations = durations[durations > 0]
-
-                devices = ['Mobile', 'Desktop', 'Tablet']
-                device_percentages = [65, 30, 5]
-
-                fig, axes = plt.subplots(2, 2, figsize=(12, 8))
-                axes[0, 0].bar(scroll_depths, scroll_percentages, color='#3498DB')
-                axes[0, 0].set_title('Page Scroll Depth')
-
-                axes[0, 1].barh(element_names, click_counts, color='#E74C3C')
-                axes[0, 1].set_title('Top Clicked Elements')
-
-                axes[1, 0].hist(durations, bins=20, color='#27AE60')
-                axes[1, 0].set_title('Session Duration Distribution')
-
-                axes[1, 1].pie(device_percentages, labels=devices, autopct='%1.0f%%')
-                axes[1, 1].set_title('Device Usage')
-
-                plt.tight_layout()
-                png_path = 'reports/charts/user_behavior.png'
-                html_path = 'reports/charts/user_behavior.html'
-                fig.savefig(png_path, dpi=150)
-                plt.close(fig)
-                # Simple HTML wrapper embedding the PNG
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write("<html><body><img src='user_behavior.png' style='max-width:100%' /></body></html>")
-        else:
-            # Matplotlib fallback
-            scroll_data = self.report_data['hotjar']['scroll_depth']
-            scroll_depths = list(scroll_data.keys())
-            scroll_percentages = [v * 100 for v in scroll_data.values()]
-
-            clicked_elements = self.report_data['hotjar']['top_clicked_elements']
-            element_names = [item['element'] for item in clicked_elements]
-            click_counts = [item['clicks'] for item in clicked_elements]
-
-            durations = np.random.normal(200, 80, 1000)
-            durations = durations[durations > 0]
-
-            devices = ['Mobile', 'Desktop', 'Tablet']
-            device_percentages = [65, 30, 5]
-
-            fig, axes = plt.subplots(2, 2, figsize=(12, 8))
-            axes[0, 0].bar(scroll_depths, scroll_percentages, color='#3498DB')
-            axes[0, 0].set_title('Page Scroll Depth')
-
-            axes[0, 1].barh(element_names, click_counts, color='#E74C3C')
-            axes[0, 1].set_title('Top Clicked Elements')
+        return render_spec(self.user_behavior_spec(), self.output_path('charts'))
 
-            axes[1, 0].hist(durations, bins=20, color='#27AE60')
-            axes[1, 0].set_title('Session Duration Distribution')
-
-            axes[1, 1].pie(device_percentages, labels=devices, autopct='%1.0f%%')
-            axes[1, 1].set_title('Device Usage')
-
-            plt.tight_layout()
-            png_path = 'reports/charts/user_behavior.png'
-            html_path = 'reports/charts/user_behavior.html'
-            fig.savefig(png_path, dpi=150)
-            plt.close(fig)
-            # Simple HTML wrapper embedding the PNG
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write("<html><body><img src='user_behavior.png' style='max-width:100%' /></body></html>")
-
-    def create_ecommerce_performance_chart(self):
+    def create_ecommerce_performance_chart(self) -> List[str]:
         """Create e-commerce performance analysis"""
         print("🛒 Creating e-commerce performance chart...")
-        if _HAS_PLOTLY and make_subplots is not None and go is not None:
-            fig = make_subplots(
-                rows=2, cols=2,
-                subplot_titles=('Revenue by Day', 'Product Performance',
-                              'Cart Abandonment Analysis', 'Customer Segments'),
-                # Customer Segments (bottom-right) is a pie chart -> 'domain'
-                specs=[[{"secondary_y": True}, {}], [{}, {"type": "domain"}]]
-            )
-
-            # Revenue by day with transactions
-            days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-            revenue = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
-            transactions = [12, 15, 11, 18, 22, 17, 19]
-
-            fig.add_trace(
-                go.Bar(x=days, y=revenue, name='Revenue (€)',
-                       marker_color='#27AE60'),
-                row=1, col=1
-            )
-
-            fig.add_trace(
-                go.Scatter(x=days, y=transactions, mode='lines+markers',
-                          name='Transactions', line=dict(color='#E74C3C', width=3)),
-                row=1, col=1, secondary_y=True
-            )
-
-            # Product performance
-            products = ['Premium Collar', 'Dog Leash', 'Pet Treats', 'Cat Toy', 'Pet Bed']
-            product_revenue = [1200, 800, 600, 400, 350]
-
-            fig.add_trace(
-                go.Bar(x=products, y=product_revenue, name='Product Revenue',
-                       marker_color='#3498DB'),
-                row=1, col=2
-            )
-
-            # Cart abandonment funnel
-            cart_funnel = ['Add to Cart', 'View Cart', 'Begin Checkout', 'Complete Purchase']
-            cart_values = [456, 298, 198, 67]
-
-            fig.add_trace(
-                go.Funnel(
-                    y=cart_funnel,
-                    x=cart_values,
-                    textinfo="value+percent initial",
-                    marker={"color": ["#F39C12", "#E67E22", "#D35400", "#E74C3C"]}
-                ),
-                row=2, col=1
-            )
-
-            # Customer segments
-            segments = ['New Customers', 'Returning', 'VIP Customers']
-            segment_values = [65, 28, 7]
-
-            fig.add_trace(
-                go.Pie(labels=segments, values=segment_values, name="Customer Segments",
-                       marker_colors=['#3498DB', '#E74C3C', '#F1C40F']),
-                row=2, col=2
-            )
-
-            fig.update_layout(
-                title_text="🛒 E-commerce Performance Analytics",
-                title_x=0.5,
-                height=700,
-                showlegend=False,
-                template="plotly_white"
-            )
-
-            fig.write_html("reports/charts/ecommerce_performance.html")
-            try:
-                fig.write_image("reports/charts/ecommerce_performance.png", width=1200, height=700)
-            except Exception:
-                pass
-        else:
-            # Matplotlib fallback
-            days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-            revenue = [2800, 3200, 2900, 3800, 4200, 3600, 4100]
-            transactions = [12, 15, 11, 18, 22, 17, 19]
-
-            products = ['Premium Collar', 'Dog Leash', 'Pet Treats', 'Cat Toy', 'Pet Bed']
-            product_revenue = [1200, 800, 600, 400, 350]
-
-            cart_funnel = ['Add to Cart', 'View Cart', 'Begin Checkout', 'Complete Purchase']
-            cart_values = [456, 298, 198, 67]
-
-            segments = ['New Customers', 'Returning', 'VIP Customers']
-            segment_values = [65, 28, 7]
-
-            fig, axes = plt.subplots(2, 2, figsize=(12, 8))
-            axes[0, 0].bar(days, revenue, color='#27AE60')
-            axes[0, 0].set_title('Revenue by Day')
-
-            axes[0, 0].plot(days, transactions, marker='o', color='#E74C3C')
-
-            axes[0, 1].bar(products, product_revenue, color='#3498DB')
-            axes[0, 1].set_title('Product Performance')
-
-            axes[1, 0].barh(cart_funnel, cart_values, color=['#F39C12', '#E67E22', '#D35400', '#E74C3C'])
-            axes[1, 0].set_title('Cart Abandonment Funnel')
-
-            axes[1, 1].pie(segment_values, labels=segments, autopct='%1.0f%%')
-            axes[1, 1].set_title('Customer Segments')
-
-            plt.tight_layout()
-            png_path = 'reports/charts/ecommerce_performance.png'
-            html_path = 'reports/charts/ecommerce_performance.html'
-            fig.savefig(png_path, dpi=150)
-            plt.close(fig)
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write("<html><body><img src='ecommerce_performance.png' style='max-width:100%' /></body></html>")
+        return render_spec(self.ecommerce_performance_spec(), self.output_path('charts'))
 
     def generate_insights_and_recommendations(self) -> List[Dict[str, str]]:
         """Generate AI-powered insights and recommendations"""
         print("🧠 Generating insights and recommendations...")
 
-        ga4 = self.report_data['ga4']
-        amplitude = self.report_data['amplitude']
-        hotjar = self.report_data['hotjar']
-        sentry = self.report_data['sentry']
-
         insights = []
 
-        # Traffic insights
-        if ga4['bounce_rate'] > 0.5:
-            insights.append({
-                'type': 'warning',
-                'category': 'Traffic Quality',
-                'insight': f"Bounce rate is {ga4['bounce_rate']:.1%}, which is above the recommended 50% threshold.",
-                'recommendation': "Improve page load speed, enhance content relevance, and optimize mobile experience.",
-                'priority': 'High'
-            })
-
-        # Conversion insights
-        if ga4['conversion_rate'] < 0.03:
-            insights.append({
-                'type': 'opportunity',
-                'category': 'Conversion Optimization',
-                'insight': f"Conversion rate is {ga4['conversion_rate']:.2%}, below industry average of 3%.",
-                'recommendation': "A/B test checkout flow, add social proof, and implement exit-intent popups.",
-                'priority': 'High'
-            })
-
-        # User experience insights
-        if hotjar['rage_clicks'] > 15:
+        # Data completeness: flag sources that missed their collection deadline
+        for source in ('ga4', 'amplitude', 'hotjar', 'sentry'):
+            if self.is_partial(source):
+                reason = self.report_data.get(source, {}).get('_reason', 'no data')
+                insights.append({
+                    'type': 'warning',
+                    'category': 'Data Completeness',
+                    'insight': f"{source.upper()} data is partial this week ({reason}).",
+                    'recommendation': "Check the provider status and credentials, then rerun the report for this week.",
+                    'priority': 'Medium'
+                })
+
+        # Anomalies in the stored daily history, most severe first
+        for _, anomaly in self.stored_anomalies().head(MAX_ANOMALY_INSIGHTS).iterrows():
             insights.append({
-                'type': 'warning',
-                'category': 'User Experience',
-                'insight': f"High rage click count ({hotjar['rage_clicks']}) indicates user frustration.",
-                'recommendation': "Review heatmaps to identify problematic elements and improve UI/UX design.",
-                'priority': 'Medium'
+                'type': 'critical' if anomaly['severity'] == 'critical' else 'warning',
+                'category': 'Anomaly Detection',
+                'insight': f"Unusual {describe(anomaly)}.",
+                'recommendation': ANOMALY_RECOMMENDATIONS[anomaly['direction']],
+                'priority': anomaly['severity'].capitalize()
             })
 
-        # Performance insights
-        if sentry['crash_free_sessions'] < 0.98:
-            insights.append({
-                'type': 'critical',
-                'category': 'Technical Health',
-                'insight': f"Crash-free session rate is {sentry['crash_free_sessions']:.1%}, below 98% target.",
-                'recommendation': "Prioritize fixing top errors and implement better error handling.",
-                'priority': 'Critical'
-            })
-
-        # Positive insights
-        if amplitude['user_retention']['day_7'] > 0.25:
-            insights.append({
-                'type': 'success',
-                'category': 'User Engagement',
-                'insight': f"Excellent 7-day retention rate of {amplitude['user_retention']['day_7']:.1%}.",
-                'recommendation': "Leverage this strength by implementing referral programs and user-generated content.",
-                'priority': 'Low'
-            })
+        # Declarative rules (insight_rules.json): thresholds and week-over-week trends
+        insights.extend(self.rule_insights())
 
         return insights
 
@@ -1155,6 +1075,50 @@ class TPSAnalyticsReporter:
 
         report_date = self.end_date.strftime("%Y-%m-%d")
 
+        def kpi(source: str, compute: Callable[[Dict[str, Any]], str]) -> str:
+            # Partial sections render as "n/a" rather than breaking the report
+            if self.is_partial(source):
+                return 'n/a'
+            try:
+                return compute(self.report_data[source])
+            except (KeyError, TypeError, ZeroDivisionError):
+                return 'n/a'
+
+        kpi_sessions = kpi('ga4', lambda d: f"{d['sessions']:,}")
+        kpi_revenue = kpi('ga4', lambda d: f"€{d['revenue']:,.0f}")
+        kpi_conversion = kpi('ga4', lambda d: f"{d['conversion_rate']:.2%}")
+        kpi_aov = kpi('ga4', lambda d: f"€{(d['revenue'] / d['transactions']):.0f}")
+        kpi_crash_free = kpi('sentry', lambda d: f"{d['crash_free_sessions']:.1%}")
+        kpi_retention = kpi('amplitude', lambda d: f"{d['user_retention']['day_7']:.1%}")
+
+        comparison = self.period_comparison()
+
+        def kpi_change(source: str, metric: str) -> str:
+            # Stored weekly section vs last week's (utils/period_compare.py)
+            pct = None
+            if comparison is not None and not self.is_partial(source):
+                pct = comparison.pct('weekly', f"{source}.{metric}", market=self.market)
+            if pct is None:
+                return '<div class="kpi-change neutral"><i class="fas fa-minus"></i> n/a vs last week</div>'
+            direction, arrow = ('positive', 'up') if pct >= 0 else ('negative', 'down')
+            return (f'<div class="kpi-change {direction}"><i class="fas fa-arrow-{arrow}"></i> '
+                    f'{format_pct(pct)} vs last week</div>')
+
+        change_sessions = kpi_change('ga4', 'sessions')
+        change_revenue = kpi_change('ga4', 'revenue')
+        change_conversion = kpi_change('ga4', 'conversion_rate')
+        change_aov = kpi_change('ga4', 'avg_order_value')
+        change_crash_free = kpi_change('sentry', 'crash_free_sessions')
+        change_retention = kpi_change('amplitude', 'user_retention.day_7')
+
+        market_title = f" — {self.market.capitalize()}" if self.market != DEFAULT_MARKET else ""
+
+        partial_sources = [src for src in ('ga4', 'amplitude', 'hotjar', 'sentry') if self.is_partial(src)]
+        partial_note = (
+            f"<br><strong>Partial data:</strong> {', '.join(src.upper() for src in partial_sources)}"
+            if partial_sources else ""
+        )
+
         html_template = f"""
 <!DOCTYPE html>
 <html lang="en">
@@ -1340,10 +1304,10 @@ class TPSAnalyticsReporter:
     <div class="main-container">
         <!-- Header -->
         <div class="header">
-            <h1><i class="fas fa-chart-line"></i> TPS-STAR Analytics Report</h1>
+            <h1><i class="fas fa-chart-line"></i> TPS-STAR Analytics Report{market_title}</h1>
             <div class="subtitle">
                 Weekly Business Intelligence Report<br>
-                Period: {self.start_date.strftime("%B %d")} - {self.end_date.strftime("%B %d, %Y")}
+                Period: {self.start_date.strftime("%B %d")} - {self.end_date.strftime("%B %d, %Y")}{partial_note}
             </div>
         </div>
 
@@ -1352,61 +1316,49 @@ class TPSAnalyticsReporter:
             <div class="kpi-card">
                 <div class="kpi-label">Sessions</div>
                 <div class="kpi-number" style="color: var(--primary-color);">
-                    {self.report_data['ga4']['sessions']:,}
-                </div>
-                <div class="kpi-change positive">
-                    <i class="fas fa-arrow-up"></i> +12.3% vs last week
+                    {kpi_sessions}
                 </div>
+                {change_sessions}
             </div>
 
             <div class="kpi-card">
                 <div class="kpi-label">Revenue</div>
                 <div class="kpi-number" style="color: var(--success-color);">
-                    €{self.report_data['ga4']['revenue']:,.0f}
-                </div>
-                <div class="kpi-change positive">
-                    <i class="fas fa-arrow-up"></i> +8.7% vs last week
+                    {kpi_revenue}
                 </div>
+                {change_revenue}
             </div>
 
             <div class="kpi-card">
                 <div class="kpi-label">Conversion Rate</div>
                 <div class="kpi-number" style="color: var(--info-color);">
-                    {self.report_data['ga4']['conversion_rate']:.2%}
-                </div>
-                <div class="kpi-change negative">
-                    <i class="fas fa-arrow-down"></i> -2.1% vs last week
+                    {kpi_conversion}
                 </div>
+                {change_conversion}
             </div>
 
             <div class="kpi-card">
                 <div class="kpi-label">Avg Order Value</div>
                 <div class="kpi-number" style="color: var(--warning-color);">
-                    €{(self.report_data['ga4']['revenue'] / self.report_data['ga4']['transactions']):.0f}
-                </div>
-                <div class="kpi-change positive">
-                    <i class="fas fa-arrow-up"></i> +5.4% vs last week
+                    {kpi_aov}
                 </div>
+                {change_aov}
             </div>
 
             <div class="kpi-card">
                 <div class="kpi-label">Crash-Free Sessions</div>
                 <div class="kpi-number" style="color: var(--success-color);">
-                    {self.report_data['sentry']['crash_free_sessions']:.1%}
-                </div>
-                <div class="kpi-change positive">
-                    <i class="fas fa-arrow-up"></i> +0.3% vs last week
+                    {kpi_crash_free}
                 </div>
+                {change_crash_free}
             </div>
 
             <div class="kpi-card">
                 <div class="kpi-label">User Retention (7d)</div>
                 <div class="kpi-number" style="color: var(--info-color);">
-                    {self.report_data['amplitude']['user_retention']['day_7']:.1%}
-                </div>
-                <div class="kpi-change positive">
-                    <i class="fas fa-arrow-up"></i> +4.2% vs last week
+                    {kpi_retention}
                 </div>
+                {change_retention}
             </div>
         </div>
 
@@ -1471,31 +1423,93 @@ class TPSAnalyticsReporter:
 </html>
 """
 
-        with open(f"reports/weekly-report-{report_date}.html", "w", encoding="utf-8") as f:
+        with open(self.output_path(f"weekly-report-{report_date}.html"), "w", encoding="utf-8") as f:
             f.write(html_template)
 
-    def save_data_json(self):
-        """Save all collected data as JSON for future reference"""
+    def save_data_json(self, record: bool = True):
+        """Save all collected data as JSON for future reference
+
+        ``record=False`` leaves the warehouse alone (a fan-out parent writes
+        every market's rows once, see :meth:`weekly_rows`).
+        """
         report_date = self.end_date.strftime("%Y-%m-%d")
 
-        with open(f"reports/data/analytics-data-{report_date}.json", "w") as f:
-            json.dump(self.report_data, f, indent=2, default=str)
+        payload = dict(self.report_data)
+        if self.collection_stats:
+            payload['_collection'] = self.collection_stats
+
+        with open(self.output_path('data', f"analytics-data-{report_date}.json"), "w") as f:
+            json.dump(payload, f, indent=2, default=str)
+
+        # Same numbers in the warehouse, one ``weekly`` metric per section field
+        if record:
+            MetricsWarehouse().write(self.weekly_rows())
+
+    def weekly_rows(self) -> pd.DataFrame:
+        """This week's complete sections as ``weekly`` warehouse rows of the report's market.
+
+        Copies of shop-wide sections in a market report (``_scope`` = ``shop``)
+        are not stored under the market.
+        """
+        sections = {name: data for name, data in self.complete_sections().items() if data.get('_scope') != 'shop'}
+        return to_long('weekly', self.end_date, sections, market=self.market, dimensions={'window': '7d'})
 
     def run(self):
         """Main execution method"""
         print("🚀 Starting TPS-STAR Weekly Analytics Report Generation...")
         print(f"📅 Analyzing period: {self.start_date.strftime('%Y-%m-%d')} to {self.end_date.strftime('%Y-%m-%d')}")
 
-        # Collect data from all sources
-        self.report_data['ga4'] = self.fetch_ga4_data()
-        self.report_data['amplitude'] = self.fetch_amplitude_data()
-        self.report_data['hotjar'] = self.fetch_hotjar_data()
-        self.report_data['sentry'] = self.fetch_sentry_data()
+        # Collect data from all sources concurrently; slow or failing
+        # providers come back as partial sections instead of blocking.
+        self.report_data.update(self.collect_sources({
+            'ga4': self.fetch_ga4_data,
+            'amplitude': self.fetch_amplitude_data,
+            'hotjar': self.fetch_hotjar_data,
+            'sentry': self.fetch_sentry_data,
+        }))
+
+        self.create_charts()
+
+    def create_charts(self, workers: Optional[int] = None) -> List[str]:
+        """Generate visualizations (skip charts whose inputs are partial)
+
+        The dashboards are independent, so they render in the chart pool
+        (``workers=1`` keeps them in-process, e.g. inside a fan-out worker).
+        Each is seeded from the report date: reruns draw the same figures.
+        Returns the files written.
+        """
+        jobs = []
+        for method, sources, stem in WEEKLY_CHARTS:
+            missing = [src for src in sources if self.is_partial(src)]
+            if missing:
+                print(f"⏭️  Skipping {method}: partial data from {', '.join(missing)}")
+                continue
+            jobs.append(chart_job(stem, draw_chart, method, self.report_data, self.output_dir,
+                                  base_seed=int(self.end_date.strftime('%Y%m%d'))))
+
+        files = []
+        for result in render_charts(jobs, workers=workers):
+            if result.get('error'):
+                print(f"⚠️  {result['name']}: chart failed ({result['error']})")
+                continue
+            files.extend(result['output'])
+        return files
+
+
+# Dashboards of the weekly report: (builder method, sources it needs, chart spec name)
+WEEKLY_CHARTS = [
+    ('create_kpi_overview_chart', ('ga4', 'amplitude'), 'kpi_dashboard'),
+    ('create_user_behavior_analysis', ('hotjar',), 'user_behavior'),
+    ('create_ecommerce_performance_chart', (), 'ecommerce_performance'),
+]
+
+
+def draw_chart(method: str, report_data: Dict[str, Any], output_dir: str) -> List[str]:
+    """Chart-pool job: one dashboard of the weekly report; returns the files it wrote."""
+    reporter = TPSAnalyticsReporter(output_dir=output_dir)
+    reporter.report_data = report_data
+    return getattr(reporter, method)()
 
-        # Generate visualizations
-        self.create_kpi_overview_chart()
-        self.create_user_behavior_analysis()
-        self.create_ecommerce_performance_chart()
 
 # Add the runtime entrypoint here (after the TPSAnalyticsReporter class)
 def _run_reporter_entrypoint():
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Record / Replay Any TPS-STAR Script
+===================================
+
+Runs a pipeline script with the shared HTTP transport in cassette mode:
+
+- record: real API calls, every response saved to the cassette directory
+- replay: no network, responses served from the cassette with the recorded
+  latency (``--latency 0`` for instant), credentials stubbed, random data
+  seeded. Full-pipeline timings become reproducible offline.
+
+Usage:
+    python scripts/http_cassette.py record cassettes/weekly scripts/generate_weekly_report.py
+    python scripts/http_cassette.py replay cassettes/weekly scripts/generate_weekly_report.py
+    python scripts/http_cassette.py replay --latency 0 cassettes/shopify \\
+        scripts/export_shopify_metrics.py --domain stub --token stub --outdir /tmp/out
+"""
+
+import argparse
+import json
+import os
+import random
+import runpy
+import sys
+import tempfile
+import time
+
+# Env vars the connectors key off; secrets are recorded by name only
+CASSETTE_ENV = [
+    'GA4_PROPERTY_ID', 'SENTRY_ORG', 'SENTRY_PROJECT', 'SHOPIFY_STORE', 'SHOPIFY_STORE_URL',
+    'SHOPIFY_API_BASE', 'HOTJAR_SITE_ID', 'CLARITY_PROJECT_ID', 'TPS_DOMAIN', 'TPS_COMPETITORS',
+    'WEEK_OFFSET',
+]
+SECRET_ENV = [
+    'GA4_ACCESS_TOKEN', 'SENTRY_AUTH_TOKEN', 'AMPLITUDE_API_KEY', 'AMPLITUDE_SECRET_KEY',
+    'SHOPIFY_ACCESS_TOKEN', 'AHREFS_API_KEY', 'HOTJAR_API_TOKEN', 'CLARITY_API_KEY',
+]
+
+
+def recorded_env():
+    env = {name: os.environ[name] for name in CASSETTE_ENV if os.environ.get(name)}
+    env.update({name: None for name in SECRET_ENV if os.environ.get(name)})
+    if os.environ.get('GA4_REFRESH_TOKEN'):
+        # Replays use a static token instead of the refresh flow
+        env['GA4_ACCESS_TOKEN'] = None
+    return env
+
+
+def apply_replay_env(cassette_dir):
+    try:
+        with open(os.path.join(cassette_dir, 'meta.json'), 'r', encoding='utf-8') as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        meta = {}
+    for name, value in (meta.get('env') or {}).items():
+        os.environ.setdefault(name, value if value is not None else 'replay')
+    for name in ('GA4_CLIENT_ID', 'GA4_CLIENT_SECRET', 'GA4_REFRESH_TOKEN'):
+        os.environ.pop(name, None)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run a script against recorded HTTP responses')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('cassette', help='cassette directory')
+    parser.add_argument('script', help='python script to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the script')
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='replay: multiply recorded latencies by this (0 = instant)')
+    parser.add_argument('--keep-history', action='store_true',
+                        help='use the real local history instead of an empty one')
+    args = parser.parse_args()
+
+    os.environ['TPS_HTTP_CASSETTE'] = os.path.abspath(args.cassette)
+    os.environ['TPS_HTTP_MODE'] = args.mode
+    os.environ['TPS_REPLAY_LATENCY'] = str(args.latency)
+    if not args.keep_history:
+        # Empty history: every day is fetched, so every request is recorded / replayed
+        os.environ['TPS_HISTORY_DIR'] = tempfile.mkdtemp(prefix='tps-history-')
+    if args.mode == 'replay':
+        apply_replay_env(args.cassette)
+        os.environ['TPS_TOKEN_CACHE_DIR'] = tempfile.mkdtemp(prefix='tps-tokens-')
+        random.seed(0)
+        try:
+            import numpy as np
+            np.random.seed(0)
+        except ImportError:
+            pass
+
+    script = os.path.abspath(args.script)
+    sys.argv = [script] + args.args
+    sys.path.insert(0, os.path.dirname(script))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    status = 0
+    started = time.perf_counter()
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    elapsed = time.perf_counter() - started
+
+    from utils.http_transport import get_transport
+    cassette = get_transport().cassette
+    if args.mode == 'record':
+        cassette.write_meta(recorded_env())
+        print(f"📼 Recorded {cassette.recorded} response(s) → {args.cassette} in {elapsed:.2f}s")
+    else:
+        print(f"📼 Replayed {cassette.replayed} response(s) from {args.cassette} in {elapsed:.2f}s")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Daily History Ingestion for TPS-STAR
+====================================
+
+Run once a day (cron / scheduled workflow). For every configured source it
+fetches only the days after that source's watermark, up to the last closed
+day, appends them to the local history and advances the watermark:
+
+- ga4      sessions, users, pageviews, transactions, revenue per day
+- ga4_markets  the same per storefront market (GA4 countries mapped to the
+           markets of config/markets.json, see ``utils.markets``)
+- shopify  orders, revenue, refunds per creation day
+- clarity  snapshot of the last 24h (the export API keeps only 3 days and
+           allows 10 calls a day, see ``utils.clarity_snapshots``)
+
+The weekly report (any ``WEEK_OFFSET``) then reads closed days from the
+history instead of calling the APIs again.
+
+Usage:
+    python scripts/ingest_history.py                      # all configured sources
+    python scripts/ingest_history.py --sources ga4 --backfill-days 365
+    TPS_HISTORY_DIR=/data/tps-history python scripts/ingest_history.py
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from utils.clarity_snapshots import ClaritySnapshotCollector
+from utils.history import HistoryStore, last_closed_day
+from utils.ga4_data import GA4DataClient
+from utils.markets import country_markets, fold_countries, load_markets
+from utils.oauth_tokens import get_ga4_access_token, has_ga4_credentials
+from utils.shopify_orders import daily_order_totals
+from export_shopify_metrics import api_base
+
+SOURCES = ('ga4', 'ga4_markets', 'shopify', 'clarity')
+
+
+def ga4_fetcher():
+    property_id = os.getenv('GA4_PROPERTY_ID')
+    if not property_id or not has_ga4_credentials():
+        return None
+    client = GA4DataClient(property_id, get_ga4_access_token)
+    return client.fetch_daily
+
+
+def ga4_markets_fetcher():
+    property_id = os.getenv('GA4_PROPERTY_ID')
+    countries = country_markets(load_markets())
+    if not property_id or not has_ga4_credentials() or not countries:
+        return None
+    client = GA4DataClient(property_id, get_ga4_access_token)
+    return lambda start, end: fold_countries(client.fetch_daily_breakdown(start, end, 'countryId'),
+                                             countries, start, end)
+
+
+def shopify_fetcher():
+    store = os.getenv('SHOPIFY_STORE')
+    token = os.getenv('SHOPIFY_ACCESS_TOKEN')
+    override = os.getenv('SHOPIFY_API_BASE')
+    if not token or not (store or override):
+        return None
+    base = api_base(f"{store}.myshopify.com", override)
+    headers = {'X-Shopify-Access-Token': token}
+    return lambda start, end: daily_order_totals(base, headers, start, end)
+
+
+FETCHERS = {
+    'ga4': ga4_fetcher,
+    'ga4_markets': ga4_markets_fetcher,
+    'shopify': shopify_fetcher,
+}
+
+
+def clarity_snapshotter(history):
+    token = os.getenv('CLARITY_API_KEY')
+    if not token:
+        return None
+    return ClaritySnapshotCollector(token, history=history).collect
+
+
+# Sources that can only be snapshotted (no arbitrary date ranges)
+SNAPSHOTTERS = {
+    'clarity': clarity_snapshotter,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Append the days since each source's watermark to the local history")
+    parser.add_argument('--sources', default=','.join(SOURCES),
+                        help=f"comma-separated subset of {', '.join(SOURCES)}")
+    parser.add_argument('--backfill-days', type=int, default=90,
+                        help='how far back to start when a source has no watermark yet (default: 90)')
+    parser.add_argument('--until', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        help='last day to ingest, YYYY-MM-DD (default: last closed day per source)')
+    parser.add_argument('--history-dir', default=None, help='history root (default: $TPS_HISTORY_DIR or report_data/history)')
+    args = parser.parse_args()
+
+    history = HistoryStore(args.history_dir)
+    failures = 0
+    for source in [s.strip() for s in args.sources.split(',') if s.strip()]:
+        if source in SNAPSHOTTERS:
+            snapshot = SNAPSHOTTERS[source](history)
+            if snapshot is None:
+                print(f"⏭️  {source}: not configured, skipped")
+                continue
+            try:
+                snapshot()
+            except Exception as e:
+                print(f"❌ {source}: snapshot failed ({e})")
+                failures += 1
+            continue
+        if source not in FETCHERS:
+            print(f"⚠️  Unknown source: {source}")
+            failures += 1
+            continue
+        fetch = FETCHERS[source]()
+        if fetch is None:
+            print(f"⏭️  {source}: not configured, skipped")
+            continue
+        until = args.until or last_closed_day(source)
+        backfill_start = date.today() - timedelta(days=args.backfill_days)
+        try:
+            history.ingest(source, fetch, backfill_start=backfill_start, until=until)
+        except Exception as e:
+            print(f"❌ {source}: ingestion failed ({e}); watermark unchanged")
+            failures += 1
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
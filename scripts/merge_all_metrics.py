@@ -1,18 +1,48 @@
 #!/usr/bin/env python3
+import os
 import pandas as pd
 import sys
 
-def merge_metrics(shopify_csv, ga4_csv, output_csv):
-    shop = pd.read_csv(shopify_csv)
-    ga4 = pd.read_csv(ga4_csv)
+from utils.metrics_join import MetricsJoin, normalize_export
+from utils.warehouse import REPORT_LABELS, MetricsWarehouse
 
-    merged = pd.concat([shop, ga4], axis=1)
+def merge_metrics(shopify_csv, ga4_csv, output_csv):
+    # Keyed on (date, market, source, metric): inputs of any length or grain line up
+    join = MetricsJoin([
+        normalize_export("shopify", pd.read_csv(shopify_csv)),
+        normalize_export("ga4", pd.read_csv(ga4_csv)),
+    ])
+    merged = join.latest_rows()
     merged.to_csv(output_csv, index=False)
 
     print(f"✅ Full metrics exported → {output_csv}")
 
+def export_from_warehouse(output_csv, warehouse=None):
+    """metrics_full_report.csv (source, metric, value) for the last 7 days every source covers."""
+    warehouse = warehouse or MetricsWarehouse()
+    join = MetricsJoin.from_warehouse(warehouse)
+    as_of = join.as_of(REPORT_LABELS)
+    for source, last_day in join.lagging().items():
+        print(f"⏳ {source}: nothing after {last_day.date()} yet, every source's window ends there")
+
+    merged = join.report_rows(as_of)
+    # Non-additive metrics (users, rates) only exist as exported 7-day window totals
+    seen = set(zip(merged["source"], merged["metric"]))
+    extra = [(source, label, value) for source in REPORT_LABELS
+             for label, value in warehouse.labelled(source).items() if (source, label) not in seen]
+    merged = pd.concat([merged, pd.DataFrame(extra, columns=merged.columns)], ignore_index=True)
+    merged.to_csv(output_csv, index=False)
+
+    window = f" (7 days to {as_of.date()})" if as_of is not None else ""
+    print(f"✅ Full metrics exported from {warehouse.root} → {output_csv}{window}, {len(merged)} metrics")
+
 def main():
-    merge_metrics(sys.argv[1], sys.argv[2], sys.argv[3])
+    if len(sys.argv) == 3 and os.path.isdir(sys.argv[1]):
+        # merge_all_metrics.py report_data metrics_full_report.csv
+        root = os.getenv("TPS_WAREHOUSE_DIR") or os.path.join(sys.argv[1], "warehouse")
+        export_from_warehouse(sys.argv[2], MetricsWarehouse(root))
+    else:
+        merge_metrics(sys.argv[1], sys.argv[2], sys.argv[3])
 
 if __name__ == "__main__":
     main()
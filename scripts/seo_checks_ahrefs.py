@@ -1,47 +1,287 @@
 #!/usr/bin/env python3
+"""
+Ahrefs SEO Checks (site + competitors)
+======================================
+
+- Mode simple (défaut) : ``TPS_DOMAIN`` → out/ahrefs_metrics.json + .csv
+- Mode batch : plusieurs domaines / concurrents interrogés en parallèle
+  (connexions partagées, bucket "ahrefs" de utils/rate_limits.py)
+- Budget d'unités : plafond par exécution (``--unit-budget``), borné par
+  le solde restant du compte (``subscription-info/limits-and-usage``)
+- Cache des métriques par cible et par jour (pas de nouvelles unités si la
+  cible a déjà été mesurée aujourd'hui)
+- Top backlinks streamés page par page en CSV (ou Parquet si pyarrow)
+- Une cible en échec n'interrompt pas les autres
+
+Usage:
+    python scripts/seo_checks_ahrefs.py
+    python scripts/seo_checks_ahrefs.py --targets tps-star.com \\
+        --competitors rival-a.com,rival-b.com --backlinks 500 --unit-budget 20000
+    python scripts/seo_checks_ahrefs.py --targets-file config/seo_targets.txt --format parquet
+"""
 import os, sys, json, csv, time
-import urllib.request as r
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from utils.history import HistoryStore
+from utils.http_transport import get_transport
+from utils.warehouse import MetricsWarehouse, to_long
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except Exception:
+    pa = None
+    pq = None
+    _HAS_PYARROW = False
+
+API = os.environ.get("AHREFS_API_BASE", "https://api.ahrefs.com/v3")
+MODE = "domain"
+
+# Coût estimé (unités Ahrefs) : minimum par requête, puis par ligne et par champ
+MIN_UNITS_PER_REQUEST = 50
+BACKLINKS_PAGE = 100
+BACKLINK_FIELDS = ["url_from", "url_to", "anchor", "domain_rating_source", "is_dofollow", "first_seen_link"]
+
+
+class BudgetExceeded(RuntimeError):
+    """Plus assez d'unités Ahrefs pour la requête suivante."""
+
+
+class UnitBudget:
+    """Compteur d'unités partagé entre les threads."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, units):
+        with self._lock:
+            if self.limit is not None and self.spent + units > self.limit:
+                raise BudgetExceeded(f"budget d'unités atteint ({self.spent}/{self.limit})")
+            self.spent += units
 
-API = "https://api.ahrefs.com/v3"
 
-def call(path_query):
-    key = os.environ["AHREFS_API_KEY"]
-    req = r.Request(f"{API}{path_query}", headers={"Authorization": f"Bearer {key}"})
+def normalize(domain):
+    return domain.replace("https://", "").replace("http://", "").strip().strip("/")
+
+
+def call(path, params, budget, units=MIN_UNITS_PER_REQUEST, key=None):
+    """GET Ahrefs v3 ; lève une exception au lieu de quitter le process."""
+    key = key or os.environ["AHREFS_API_KEY"]
+    budget.reserve(units)
+    resp = get_transport().request("GET", f"{API}{path}", params=params,
+                                   headers={"Authorization": f"Bearer {key}"}, provider="ahrefs")
+    resp.raise_for_status()
+    return resp.json()
+
+
+def remaining_units():
+    """Solde d'unités du workspace (endpoint gratuit) ; None si indisponible."""
     try:
-        with r.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode())
+        resp = get_transport().request("GET", f"{API}/subscription-info/limits-and-usage",
+                                       headers={"Authorization": f"Bearer {os.environ['AHREFS_API_KEY']}"},
+                                       provider="ahrefs")
+        resp.raise_for_status()
+        info = resp.json().get("limits_and_usage") or resp.json()
+        return int(info["units_limit_workspace"]) - int(info["units_usage_workspace"])
     except Exception as e:
-        print(f"ERR {path_query}: {e}")
-        sys.exit(2)
-
-domain = os.environ.get("TPS_DOMAIN","").replace("https://","").replace("http://","").strip("/")
-mode = "domain"
-
-# 1) Metrics (DR, backlinks…) — endpoint Ahrefs v3 Site Explorer
-data = call(f"/site-explorer/metrics?target={domain}&mode={mode}")
-
-# 2) (Optionnel) Top backlinks
-# top_bls = call(f"/site-explorer/backlinks?target={domain}&mode={mode}&limit=50")
-
-out = {
-    "target": domain,
-    "fetched_at": int(time.time()),
-    "metrics": data,
-    # "top_backlinks": top_bls,
-}
-
-# Sauvegarde JSON + CSV rapide si métriques basiques présentes
-os.makedirs("out", exist_ok=True)
-with open("out/ahrefs_metrics.json","w") as f: json.dump(out, f, indent=2)
-
-# Exemple de CSV si la réponse contient ces champs (adapter aux clés réelles renvoyées par v3)
-row = {
-    "domain": domain,
-    "domain_rating": data.get("domain_rating"),
-    "backlinks": data.get("backlinks"),
-    "ref_domains": data.get("ref_domains"),
-}
-with open("out/ahrefs_metrics.csv","w", newline="") as f:
-    w = csv.DictWriter(f, fieldnames=row.keys()); w.writeheader(); w.writerow(row)
-
-print("OK: out/ahrefs_metrics.json, out/ahrefs_metrics.csv")
+        print(f"WARN limits-and-usage: {e}")
+        return None
+
+
+# -- métriques (cache par cible et par jour) ----------------------------------
+
+def metrics_cache_path(target, day):
+    return HistoryStore().root / "ahrefs" / day.isoformat() / f"{target}.json"
+
+
+def fetch_metrics(target, budget, day, force=False):
+    path = metrics_cache_path(target, day)
+    if path.exists() and not force:
+        with open(path) as f:
+            return json.load(f), True
+    data = call("/site-explorer/metrics", {"target": target, "mode": MODE, "date": day.isoformat()}, budget)
+    data = data.get("metrics", data)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f: json.dump(data, f)
+    os.replace(tmp, path)
+    return data, False
+
+
+# -- backlinks streamés -------------------------------------------------------
+
+class RowSink:
+    """Écrit des pages de lignes au fil de l'eau (CSV ou Parquet)."""
+
+    def __init__(self, path, fields, fmt):
+        self.path, self.fields, self.fmt = path, fields, fmt
+        self.rows = 0
+        if fmt == "parquet":
+            self.schema = pa.schema([(name, pa.string()) for name in fields])
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.fh = open(path, "w", newline="")
+            self.writer = csv.DictWriter(self.fh, fieldnames=fields, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def write(self, page):
+        if not page:
+            return
+        if self.fmt == "parquet":
+            columns = {name: [None if r.get(name) is None else str(r.get(name)) for r in page] for name in self.fields}
+            self.writer.write_table(pa.table(columns, schema=self.schema))
+        else:
+            self.writer.writerows(page)
+        self.rows += len(page)
+
+    def close(self):
+        if self.fmt == "parquet":
+            self.writer.close()
+        else:
+            self.fh.close()
+
+
+def stream_backlinks(target, limit, budget, outdir, fmt):
+    """Top backlinks page par page, sans tout garder en mémoire."""
+    ext = "parquet" if fmt == "parquet" else "csv"
+    path = Path(outdir) / f"ahrefs_backlinks_{target}.{ext}"
+    sink = RowSink(path, BACKLINK_FIELDS, fmt)
+    try:
+        offset = 0
+        while offset < limit:
+            size = min(BACKLINKS_PAGE, limit - offset)
+            units = max(MIN_UNITS_PER_REQUEST, size * len(BACKLINK_FIELDS))
+            page = call("/site-explorer/all-backlinks", {
+                "target": target, "mode": MODE, "limit": size, "offset": offset,
+                "select": ",".join(BACKLINK_FIELDS), "order_by": "domain_rating_source:desc",
+            }, budget, units=units).get("backlinks") or []
+            sink.write(page)
+            if len(page) < size:
+                break
+            offset += size
+    finally:
+        sink.close()
+    return str(path), sink.rows
+
+
+# -- une cible ----------------------------------------------------------------
+
+def check_target(target, role, args, budget, day):
+    started = time.monotonic()
+    data, cached = fetch_metrics(target, budget, day, force=args.force)
+    result = {
+        "target": target,
+        "role": role,
+        "cached": cached,
+        "domain_rating": data.get("domain_rating"),
+        "backlinks": data.get("backlinks"),
+        "ref_domains": data.get("ref_domains"),
+        "metrics": data,
+    }
+    if args.backlinks:
+        result["backlinks_file"], result["backlinks_rows"] = stream_backlinks(
+            target, args.backlinks, budget, args.outdir, args.format)
+    print(f"OK {target} ({role}) en {time.monotonic() - started:.1f}s{' [cache]' if cached else ''}")
+    return result
+
+
+def read_list(value=None, path=None):
+    items = []
+    if value:
+        items += value.split(",")
+    if path:
+        with open(path) as f:
+            items += [line for line in f.read().splitlines() if not line.startswith("#")]
+    return [normalize(i) for i in items if normalize(i)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ahrefs v3 : métriques + backlinks pour le site et ses concurrents")
+    parser.add_argument("--targets", default=os.environ.get("TPS_DOMAIN", ""), help="domaines, séparés par des virgules")
+    parser.add_argument("--targets-file", help="un domaine par ligne")
+    parser.add_argument("--competitors", default=os.environ.get("TPS_COMPETITORS", ""), help="concurrents, séparés par des virgules")
+    parser.add_argument("--competitors-file")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backlinks", type=int, default=0, help="top N backlinks par cible (0 = désactivé)")
+    parser.add_argument("--unit-budget", type=int, default=int(os.environ.get("AHREFS_UNIT_BUDGET", "0")) or None,
+                        help="plafond d'unités pour cette exécution")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--outdir", default="out")
+    parser.add_argument("--force", action="store_true", default=os.environ.get("AHREFS_FORCE") == "1",
+                        help="ignorer le cache du jour")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not _HAS_PYARROW:
+        print("WARN pyarrow absent : backlinks écrits en CSV")
+        args.format = "csv"
+
+    targets = [(t, "site") for t in read_list(args.targets, args.targets_file)]
+    targets += [(t, "competitor") for t in read_list(args.competitors, args.competitors_file)
+                if t not in {s for s, _ in targets}]
+    if not targets:
+        print("ERR aucune cible (TPS_DOMAIN ou --targets)")
+        return 2
+
+    os.makedirs(args.outdir, exist_ok=True)
+    day = date.today()
+    limit = args.unit_budget
+    remaining = remaining_units()
+    if remaining is not None:
+        limit = remaining if limit is None else min(limit, remaining)
+    budget = UnitBudget(limit)
+
+    results, errors = [], {}
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(check_target, t, role, args, budget, day): t for t, role in targets}
+        for future, target in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors[target] = str(e)
+                print(f"ERR {target}: {e}")
+
+    fetched_at = int(time.time())
+    fields = ["target", "role", "domain_rating", "backlinks", "ref_domains"]
+    with open(f"{args.outdir}/ahrefs_batch.json", "w") as f:
+        json.dump({"fetched_at": fetched_at, "units_spent_estimate": budget.spent,
+                   "targets": results, "errors": errors}, f, indent=2)
+    with open(f"{args.outdir}/ahrefs_batch.csv", "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore"); w.writeheader(); w.writerows(results)
+
+    # Compatibilité : fichiers historiques pour le site principal
+    primary = next((r for r in results if r["role"] == "site"), None)
+    if primary:
+        with open(f"{args.outdir}/ahrefs_metrics.json", "w") as f:
+            json.dump({"target": primary["target"], "fetched_at": fetched_at, "metrics": primary["metrics"]}, f, indent=2)
+        row = {"domain": primary["target"], "domain_rating": primary["domain_rating"],
+               "backlinks": primary["backlinks"], "ref_domains": primary["ref_domains"]}
+        with open(f"{args.outdir}/ahrefs_metrics.csv", "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=row.keys()); w.writeheader(); w.writerow(row)
+
+        # Historique local : une ligne par jour pour le site principal
+        history = HistoryStore()
+        history.upsert("ahrefs", pd.DataFrame([dict(row, date=day.isoformat())]))
+        history.set_watermark("ahrefs", day)
+
+    # Entrepôt : les concurrents (le site principal y arrive via l'historique)
+    competitors = [to_long("ahrefs", day, {k: r[k] for k in ("domain_rating", "backlinks", "ref_domains")},
+                           dimensions={"domain": r["target"]})
+                   for r in results if r["role"] == "competitor"]
+    if competitors:
+        MetricsWarehouse().write(pd.concat(competitors, ignore_index=True))
+
+    print(f"OK: {len(results)}/{len(targets)} cibles, ~{budget.spent} unités → {args.outdir}/ahrefs_batch.json")
+    return 2 if not results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Shopify bulk-operation API
+============================================
+
+Serves just enough of the Admin GraphQL API for the bulk export mode of
+``export_shopify_metrics.py`` to run end-to-end offline:
+
+- ``bulkOperationRunQuery`` returns a CREATED operation (``--lost-submits N``:
+  the first N submits start the operation but answer 503, like a reply lost
+  on the way back),
+- ``currentBulkOperation`` reports RUNNING for a few polls, then COMPLETED,
+- the result URL streams either a canned JSONL file or N synthetic orders.
+
+Usage:
+    python3 scripts/shopify_bulk_stub.py --port 8765 --orders 2000000
+    python3 scripts/export_shopify_metrics.py --mode bulk \\
+        --api-base http://127.0.0.1:8765/admin/api/2025-01/ \\
+        --domain stub --token stub --outdir report_data \\
+        --since 2024-01-01 --until 2024-12-31
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OPERATION_ID = "gid://shopify/BulkOperation/1"
+
+
+def synthetic_lines(count: int, start: datetime, days: int, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(count):
+        created = start + timedelta(days=i % days, seconds=rng.randint(0, 86399))
+        record = {
+            "id": f"gid://shopify/Order/{i + 1}",
+            "createdAt": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "totalPriceSet": {"shopMoney": {"amount": f"{rng.uniform(15, 180):.2f}"}},
+            "totalRefundedSet": {"shopMoney": {"amount": "0.0" if rng.random() > 0.05 else "10.00"}},
+        }
+        yield (json.dumps(record) + "\n").encode()
+
+
+def make_handler(args):
+    state = {"polls": 0, "submits": 0, "query": None, "created_at": None}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def _json(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            query = body.get("query", "")
+            if "bulkOperationRunQuery" in query:
+                state["polls"] = 0
+                state["submits"] += 1
+                state["query"] = (body.get("variables") or {}).get("query")
+                state["created_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                if state["submits"] <= args.lost_submits:
+                    self.send_error(503, "reply lost")
+                    return
+                self._json({"data": {"bulkOperationRunQuery": {
+                    "bulkOperation": {"id": OPERATION_ID, "status": "CREATED"}, "userErrors": []}}})
+            elif "currentBulkOperation" in query:
+                state["polls"] += 1
+                done = state["polls"] > args.running_polls
+                host = self.headers.get("Host")
+                self._json({"data": {"currentBulkOperation": {
+                    "id": OPERATION_ID,
+                    "status": "COMPLETED" if done else "RUNNING",
+                    "errorCode": None,
+                    "objectCount": str(args.orders),
+                    "url": f"http://{host}/bulk/result.jsonl" if done else None,
+                    "partialDataUrl": None,
+                    "query": state["query"],
+                    "createdAt": state["created_at"],
+                }}})
+            else:
+                self.send_error(400, "unsupported query")
+
+        def do_GET(self):
+            if not self.path.startswith("/bulk/result.jsonl"):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.end_headers()
+            if args.jsonl:
+                with open(args.jsonl, "rb") as fh:
+                    for line in fh:
+                        self.wfile.write(line)
+            else:
+                start = datetime.strptime(args.start, "%Y-%m-%d")
+                for line in synthetic_lines(args.orders, start, args.days):
+                    self.wfile.write(line)
+
+        def log_message(self, fmt, *a):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--jsonl", help="serve this canned JSONL file instead of synthetic orders")
+    parser.add_argument("--orders", type=int, default=10000, help="synthetic order count")
+    parser.add_argument("--start", default="2024-01-01", help="first synthetic order day")
+    parser.add_argument("--days", type=int, default=365, help="days spanned by synthetic orders")
+    parser.add_argument("--running-polls", type=int, default=2, help="polls reporting RUNNING before COMPLETED")
+    parser.add_argument("--lost-submits", type=int, default=0, help="submits answered 503 after starting the operation")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    print(f"🧪 Shopify bulk stub listening on http://127.0.0.1:{args.port}/admin/api/2025-01/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
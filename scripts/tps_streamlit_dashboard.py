@@ -2,9 +2,16 @@ import os
 import pandas as pd
 import streamlit as st
 
+from utils.period_compare import PeriodComparison, format_pct
+from utils.warehouse import MetricsWarehouse
+
 BASE_DIR = "report_data"
 
 def load_kv(name):
+    # Entrepôt d'abord (mêmes libellés que le rapport PDF), CSV sinon
+    stored = MetricsWarehouse().labelled(name.replace("_metrics.csv", ""))
+    if stored:
+        return stored
     path = os.path.join(BASE_DIR, name)
     if not os.path.exists(path):
         return {}
@@ -15,6 +22,18 @@ def load_kv(name):
         return dict(zip(df["Metric"], df["Value"]))
     return {}
 
+def load_deltas(*sources):
+    # Variations vs semaine précédente, mêmes calculs que les rapports HTML / PDF
+    try:
+        comparison = PeriodComparison.from_warehouse()
+    except Exception:
+        return {source: {} for source in sources}
+    return {source: comparison.labelled(source) for source in sources}
+
+def delta(deltas, label):
+    pct = deltas.get(label)
+    return None if pct is None else format_pct(pct, " vs S-1")
+
 def main():
     st.set_page_config(page_title="TPS Business Dashboard", layout="wide")
 
@@ -33,14 +52,19 @@ def main():
     gsc = load_kv("gsc_metrics.csv")
     social = load_kv("social_metrics.csv")
 
+    deltas = load_deltas("shopify", "ga4")
+
     # Ligne KPI principale
     c1, c2, c3, c4 = st.columns(4)
     with c1:
-        st.metric("CA Shopify (7j)", shopify.get("Revenue (7d)", "N/A"))
+        st.metric("CA Shopify (7j)", shopify.get("Revenue (7d)", "N/A"),
+                  delta(deltas["shopify"], "Revenue (7d)"))
     with c2:
-        st.metric("Conversions (7j)", shopify.get("Conversions (7d)", "N/A"))
+        st.metric("Conversions (7j)", shopify.get("Conversions (7d)", "N/A"),
+                  delta(deltas["shopify"], "Conversions (7d)"))
     with c3:
-        st.metric("Sessions GA4 (7j)", ga4.get("Sessions (7d)", "N/A"))
+        st.metric("Sessions GA4 (7j)", ga4.get("Sessions (7d)", "N/A"),
+                  delta(deltas["ga4"], "Sessions (7d)"))
     with c4:
         st.metric("ROAS Meta (7j)", meta.get("ROAS (7d)", "N/A"))
 
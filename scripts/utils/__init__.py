@@ -0,0 +1,7 @@
+"""
+Shared helpers for the TPS-STAR reporting scripts
+=================================================
+
+Modules in this package are imported by the scripts in ``scripts/`` (run as
+``python scripts/<name>.py``, which puts ``scripts/`` on ``sys.path``).
+"""
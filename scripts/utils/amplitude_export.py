@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Streaming Amplitude Export Decoder
+==================================
+
+Amplitude's ``/api/2/export`` answers with a zip archive of hourly
+``*.json.gz`` files, each gzipped newline-delimited JSON. The archive grows
+with traffic, so nothing here buffers it:
+
+- zip members are parsed from their local headers as the bytes arrive
+  (no central directory, no seeking, no temp file); a stored member whose
+  size only follows it in a data descriptor ends at the first descriptor
+  whose CRC-32 and size match the bytes before it,
+- each member is inflated and gunzipped incrementally,
+- events are parsed one line at a time and folded into
+  :class:`EventAggregates` (event counts, unique users, funnel, per day).
+
+Memory is bounded by one network chunk plus the aggregates (which grow with
+distinct users and event types, never with the number of events).
+
+Usage:
+    from utils.amplitude_export import fetch_export_aggregates
+
+    aggregates = fetch_export_aggregates(api_key, secret_key, start, end)
+    aggregates.as_dict()
+"""
+
+import base64
+import json
+import struct
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from utils.http_transport import HTTPTransport, get_transport
+
+EXPORT_URL = "https://amplitude.com/api/2/export"
+READ_CHUNK_SIZE = 64 * 1024
+
+# Ordered funnel: (output key, Amplitude event_type)
+FUNNEL_STEPS = [
+    ('product_views', 'Product View'),
+    ('add_to_cart', 'Add to Cart'),
+    ('begin_checkout', 'Begin Checkout'),
+    ('purchase', 'Purchase'),
+]
+
+_LOCAL_HEADER = b'PK\x03\x04'
+_CENTRAL_HEADER = b'PK\x01\x02'
+_END_OF_CENTRAL = b'PK\x05\x06'
+_DATA_DESCRIPTOR = b'PK\x07\x08'
+
+
+class ExportFormatError(ValueError):
+    """Raised when the export stream is not a zip of (gzipped) NDJSON."""
+
+
+class _ByteStream:
+    """Pull-style reader over an iterator of byte chunks, with push-back."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def _fill(self, n: int) -> bool:
+        while len(self._buffer) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._buffer += chunk
+        return True
+
+    def read_exact(self, n: int) -> bytes:
+        if not self._fill(n):
+            raise ExportFormatError('truncated zip stream')
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def peek(self, n: int) -> bytes:
+        self._fill(n)
+        return self._buffer[:n]
+
+    def read_some(self) -> bytes:
+        if not self._buffer and not self._fill(1):
+            return b''
+        data, self._buffer = self._buffer, b''
+        return data
+
+    def unread(self, data: bytes):
+        self._buffer = data + self._buffer
+
+
+def _stored_chunks(stream: _ByteStream, size: int) -> Iterator[bytes]:
+    while size > 0:
+        chunk = stream.read_some()
+        if not chunk:
+            raise ExportFormatError('truncated stored zip member')
+        if len(chunk) > size:
+            stream.unread(chunk[size:])
+            chunk = chunk[:size]
+        size -= len(chunk)
+        yield chunk
+
+
+def _descriptor_matches(raw: bytes, crc: int, size: int) -> bool:
+    """Does ``raw`` (from a descriptor signature on) describe ``crc`` and ``size``, followed by a header?"""
+    for layout, length in (('<III', 16), ('<IQQ', 24)):  # zip64 descriptors carry 8-byte sizes
+        descriptor_crc, compressed, uncompressed = struct.unpack_from(layout, raw, 4)
+        if (descriptor_crc == crc and compressed == uncompressed == size
+                and raw[length:length + 4] in (_LOCAL_HEADER, _CENTRAL_HEADER)):
+            return True
+    return False
+
+
+def _stored_descriptor_chunks(stream: _ByteStream) -> Iterator[bytes]:
+    """Stored member of unknown size: everything up to its data descriptor.
+
+    The signature alone could occur in the data, so a candidate is accepted
+    only when its CRC-32 and sizes match the bytes before it and the next
+    zip header follows it. The descriptor itself is left in the stream.
+    """
+    crc, size, pending = 0, 0, b''
+    while True:
+        chunk = stream.read_some()
+        if not chunk:
+            raise ExportFormatError('truncated stored zip member')
+        data = pending + chunk
+        # Hold back a possible signature split across chunks
+        keep = max(len(data) - (len(_DATA_DESCRIPTOR) - 1), 0)
+        at = data.find(_DATA_DESCRIPTOR)
+        while at >= 0:
+            if len(data) - at < 28:
+                # Not enough bytes to check a (zip64) descriptor and the next header yet
+                keep = min(keep, at)
+                break
+            body = data[:at]
+            if _descriptor_matches(data[at:at + 28], zlib.crc32(body, crc), size + len(body)):
+                if body:
+                    yield body
+                stream.unread(data[at:])
+                return
+            at = data.find(_DATA_DESCRIPTOR, at + 1)
+        out, pending = data[:keep], data[keep:]
+        if out:
+            crc, size = zlib.crc32(out, crc), size + len(out)
+            yield out
+
+
+def _deflated_chunks(stream: _ByteStream) -> Iterator[bytes]:
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    while not inflater.eof:
+        chunk = stream.read_some()
+        if not chunk:
+            raise ExportFormatError('truncated deflated zip member')
+        data = inflater.decompress(chunk)
+        if data:
+            yield data
+    # Bytes past the end of this member belong to the next header
+    if inflater.unused_data:
+        stream.unread(inflater.unused_data)
+
+
+def iter_zip_members(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Iterator[bytes]]]:
+    """Yield ``(name, data_chunks)`` per zip member, reading local headers only.
+
+    Each member's chunks must be consumed (or drained) before advancing.
+    """
+    stream = _ByteStream(chunks)
+    while True:
+        signature = stream.peek(4)
+        if signature in (b'', _CENTRAL_HEADER, _END_OF_CENTRAL):
+            return
+        if signature != _LOCAL_HEADER:
+            raise ExportFormatError('not a zip archive')
+        (_, _, flags, method, _, _, _, compressed_size, _,
+         name_len, extra_len) = struct.unpack('<4sHHHHHIIIHH', stream.read_exact(30))
+        name = stream.read_exact(name_len).decode('utf-8', 'replace')
+        stream.read_exact(extra_len)
+        has_descriptor = bool(flags & 0x08)
+
+        if method == 8:
+            data = _deflated_chunks(stream)
+        elif method == 0 and has_descriptor:
+            data = _stored_descriptor_chunks(stream)
+        elif method == 0:
+            data = _stored_chunks(stream, compressed_size)
+        else:
+            raise ExportFormatError(f'unsupported zip member {name} (method {method})')
+
+        yield name, data
+        for _ in data:  # drain whatever the caller left unread
+            pass
+
+        if has_descriptor:
+            # Optional signature, CRC-32, sizes (zip64 descriptors carry 8-byte sizes)
+            if stream.peek(4) == _DATA_DESCRIPTOR:
+                stream.read_exact(4)
+            stream.read_exact(12)
+            if stream.peek(4) not in (_LOCAL_HEADER, _CENTRAL_HEADER, _END_OF_CENTRAL, b''):
+                stream.read_exact(8)
+
+
+def gunzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Incrementally gunzip a (possibly multi-member) gzip stream."""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                chunk = b''
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def iter_export_events(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """Parse every event of an export stream, one line at a time."""
+    for name, data in iter_zip_members(chunks):
+        if name.endswith('/'):
+            continue
+        payload = gunzip_chunks(data) if name.endswith('.gz') else data
+        for line in iter_lines(payload):
+            yield json.loads(line)
+
+
+class EventAggregates:
+    """Running aggregates over a stream of Amplitude events."""
+
+    def __init__(self, funnel_steps: List[Tuple[str, str]] = None):
+        self.funnel_steps = funnel_steps or FUNNEL_STEPS
+        self._step_bit = {event: 1 << i for i, (_, event) in enumerate(self.funnel_steps)}
+        self.events = 0
+        self.event_counts: Counter = Counter()
+        self.daily_events: Counter = Counter()
+        # user -> bitmask of funnel steps seen (doubles as the unique-user set)
+        self.users: Dict[Any, int] = {}
+
+    def add(self, event: Dict[str, Any]):
+        self.events += 1
+        event_type = event.get('event_type') or '(unknown)'
+        self.event_counts[event_type] += 1
+        day = (event.get('event_time') or '')[:10]
+        if day:
+            self.daily_events[day] += 1
+        user = event.get('amplitude_id') or event.get('user_id') or event.get('device_id')
+        if user is not None:
+            self.users[user] = self.users.get(user, 0) | self._step_bit.get(event_type, 0)
+
+    def add_all(self, events: Iterable[Dict[str, Any]]) -> 'EventAggregates':
+        for event in events:
+            self.add(event)
+        return self
+
+    def funnel(self) -> Dict[str, int]:
+        """Users who reached each step having also done every earlier step."""
+        counts = dict.fromkeys((key for key, _ in self.funnel_steps), 0)
+        keys = [key for key, _ in self.funnel_steps]
+        for mask in self.users.values():
+            for i, key in enumerate(keys):
+                if not mask & (1 << i):
+                    break
+                counts[key] += 1
+        return counts
+
+    def as_dict(self, top_n: int = 10) -> Dict[str, Any]:
+        return {
+            'events_tracked': self.events,
+            'unique_users': len(self.users),
+            'top_events': [{'event': name, 'count': count}
+                           for name, count in self.event_counts.most_common(top_n)],
+            'conversion_funnel': self.funnel(),
+            'daily_events': [{'date': day, 'count': self.daily_events[day]}
+                             for day in sorted(self.daily_events)],
+        }
+
+
+def fetch_export_aggregates(api_key: str, secret_key: str, start: datetime, end: datetime,
+                            transport: HTTPTransport = None, url: str = EXPORT_URL,
+                            funnel_steps: List[Tuple[str, str]] = None) -> EventAggregates:
+    """Stream ``/export`` for ``[start, end]`` (hour resolution) into aggregates."""
+    transport = transport or get_transport()
+    credentials = base64.b64encode(f"{api_key}:{secret_key}".encode()).decode()
+    params = {'start': start.strftime('%Y%m%dT%H'), 'end': end.strftime('%Y%m%dT%H')}
+    response = transport.request('GET', url, params=params, stream=True, timeout=300,
+                                 headers={'Authorization': f'Basic {credentials}'}, provider='amplitude')
+    aggregates = EventAggregates(funnel_steps)
+    try:
+        if response.status_code == 404:
+            # Amplitude answers 404 when the range holds no data
+            return aggregates
+        response.raise_for_status()
+        return aggregates.add_all(iter_export_events(response.iter_content(chunk_size=READ_CHUNK_SIZE)))
+    finally:
+        response.close()
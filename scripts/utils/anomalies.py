@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Batch Anomaly Detection
+=======================
+
+Scores every stored daily series at once (dates x series NumPy matrix)
+with three independent detectors, each a robust z-score of the latest days
+against the history before them:
+
+- ``z_mad``     distance to the trailing 28-day median, in MADs
+- ``z_ewma``    distance to the EWMA control line, in EW standard deviations
+- ``z_season``  residual vs the same weekday of the 4 previous weeks, in
+  MADs of the recent residuals (weekly seasonality removed)
+
+A point is an anomaly when at least two detectors agree: its ``score`` is the
+second-highest of the three absolute z-scores. Severity grows with the score
+(``medium`` >= 3.5, ``high`` >= 6, ``critical`` >= 10).
+
+Usage:
+    from utils.anomalies import detect_anomalies
+
+    detect_anomalies(as_of=date(2026, 10, 11))
+    #         date  source market    metric   value  expected  score  direction  severity
+    # 0 2026-10-09  sentry    all    errors   412.0      31.0   14.2      spike  critical
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.warehouse import DEFAULT_MARKET, SNAPSHOT_SOURCES, MetricsWarehouse
+
+WINDOW_DAYS = 28
+MIN_HISTORY_DAYS = 7
+SEASON_WEEKS = 4
+EWMA_ALPHA = 0.3
+THRESHOLD = 3.5
+MAD_TO_SIGMA = 1.4826
+MIN_RELATIVE_SCALE = 0.05   # deviations under 5% of the level are never anomalous
+
+SEVERITIES = [('critical', 10.0), ('high', 6.0), ('medium', THRESHOLD)]
+SEVERITY_RANK = {name: rank for rank, (name, _) in enumerate(SEVERITIES)}
+
+DateLike = Union[str, date, datetime]
+
+
+def _nanmedian(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Median ignoring NaN; sort-based, much faster than ``np.nanmedian`` on large stacks."""
+    ordered = np.sort(np.moveaxis(values, axis, -1), axis=-1)   # NaN sort last
+    valid = (~np.isnan(ordered)).sum(axis=-1, keepdims=True)
+    low = np.take_along_axis(ordered, np.maximum(valid - 1, 0) // 2, axis=-1)
+    high = np.take_along_axis(ordered, valid // 2, axis=-1)
+    median = ((low + high) / 2)[..., 0]
+    return np.where(valid[..., 0] > 0, median, np.nan)
+
+
+def _robust_z(values: np.ndarray, history: np.ndarray):
+    """z of ``values`` (K x N) against ``history`` windows (K x N x W), median/MAD based."""
+    center = _nanmedian(history)
+    mad = _nanmedian(np.abs(history - center[..., None])) * MAD_TO_SIGMA
+    scale = np.fmax(mad, MIN_RELATIVE_SCALE * np.abs(center))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (values - center) / scale
+    # A flat history (scale 0) gives no basis to judge a change
+    return np.where(scale > 0, z, np.nan), center
+
+
+def _ewma(values: np.ndarray, alpha: float):
+    """Exponentially weighted mean and variance after each row (T x N); gaps keep the last state."""
+    mean = np.full(values.shape, np.nan)
+    var = np.full(values.shape, np.nan)
+    m = values[0].copy()
+    v = np.where(np.isnan(m), np.nan, 0.0)
+    mean[0], var[0] = m, v
+    for t in range(1, len(values)):
+        x = values[t]
+        fresh = np.isnan(m) & ~np.isnan(x)
+        m = np.where(fresh, x, m)
+        v = np.where(fresh, 0.0, v)
+        diff = x - m
+        seen = ~np.isnan(x) & ~fresh
+        v = np.where(seen, (1 - alpha) * (v + alpha * diff * diff), v)
+        m = np.where(seen, m + alpha * diff, m)
+        mean[t], var[t] = m, v
+    return mean, var
+
+
+class AnomalyDetector:
+    """Vectorized median/MAD, EWMA and weekly-seasonality detectors."""
+
+    def __init__(self, window: int = WINDOW_DAYS, threshold: float = THRESHOLD, alpha: float = EWMA_ALPHA,
+                 min_history: int = MIN_HISTORY_DAYS):
+        self.window = window
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_history = min_history
+
+    def score(self, matrix: pd.DataFrame, recent: int = 7) -> pd.DataFrame:
+        """z-scores of the last ``recent`` rows of a dates x series frame (daily, gap-free index).
+
+        Returns one row per scored point: ``date, series, value, expected,
+        z_mad, z_ewma, z_season, score``.
+        """
+        values = matrix.to_numpy(dtype=float)
+        total, count = values.shape
+        recent = min(recent, total - self.min_history)
+        if recent <= 0 or count == 0:
+            return pd.DataFrame(columns=['date', 'series', 'value', 'expected', 'z_mad', 'z_ewma',
+                                         'z_season', 'score'])
+        window = min(self.window, total - recent)
+        first = total - recent
+        current = values[first:]
+
+        # 1) Trailing median / MAD (history excludes the point itself)
+        history = sliding_window_view(values[first - window:total - 1], window, axis=0)
+        z_mad, expected = _robust_z(current, history)
+
+        # 2) EWMA control limits, as of the day before
+        mean, var = _ewma(values, self.alpha)
+        mean = mean[first - 1:total - 1]
+        std = np.sqrt(var[first - 1:total - 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.fmax(std, MIN_RELATIVE_SCALE * np.abs(mean))
+            z_ewma = np.where(std > 0, (current - mean) / std, np.nan)
+
+        # 3) Weekly seasonality: residual vs the same weekday of previous weeks
+        lags = [np.roll(values, 7 * k, axis=0) for k in range(1, SEASON_WEEKS + 1)]
+        for k, lagged in enumerate(lags, start=1):
+            lagged[:7 * k] = np.nan
+        seasonal = _nanmedian(np.stack(lags), axis=0)
+        residuals = values - seasonal
+        history = sliding_window_view(residuals[first - window:total - 1], window, axis=0)
+        mad = _nanmedian(np.abs(history - _nanmedian(history)[..., None]))
+        scale = np.fmax(mad * MAD_TO_SIGMA, MIN_RELATIVE_SCALE * np.abs(seasonal[first:]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_season = np.where(scale > 0, residuals[first:] / scale, np.nan)
+
+        # Too little history before a point: no score at all
+        seen = np.cumsum(~np.isnan(values), axis=0)[first - 1:total - 1]
+        enough = seen >= self.min_history
+
+        # Score = the level at least two detectors agree on (second-highest |z|)
+        stacked = np.abs(np.stack([z_mad, z_ewma, z_season]))
+        combined = np.sort(np.where(np.isfinite(stacked), stacked, -np.inf), axis=0)[-2]
+        combined = np.where(enough & np.isfinite(combined), combined, np.nan)
+
+        # Expected value: the seasonal baseline when there is one, else the trailing median
+        expected = np.where(np.isfinite(seasonal[first:]), seasonal[first:], expected)
+
+        scored = pd.DataFrame({
+            'date': np.repeat(matrix.index[first:], count),
+            'series': np.tile(np.arange(count), recent),
+            'value': current.ravel(),
+            'expected': expected.ravel(),
+            'z_mad': z_mad.ravel(),
+            'z_ewma': z_ewma.ravel(),
+            'z_season': z_season.ravel(),
+            'score': combined.ravel(),
+        })
+        return scored[~np.isnan(scored['value'].to_numpy())].reset_index(drop=True)
+
+    def detect(self, matrix: pd.DataFrame, recent: int = 7) -> pd.DataFrame:
+        """Ranked anomalies among the last ``recent`` days, most severe first.
+
+        ``matrix`` columns become the identifying columns of the result
+        (a MultiIndex ``(source, market, metric)`` gives one column each).
+        """
+        scored = self.score(matrix, recent)
+        flagged = scored[scored['score'] >= self.threshold].drop(columns='series')
+        keys = matrix.columns[scored.loc[flagged.index, 'series'].to_numpy()]
+        if isinstance(keys, pd.MultiIndex):
+            for level, name in enumerate(keys.names):
+                flagged[name or f'level_{level}'] = keys.get_level_values(level)
+        else:
+            flagged['series'] = keys
+        flagged['direction'] = np.where(flagged['value'] >= flagged['expected'], 'spike', 'drop')
+        flagged['severity'] = np.select([flagged['score'] >= limit for _, limit in SEVERITIES],
+                                        [name for name, _ in SEVERITIES], default='medium')
+        flagged['_rank'] = flagged['severity'].map(SEVERITY_RANK)
+        ranked = flagged.sort_values(['_rank', 'score'], ascending=[True, False]).drop(columns='_rank')
+        return ranked.reset_index(drop=True)
+
+
+def daily_matrix(frame: pd.DataFrame, end: Optional[DateLike] = None) -> pd.DataFrame:
+    """Long rows -> gap-free dates x (source, market, metric) matrix."""
+    frame = frame.assign(market=frame['market'].fillna(DEFAULT_MARKET))
+    wide = frame.pivot_table(index='date', columns=['source', 'market', 'metric'], values='value', aggfunc='last')
+    wide.index = pd.to_datetime(wide.index)
+    last = pd.Timestamp(end) if end is not None else wide.index.max()
+    return wide.reindex(pd.date_range(wide.index.min(), last))
+
+
+def detect_anomalies(warehouse: MetricsWarehouse = None, as_of: Optional[DateLike] = None, recent: int = 7,
+                     lookback: int = 120, detector: AnomalyDetector = None) -> pd.DataFrame:
+    """Ranked anomalies of every stored daily series over the ``recent`` days up to ``as_of``."""
+    warehouse = warehouse or MetricsWarehouse()
+    end = pd.Timestamp(as_of or date.today()).normalize()
+    frame = warehouse.read(start=end - timedelta(days=lookback), end=end, dimensions='',
+                           columns=['date', 'source', 'market', 'metric', 'value'])
+    # Snapshot sources move in steps, not daily noise
+    frame = frame[~frame['source'].isin(SNAPSHOT_SOURCES)]
+    if frame.empty:
+        return pd.DataFrame()
+    return (detector or AnomalyDetector()).detect(daily_matrix(frame, end), recent)
+
+
+def describe(anomaly: pd.Series) -> str:
+    """One-line summary of an anomaly row."""
+    when = pd.Timestamp(anomaly['date']).strftime('%Y-%m-%d')
+    name = anomaly.get('metric', anomaly.get('series'))
+    if 'source' in anomaly:
+        name = f"{anomaly['source']} {name}"
+    if anomaly.get('market', DEFAULT_MARKET) != DEFAULT_MARKET:
+        name = f"{name} [{anomaly['market']}]"
+    return (f"{name} {anomaly['direction']} on {when}: {anomaly['value']:,.0f} "
+            f"vs ~{anomaly['expected']:,.0f} expected (score {anomaly['score']:.1f}, {anomaly['severity']})")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+HTTP Record / Replay Cassettes
+==============================
+
+Hooks into :class:`utils.http_transport.HTTPTransport` so every connector,
+exporter and the weekly report can be run offline against real responses.
+
+- ``record``: live requests are made as usual; each final response is
+  written to the cassette (status, headers, body bytes, time to headers).
+- ``replay``: no network at all; responses are served from the cassette
+  byte for byte, after sleeping the recorded latency (scaled by
+  ``TPS_REPLAY_LATENCY``, 0 = instant). Bodies stream from disk, so large
+  exports replay in bounded memory too.
+
+Layout of a cassette directory::
+
+    index.json          {match key: [entry, ...]} in recorded order
+    bodies/<sha256>     response bodies, content-addressed
+    meta.json           recording time + the env vars the run used (secrets blanked)
+
+Requests are matched on method, URL, query parameters and body (secrets
+redacted). A replay made on another day asks for other dates, so an exact
+miss falls back to the next unused recording of the same endpoint.
+
+Usage:
+    python scripts/http_cassette.py record cassettes/weekly scripts/generate_weekly_report.py
+    python scripts/http_cassette.py replay cassettes/weekly scripts/generate_weekly_report.py
+
+Environment (set by http_cassette.py):
+    TPS_HTTP_CASSETTE=<dir>  TPS_HTTP_MODE=record|replay  TPS_REPLAY_LATENCY=1.0
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+READ_CHUNK_SIZE = 64 * 1024
+
+_SECRET_NAME = re.compile(r'(secret|token|key|password|auth)', re.I)
+_SECRET_BODY_KEYS = ('access_token', 'refresh_token', 'id_token')
+_DROPPED_HEADERS = ('set-cookie', 'content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """Replay found no recording for a request (behaves like being offline)."""
+
+
+class _BodyFile:
+    """``response.raw`` for a cassette body: reads from disk, closes itself at EOF.
+
+    Callers rarely close responses they have read (``.json()``, ``.content``),
+    so the file must not outlive the last chunk.
+    """
+
+    def __init__(self, path: Path):
+        self._fh = open(path, 'rb')
+
+    @property
+    def closed(self) -> bool:
+        return self._fh.closed
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if self._fh.closed:
+            return b''
+        data = self._fh.read(size)
+        if size is None or size < 0 or len(data) < size:
+            self._fh.close()
+        return data
+
+    def close(self):
+        self._fh.close()
+
+
+def _redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: ('***' if _SECRET_NAME.search(str(k)) else _redact(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+def _split_url(url: str) -> Tuple[str, Dict[str, Any]]:
+    """URL without query string + its query parameters."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', '')), dict(parse_qsl(parts.query))
+
+
+class Cassette:
+    """One cassette directory, in ``record`` or ``replay`` mode."""
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"unknown cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._used: set = set()
+        self.replayed = 0
+        self.recorded = 0
+        if mode == 'replay':
+            try:
+                with open(self.path / 'index.json', 'r', encoding='utf-8') as fh:
+                    self._index = json.load(fh)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"cannot read cassette {self.path}: {e}")
+
+    # -- matching -------------------------------------------------------------
+
+    @staticmethod
+    def match_keys(method: str, url: str, params: Any = None, body: Any = None) -> Tuple[str, str]:
+        """``(exact key, endpoint key)`` for a request."""
+        base, query = _split_url(url)
+        query.update(params or {})
+        exact = json.dumps({'method': method.upper(), 'url': base, 'params': _redact(query),
+                            'body': _redact(body)}, sort_keys=True, default=str)
+        endpoint = f"{method.upper()} {base}"
+        return hashlib.sha256(exact.encode()).hexdigest(), endpoint
+
+    # -- record ---------------------------------------------------------------
+
+    def record(self, method: str, url: str, params: Any, body: Any,
+               response: requests.Response) -> requests.Response:
+        """Store ``response`` and return an equivalent one reading from the cassette."""
+        exact, endpoint = self.match_keys(method, url, params, body)
+        bodies = self.path / 'bodies'
+        bodies.mkdir(parents=True, exist_ok=True)
+
+        # Stream the body to disk (bounded memory), hashing as we go
+        digest = hashlib.sha256()
+        tmp = bodies / f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as fh:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                digest.update(chunk)
+                fh.write(chunk)
+        response.close()
+        body_name = digest.hexdigest()
+        os.replace(tmp, bodies / body_name)
+        self._redact_body(bodies / body_name, response.headers.get('Content-Type', ''))
+
+        entry = {
+            'method': method.upper(),
+            'url': _split_url(response.url or url)[0],
+            'endpoint': endpoint,
+            'status_code': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS},
+            'elapsed': response.elapsed.total_seconds() if response.elapsed else 0.0,
+            'body': body_name,
+        }
+        with self._lock:
+            self._index.setdefault(exact, []).append(entry)
+            self._write_index()
+            self.recorded += 1
+        return self._to_response(entry)
+
+    @staticmethod
+    def _redact_body(path: Path, content_type: str):
+        """Blank OAuth tokens in small JSON bodies (bodies stay valid JSON)."""
+        if 'json' not in content_type or path.stat().st_size > 1024 * 1024:
+            return
+        try:
+            payload = json.loads(path.read_bytes())
+        except ValueError:
+            return
+        if isinstance(payload, dict) and any(k in payload for k in _SECRET_BODY_KEYS):
+            for k in _SECRET_BODY_KEYS:
+                if k in payload:
+                    payload[k] = 'replay'
+            path.write_bytes(json.dumps(payload).encode())
+
+    def _write_index(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / f".index.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self._index, fh, indent=1, sort_keys=True)
+        os.replace(tmp, self.path / 'index.json')
+
+    def write_meta(self, env: Dict[str, Optional[str]]):
+        """Record which env vars the run had (values only for non-secret ones)."""
+        meta = {'recorded_at': datetime.now().isoformat(timespec='seconds'), 'env': env}
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / 'meta.json', 'w', encoding='utf-8') as fh:
+            json.dump(meta, fh, indent=2)
+
+    # -- replay ---------------------------------------------------------------
+
+    def _next_entry(self, exact: str, endpoint: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries = self._index.get(exact)
+            if entries:
+                i = self._cursor.get(exact, 0)
+                self._cursor[exact] = i + 1
+                entry = entries[min(i, len(entries) - 1)]
+                self._used.add(id(entry))
+                return entry
+            # Same endpoint, other parameters (e.g. replayed on another day)
+            for entries in self._index.values():
+                for entry in entries:
+                    if entry['endpoint'] == endpoint and id(entry) not in self._used:
+                        self._used.add(id(entry))
+                        return entry
+        return None
+
+    def replay(self, method: str, url: str, params: Any = None, body: Any = None) -> requests.Response:
+        exact, endpoint = self.match_keys(method, url, params, body)
+        entry = self._next_entry(exact, endpoint)
+        if entry is None:
+            raise CassetteMiss(f"no recording for {endpoint} in {self.path}")
+        if self.latency_scale > 0 and entry.get('elapsed'):
+            time.sleep(entry['elapsed'] * self.latency_scale)
+        with self._lock:
+            self.replayed += 1
+        return self._to_response(entry)
+
+    def _to_response(self, entry: Dict[str, Any]) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry['status_code']
+        response.headers = CaseInsensitiveDict(entry.get('headers') or {})
+        response.url = entry.get('url')
+        # Body streams from the cassette file: iter_content / json / content all work
+        response.raw = _BodyFile(self.path / 'bodies' / entry['body'])
+        response._content = False
+        response._content_consumed = False
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+        return response
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    """Cassette configured by TPS_HTTP_CASSETTE / TPS_HTTP_MODE (None when off)."""
+    path = os.getenv('TPS_HTTP_CASSETTE')
+    mode = os.getenv('TPS_HTTP_MODE', 'off').lower()
+    if not path or mode not in ('record', 'replay'):
+        return None
+    return Cassette(path, mode, latency_scale=float(os.getenv('TPS_REPLAY_LATENCY', '1.0')))
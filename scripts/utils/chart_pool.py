@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Chart Rendering Pool
+====================
+
+Renders independent figures (the weekly dashboards, the tracker pages of the
+PDF) in worker processes and collects what each one produced, in job order.
+The pool size follows :func:`utils.process_pool.pool_size`.
+
+Output does not depend on scheduling: placeholder series are drawn from the
+global NumPy RNG, so every job reseeds it with its own seed, derived from the
+job name and a base seed (usually the report date). A chart therefore gets
+the same data whether it runs first or last, in the parent or in a worker.
+
+Job functions must be module-level (workers are spawned) and return something
+picklable: the paths they wrote, or a matplotlib figure for the parent to
+place in a multi-page PDF.
+
+Spawning a worker costs an import of pandas, matplotlib and plotly, which is
+more than a tracker page takes to draw. The pool is therefore kept alive for
+the whole run: the dashboards and the PDF pages share warm workers.
+
+Usage:
+    from utils.chart_pool import chart_job, render_charts
+
+    jobs = [chart_job('kpi_dashboard', draw_chart, 'create_kpi_overview_chart', data, base_seed=20261011)]
+    for result in render_charts(jobs):
+        print(result['name'], result.get('output'), result.get('error'))
+
+Environment:
+    TPS_POOL_WORKERS=N           pool size (default: one per core)
+"""
+
+import atexit
+import multiprocessing
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.process_pool import pool_size
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+
+
+def chart_seed(name: str, base_seed: int) -> int:
+    """Stable per-chart seed (``hash()`` is salted per process, crc32 is not)."""
+    return zlib.crc32(f"{base_seed}:{name}".encode()) & 0xFFFFFFFF
+
+
+def chart_job(name: str, fn: Callable[..., Any], *args: Any, base_seed: Optional[int] = None) -> Dict[str, Any]:
+    """One figure to render: ``fn(*args)``, with the RNG seeded for ``name`` when ``base_seed`` is given."""
+    return {
+        'name': name,
+        'fn': fn,
+        'args': args,
+        'seed': chart_seed(name, base_seed) if base_seed is not None else None,
+    }
+
+
+def _render(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker: one job. Never raises; failures come back as ``error``."""
+    started = time.monotonic()
+    try:
+        if job['seed'] is not None:
+            np.random.seed(job['seed'])
+        output = job['fn'](*job['args'])
+        return {'name': job['name'], 'output': output, 'elapsed': round(time.monotonic() - started, 3)}
+    except Exception as e:
+        return {'name': job['name'], 'error': repr(e), 'elapsed': round(time.monotonic() - started, 3)}
+
+
+def _executor(size: int) -> ProcessPoolExecutor:
+    """The shared pool, with room for at least ``size`` workers (started on demand, reused until exit)."""
+    global _pool, _pool_size
+    if _pool is None or _pool_size < size:
+        shutdown()
+        _pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn'))
+        _pool_size = size
+    return _pool
+
+
+@atexit.register
+def shutdown():
+    """Stop the workers (also runs at interpreter exit)."""
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+    _pool, _pool_size = None, 0
+
+
+def render_charts(jobs: Sequence[Dict[str, Any]], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Results of every job, in job order: ``{'name', 'output', 'elapsed'}`` or ``{'name', 'error', 'elapsed'}``.
+
+    With a single worker (or a single job) everything runs in-process.
+    """
+    jobs = list(jobs)
+    size = pool_size(len(jobs), workers) if jobs else 1
+    if size == 1:
+        return [_render(job) for job in jobs]
+    return list(_executor(size).map(_render, jobs))
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Chart Specs
+===========
+
+Charts are described once, as plain data, and drawn by pluggable renderers
+instead of one hand-written copy per plotting library.
+
+A spec is a dict: ``name`` (file stem), ``title``, ``layout`` (grid and size
+in pixels), ``palette`` and ``panels``. A panel has a title and one or more
+series; series types are ``line``, ``bar``, ``barh``, ``histogram``, ``pie``
+and ``funnel``. A line with ``secondary=True`` goes on the panel's right axis.
+Series without a ``color`` take the next palette colour.
+
+Renderers:
+
+- :class:`PlotlyRenderer`: interactive HTML; PNG / PDF through Kaleido
+- :class:`MatplotlibRenderer`: PNG / PDF; its HTML embeds the PNG
+
+:func:`render_spec` tries the renderers in order, per output format: when
+Plotly fails (or Kaleido is missing for the static formats) the remaining
+formats come from Matplotlib.
+
+Rendered files are cached by a SHA-256 of the spec (data included) and the
+renderer chain (:class:`RenderCache`). A chart whose data did not change is
+copied from the cache instead of being drawn again, across weeks, markets
+and backfill runs. Total size is bounded; least-recently-used entries are
+evicted.
+
+Usage:
+    from utils.chart_spec import chart_spec, panel, series, render_spec
+
+    spec = chart_spec('sessions', 'Sessions', [
+        panel('Sessions Trend', series('line', x=days, y=sessions, name='Sessions')),
+    ], rows=1, cols=1, width=800, height=400)
+    render_spec(spec, 'reports/charts')                  # sessions.html, sessions.png
+
+Environment:
+    TPS_CHART_BACKEND=plotly             first renderer: plotly (default) or matplotlib
+    TPS_RENDER_CACHE=0                   disable the render cache
+    TPS_RENDER_CACHE_DIR=...             default ~/.cache/tps-star/charts
+    TPS_RENDER_CACHE_MAX_MB=256          size bound
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+try:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    _HAS_PLOTLY = True
+except Exception:
+    go = None
+    make_subplots = None
+    _HAS_PLOTLY = False
+
+# Bump when a renderer changes how the same spec looks (invalidates the cache)
+SPEC_VERSION = 1
+
+PALETTE = ['#2E86C1', '#28B463', '#E74C3C', '#F39C12', '#8E44AD', '#3498DB', '#E67E22', '#27AE60', '#9B59B6']
+SERIES_TYPES = ('line', 'bar', 'barh', 'histogram', 'pie', 'funnel')
+FORMATS = ('html', 'png', 'pdf')
+
+
+# -- specs -------------------------------------------------------------------
+
+def series(kind: str, **fields: Any) -> Dict[str, Any]:
+    """One series: ``x``/``y`` (line, bar, barh), ``values`` (+ ``labels``: pie, funnel; ``bins``: histogram)."""
+    if kind not in SERIES_TYPES:
+        raise ValueError(f"unknown series type {kind!r} (expected one of {', '.join(SERIES_TYPES)})")
+    return {'type': kind, **fields}
+
+
+def panel(title: str, *items: Dict[str, Any]) -> Dict[str, Any]:
+    return {'title': title, 'series': list(items)}
+
+
+def chart_spec(name: str, title: str, panels: Sequence[Dict[str, Any]], rows: int, cols: int,
+               width: int, height: int, palette: Sequence[str] = PALETTE, **layout: Any) -> Dict[str, Any]:
+    """A chart of ``rows`` x ``cols`` panels, ``width`` x ``height`` pixels (``layout``: e.g. ``font_size``)."""
+    return {
+        'name': name,
+        'title': title,
+        'layout': {'rows': rows, 'cols': cols, 'width': width, 'height': height, **layout},
+        'palette': list(palette),
+        'panels': list(panels),
+    }
+
+
+def _plain(value: Any) -> Any:
+    """Spec data as JSON-able builtins (numpy arrays and scalars included)."""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _colored(spec: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+    """Series of every panel, with palette colours filled in (in spec order)."""
+    palette = spec.get('palette') or PALETTE
+    index = 0
+    panels = []
+    for item in spec['panels']:
+        filled = []
+        for s in item['series']:
+            if not s.get('color') and not s.get('colors'):
+                s = {**s, 'color': palette[index % len(palette)]}
+            index += 1
+            filled.append(s)
+        panels.append(filled)
+    return panels
+
+
+# -- renderers ---------------------------------------------------------------
+
+class PlotlyRenderer:
+    """Interactive HTML; PNG / PDF need Kaleido."""
+
+    name = 'plotly'
+
+    @staticmethod
+    def available() -> bool:
+        return _HAS_PLOTLY
+
+    @staticmethod
+    def _trace(s: Dict[str, Any]):
+        color = s.get('colors') or s.get('color')
+        kind = s['type']
+        if kind == 'line':
+            return go.Scatter(x=s['x'], y=s['y'], mode='lines+markers', name=s.get('name'),
+                              line=dict(color=s.get('color'), width=s.get('width', 2)))
+        if kind in ('bar', 'barh'):
+            return go.Bar(x=s['x'], y=s['y'], name=s.get('name'), marker_color=color,
+                          orientation='h' if kind == 'barh' else None)
+        if kind == 'histogram':
+            return go.Histogram(x=s['values'], nbinsx=s.get('bins', 20), name=s.get('name'), marker_color=color)
+        if kind == 'pie':
+            return go.Pie(labels=s['labels'], values=s['values'], name=s.get('name'), marker_colors=s.get('colors'))
+        return go.Funnel(y=s['labels'], x=s['values'], textinfo="value+percent initial",
+                         marker={"color": color})
+
+    def figure(self, spec: Dict[str, Any]):
+        layout = spec['layout']
+        rows, cols = layout['rows'], layout['cols']
+        panels = _colored(spec)
+        cells = [[{} for _ in range(cols)] for _ in range(rows)]
+        for i, items in enumerate(panels):
+            if any(s['type'] == 'pie' for s in items):
+                cells[i // cols][i % cols] = {'type': 'domain'}
+            elif any(s.get('secondary') for s in items):
+                cells[i // cols][i % cols] = {'secondary_y': True}
+        fig = make_subplots(rows=rows, cols=cols, specs=cells,
+                            subplot_titles=[p['title'] for p in spec['panels']])
+        for i, items in enumerate(panels):
+            for s in items:
+                extra = {'secondary_y': True} if s.get('secondary') else {}
+                fig.add_trace(self._trace(s), row=i // cols + 1, col=i % cols + 1, **extra)
+        fig.update_layout(title_text=spec['title'], title_x=0.5, height=layout['height'],
+                          showlegend=False, template="plotly_white",
+                          **({'font': dict(size=layout['font_size'])} if layout.get('font_size') else {}))
+        return fig
+
+    def render(self, spec: Dict[str, Any], targets: Dict[str, str]) -> List[str]:
+        """Write what it can of ``targets`` (format -> path); returns the formats written."""
+        fig = self.figure(spec)
+        done = []
+        if 'html' in targets:
+            fig.write_html(targets['html'])
+            done.append('html')
+        for fmt in ('png', 'pdf'):
+            if fmt not in targets:
+                continue
+            try:
+                fig.write_image(targets[fmt], width=spec['layout']['width'], height=spec['layout']['height'])
+                done.append(fmt)
+            except Exception:
+                # Kaleido missing or broken: leave the static formats to the next renderer
+                pass
+        return done
+
+
+class MatplotlibRenderer:
+    """PNG / PDF; the HTML page embeds the PNG."""
+
+    name = 'matplotlib'
+    dpi = 150
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    @staticmethod
+    def _draw(ax, s: Dict[str, Any]):
+        kind, color = s['type'], s.get('colors') or s.get('color')
+        if kind == 'line':
+            ax.plot(s['x'], s['y'], marker='o', color=s.get('color'))
+        elif kind == 'bar':
+            ax.bar(s['x'], s['y'], color=color)
+        elif kind == 'barh':
+            ax.barh(s['y'], s['x'], color=color)
+        elif kind == 'histogram':
+            ax.hist(s['values'], bins=s.get('bins', 20), color=s.get('color'))
+        elif kind == 'pie':
+            ax.pie(s['values'], labels=s['labels'], colors=s.get('colors'), autopct='%1.0f%%')
+        else:
+            # Funnel: widest step on top
+            ax.barh(s['labels'], s['values'], color=color)
+            ax.invert_yaxis()
+
+    def figure(self, spec: Dict[str, Any]):
+        layout = spec['layout']
+        fig, axes = plt.subplots(layout['rows'], layout['cols'],
+                                 figsize=(layout['width'] / 100, layout['height'] / 100), squeeze=False)
+        for i, (item, items) in enumerate(zip(spec['panels'], _colored(spec))):
+            ax = axes[i // layout['cols']][i % layout['cols']]
+            right = None
+            for s in items:
+                if s.get('secondary'):
+                    right = right or ax.twinx()
+                    self._draw(right, s)
+                else:
+                    self._draw(ax, s)
+            ax.set_title(item['title'])
+            # Long category names (products) would overlap on a horizontal axis
+            if any(s['type'] == 'bar' and any(len(str(v)) > 8 for v in s['x']) for s in items):
+                ax.tick_params(axis='x', labelrotation=30)
+        for j in range(len(spec['panels']), layout['rows'] * layout['cols']):
+            axes[j // layout['cols']][j % layout['cols']].axis('off')
+        # Matplotlib's default font has no emoji: drop them instead of drawing boxes
+        title = ''.join(c for c in spec['title'] if ord(c) < 0x2600).strip()
+        fig.suptitle(title, fontsize=layout.get('font_size', 12) + 4)
+        fig.tight_layout()
+        return fig
+
+    def render(self, spec: Dict[str, Any], targets: Dict[str, str]) -> List[str]:
+        """Write ``targets`` (format -> path); returns the formats written."""
+        png = targets.get('png') or os.path.splitext(targets.get('html') or targets['pdf'])[0] + '.png'
+        fig = self.figure(spec)
+        try:
+            if 'png' in targets or 'html' in targets:
+                fig.savefig(png, dpi=self.dpi)
+            if 'pdf' in targets:
+                fig.savefig(targets['pdf'])
+        finally:
+            plt.close(fig)
+        if 'html' in targets:
+            with open(targets['html'], 'w', encoding='utf-8') as f:
+                f.write(f"<html><body><img src='{os.path.basename(png)}' style='max-width:100%' /></body></html>")
+        return [fmt for fmt in FORMATS if fmt in targets]
+
+
+RENDERERS = {'plotly': PlotlyRenderer, 'matplotlib': MatplotlibRenderer}
+
+
+def renderers_from_env() -> List[Any]:
+    """Renderer chain: TPS_CHART_BACKEND first, Matplotlib always last."""
+    first = os.getenv('TPS_CHART_BACKEND', 'plotly').lower()
+    names = [first, 'matplotlib'] if first in RENDERERS and first != 'matplotlib' else ['matplotlib']
+    return [RENDERERS[name]() for name in names]
+
+
+# -- render cache --------------------------------------------------------------
+
+class RenderCache:
+    """Content-addressed, size-bounded LRU cache of rendered chart files."""
+
+    def __init__(self, root, max_bytes: int = 256 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(spec: Dict[str, Any], renderers: Sequence[Any]) -> str:
+        material = json.dumps({
+            'version': SPEC_VERSION,
+            'renderers': [r.name for r in renderers if r.available()],
+            'spec': _plain(spec),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def restore(self, key: str, targets: Dict[str, str]) -> bool:
+        """Copy a cached rendering to ``targets``; False (nothing copied) on a miss."""
+        entry = self._dir(key)
+        sources = {fmt: entry / f"chart.{fmt}" for fmt in targets}
+        if not all(path.exists() for path in sources.values()):
+            self.misses += 1
+            return False
+        for fmt, path in sources.items():
+            shutil.copyfile(path, targets[fmt])
+        try:
+            os.utime(entry)  # LRU bookkeeping
+        except OSError:
+            pass
+        self.hits += 1
+        return True
+
+    def store(self, key: str, targets: Dict[str, str]):
+        entry = self._dir(key)
+        if entry.exists():
+            return
+        # Build the entry aside and rename it in: concurrent workers never see half an entry
+        tmp = entry.with_name(f"{key}.{os.getpid()}.tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        for fmt, path in targets.items():
+            shutil.copyfile(path, tmp / f"chart.{fmt}")
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries until under 90% of the bound."""
+        entries = []
+        for entry in self.root.glob('*/*'):
+            if entry.suffix == '.tmp':
+                continue
+            try:
+                size = sum(p.stat().st_size for p in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for _, size, entry in sorted(entries):
+            if total <= target:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def cache_from_env() -> Optional[RenderCache]:
+    """Build the render cache configured by TPS_RENDER_CACHE_* (None when disabled)."""
+    if os.getenv('TPS_RENDER_CACHE', '1').lower() in ('0', 'false', 'off', 'no'):
+        return None
+    root = os.getenv('TPS_RENDER_CACHE_DIR', str(Path.home() / '.cache' / 'tps-star' / 'charts'))
+    return RenderCache(root, max_bytes=int(float(os.getenv('TPS_RENDER_CACHE_MAX_MB', '256')) * 1024 * 1024))
+
+
+# -- entry point ---------------------------------------------------------------
+
+def render_spec(spec: Dict[str, Any], output_dir: str, formats: Sequence[str] = ('html', 'png'),
+                renderers: Optional[Sequence[Any]] = None, cache: Optional[RenderCache] = None) -> List[str]:
+    """Write ``<output_dir>/<name>.<format>`` for every format; returns the paths written.
+
+    ``cache`` defaults to :func:`cache_from_env`; an unchanged spec is copied, not drawn.
+    """
+    renderers = list(renderers) if renderers is not None else renderers_from_env()
+    cache = cache if cache is not None else cache_from_env()
+    targets = {fmt: os.path.join(output_dir, f"{spec['name']}.{fmt}") for fmt in formats}
+
+    key = RenderCache.key(spec, renderers)
+    if cache is not None and cache.restore(key, targets):
+        return list(targets.values())
+
+    pending = dict(targets)
+    for renderer in renderers:
+        if not pending:
+            break
+        if not renderer.available():
+            continue
+        try:
+            done = renderer.render(spec, pending)
+        except Exception as e:
+            print(f"{renderer.name} failed for {spec['name']}; falling back:", repr(e))
+            done = []
+        for fmt in done:
+            pending.pop(fmt, None)
+
+    if cache is not None and not pending:
+        cache.store(key, targets)
+    return [path for fmt, path in targets.items() if fmt not in pending]
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Microsoft Clarity Daily Snapshots
+=================================
+
+Clarity's Data Export API (``project-live-insights``) only answers for the
+last 1-3 days and allows 10 calls per project per day. Instead of querying
+it per report, a daily job takes one snapshot of the last 24 hours and keeps
+it forever:
+
+- every raw response goes to ``<history>/clarity/<day>/<query>.json``,
+- the totals are flattened into the ``clarity`` history table (one row per
+  day, ``days_covered`` > 1 when a missed day had to be folded in),
+- a per-day call ledger (``<history>/clarity/quota.json``) guarantees the
+  collector never exceeds ``CLARITY_DAILY_CALLS`` calls, whatever reruns:
+  every ledger entry is exactly one request (never retried or hedged), and a
+  429 ends the run instead of waiting for the daily bucket to refill.
+
+Reports only ever read the history (:func:`clarity_week`), so generating or
+regenerating any week costs no Clarity quota.
+
+Usage:
+    from utils.clarity_snapshots import ClaritySnapshotCollector, clarity_week
+
+    ClaritySnapshotCollector(token).collect()        # daily job
+    clarity_week(week_start, week_end)               # reports
+"""
+
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+import pandas as pd
+
+from utils.history import HistoryStore
+from utils.http_transport import HTTPTransport, get_transport, parse_retry_after
+from utils.rate_limits import get_scheduler
+
+EXPORT_URL = "https://www.clarity.ms/export-data/api/v1/project-live-insights"
+DAILY_CALL_LIMIT = 10
+MAX_WINDOW_DAYS = 3  # the API only covers the last 1-3 days
+SOURCE = 'clarity'
+
+# One call for the totals, plus one per breakdown dimension
+DEFAULT_DIMENSIONS = ('Device', 'Country')
+
+# Additive columns summed over a week; the others are session-weighted averages
+_SUM_SUFFIXES = ('_total_session_count', '_total_bot_session_count', '_distinct_user_count',
+                 '_sessions_count', '_sub_total', '_total_time', '_active_time')
+
+
+def _snake(name: str) -> str:
+    return re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', name).replace(' ', '_').lower()
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten_insights(payload: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Totals response -> ``{'traffic_total_session_count': 1456.0, ...}``."""
+    row: Dict[str, float] = {}
+    for block in payload or []:
+        metric = _snake(block.get('metricName') or '')
+        info = block.get('information') or []
+        if not metric or not info:
+            continue
+        for field, value in info[0].items():
+            number = _number(value)
+            if number is not None:
+                # Clarity spells it "distantUserCount"
+                row[f"{metric}_{_snake(field).replace('distant', 'distinct')}"] = number
+    return row
+
+
+class QuotaLedger:
+    """Calls made per (UTC) day, persisted next to the snapshots.
+
+    :meth:`take` is an atomic read-modify-write under a file lock, so two
+    overlapping runs can never both take the last call.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path: Path, limit: int = DAILY_CALL_LIMIT):
+        self.path = Path(path)
+        self.limit = limit
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path.with_suffix('.lock'), 'a') as lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _read(self, today: str) -> int:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            return 0
+        return int(state.get('calls', 0)) if state.get('day') == today else 0
+
+    def remaining(self) -> int:
+        with self._exclusive():
+            return max(0, self.limit - self._read(self._today()))
+
+    def take(self) -> bool:
+        """Count one call against today's quota; False when it is spent."""
+        with self._exclusive():
+            today = self._today()
+            calls = self._read(today)
+            if calls >= self.limit:
+                return False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump({'day': today, 'calls': calls + 1}, fh)
+            os.replace(tmp, self.path)
+            return True
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).date().isoformat()
+
+
+class ClaritySnapshotCollector:
+    """Takes (at most) one set of snapshots per day and stores them in the history."""
+
+    def __init__(self, api_token: str, history: HistoryStore = None, transport: HTTPTransport = None,
+                 daily_limit: int = None, dimensions: Tuple[str, ...] = None):
+        self.headers = {'Authorization': f'Bearer {api_token}', 'Content-Type': 'application/json'}
+        self.history = history or HistoryStore()
+        self.transport = transport or get_transport()
+        self.root = self.history.root / SOURCE
+        self.ledger = QuotaLedger(self.root / 'quota.json',
+                                  daily_limit or int(os.getenv('CLARITY_DAILY_CALLS', DAILY_CALL_LIMIT)))
+        if dimensions is None:
+            configured = os.getenv('CLARITY_SNAPSHOT_DIMENSIONS')
+            dimensions = tuple(d.strip() for d in configured.split(',') if d.strip()) if configured else DEFAULT_DIMENSIONS
+        self.dimensions = dimensions
+
+    def snapshot_path(self, day: date, query: str) -> Path:
+        return self.root / day.isoformat() / f"{query}.json"
+
+    def _fetch(self, num_days: int, dimension: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        scheduler = get_scheduler()
+        # Never sleep on the daily bucket: take a call only if one is there now,
+        # and let tomorrow's run catch up otherwise
+        if scheduler is not None and not scheduler.try_acquire(SOURCE):
+            print("⏭️  clarity: no call budget left in the shared bucket")
+            return None
+        if not self.ledger.take():
+            print(f"⏭️  clarity: daily quota of {self.ledger.limit} calls spent")
+            return None
+        params = {'numOfDays': num_days}
+        if dimension:
+            params['dimension1'] = dimension
+        # Exactly one real call per ledger entry: no retries, and no ``provider`` so the
+        # transport neither hedges nor waits on the bucket this call was already taken from
+        response = self.transport.request('GET', EXPORT_URL, params=params, headers=self.headers, retry=False)
+        if scheduler is not None:
+            scheduler.observe(SOURCE, response)
+            if response.status_code == 429:
+                scheduler.record(SOURCE, retry_after=parse_retry_after(response.headers.get('Retry-After')) or 0.0)
+        if response.status_code == 429:
+            print("⏭️  clarity: throttled (HTTP 429); the next run will retry")
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def collect(self, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """Snapshot the last 24h (or since the last snapshot, up to 3 days) as yesterday.
+
+        Queries already on disk for that day are not requested again, so a
+        rerun only fills in what a previous run could not fetch.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        day = today - timedelta(days=1)
+        last = self.history.last_day(SOURCE)
+        if last is not None and last >= day and all(
+                self.snapshot_path(day, q).exists() for q in ['totals', *(d.lower() for d in self.dimensions)]):
+            print(f"✅ clarity: snapshot for {day} already stored")
+            return None
+        # A missed run leaves a gap: widen the window to cover it (the API stops at 3 days)
+        num_days = 1 if last is None or last >= day else min(MAX_WINDOW_DAYS, (day - last).days)
+        if last is not None and (day - last).days > MAX_WINDOW_DAYS:
+            print(f"⚠️  clarity: {(day - last).days - MAX_WINDOW_DAYS} day(s) since {last} are beyond the API window")
+
+        row = None
+        stored = []
+        for query, dimension in [('totals', None)] + [(d.lower(), d) for d in self.dimensions]:
+            path = self.snapshot_path(day, query)
+            if path.exists():
+                continue
+            payload = self._fetch(num_days, dimension)
+            if payload is None:
+                break
+            stored.append(query)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as fh:
+                json.dump({'fetched_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                           'num_days': num_days, 'dimension': dimension, 'data': payload}, fh)
+            if dimension is None:
+                row = dict(flatten_insights(payload), date=day.isoformat(), days_covered=num_days)
+                self.history.upsert(SOURCE, pd.DataFrame([row]))
+                self.history.set_watermark(SOURCE, day)
+
+        left = self.ledger.remaining()
+        if stored:
+            print(f"✅ clarity: {', '.join(stored)} for {day} stored ({left} call(s) left today)")
+        else:
+            print(f"⚠️  clarity: nothing stored for {day}; the next run will retry")
+        return row
+
+
+def clarity_week(start: date, end: date, history: HistoryStore = None) -> Optional[Dict[str, Any]]:
+    """Weekly Clarity section built from stored snapshots only (no API call)."""
+    history = history or HistoryStore()
+    frame = history.load(SOURCE)
+    if frame.empty or 'traffic_total_session_count' not in frame:
+        return None
+    frame = frame[(frame['date'] >= start.isoformat()) & (frame['date'] <= end.isoformat())]
+    if frame.empty:
+        return None
+
+    sessions = frame['traffic_total_session_count'].fillna(0)
+    total_sessions = float(sessions.sum())
+    metrics: Dict[str, float] = {}
+    for column in frame.columns:
+        if column in ('date', 'days_covered'):
+            continue
+        values = frame[column]
+        if column.endswith(_SUM_SUFFIXES):
+            metrics[column] = float(values.sum())
+        elif total_sessions:
+            metrics[column] = round(float((values.fillna(0) * sessions).sum()) / total_sessions, 4)
+
+    days_covered = int(frame['days_covered'].fillna(1).sum()) if 'days_covered' in frame else len(frame)
+    return {
+        'total_sessions': int(total_sessions),
+        'distinct_users': int(metrics.get('traffic_distinct_user_count', 0)),
+        'scroll_depth_avg': metrics.get('scroll_depth_average_scroll_depth'),
+        'rage_clicks': int(metrics.get('rage_click_count_sub_total', 0)),
+        'dead_clicks': int(metrics.get('dead_click_count_sub_total', 0)),
+        'metrics': metrics,
+        'daily_sessions': [{'date': d, 'sessions': int(s)} for d, s in zip(frame['date'], sessions)],
+        'snapshot_days': len(frame),
+        'days_missing': max(0, (end - start).days + 1 - days_covered),
+    }
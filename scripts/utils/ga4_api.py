@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+GA4 Client for the Daily / Weekly Metric Exports
+================================================
+
+High-level client used by ``scripts/export_ga4_metrics.py``. Each public
+``get_*`` method is backed by a declarative :class:`Query`. On the first call
+the client plans *all* registered queries together:
+
+- queries over the same dimensions are merged into one report
+  (e.g. active users, pageviews, sessions and the e-commerce overview are
+  one dimensionless report; top events and the checkout funnel share one
+  ``eventName`` report),
+- the merged reports are sent through :class:`utils.ga4_data.GA4DataClient`,
+  which packs them five per ``batchRunReports`` call,
+- every query's result is memoized for the lifetime of the client.
+
+A full export therefore costs one API round trip instead of nine.
+
+Usage:
+    from utils.ga4_api import GA4Client
+
+    ga4 = GA4Client()
+    ga4.get_active_users()
+    ga4.get_top_pages(limit=20)
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.ga4_data import GA4DataClient, report_request
+from utils.oauth_tokens import get_ga4_access_token
+
+MAX_METRICS_PER_REPORT = 10   # GA4 Data API limit
+TOP_N_PLANNED = 50            # rows fetched for top-N queries; larger limits refetch
+
+CHECKOUT_STEPS = ['view_item', 'add_to_cart', 'begin_checkout',
+                  'add_shipping_info', 'add_payment_info', 'purchase']
+
+
+class Query:
+    """One logical question asked of GA4."""
+
+    def __init__(self, name: str, dimensions: Tuple[str, ...], metrics: Tuple[str, ...],
+                 limit: Optional[int] = None, order_by: Optional[str] = None,
+                 dimension_in: Optional[List[str]] = None):
+        self.name = name
+        self.dimensions = tuple(dimensions)
+        self.metrics = tuple(metrics)
+        self.limit = limit
+        self.order_by = order_by
+        self.dimension_in = dimension_in
+
+    def with_limit(self, limit: int) -> 'Query':
+        return Query(self.name, self.dimensions, self.metrics, limit, self.order_by, self.dimension_in)
+
+
+QUERIES: Dict[str, Query] = {q.name: q for q in [
+    Query('active_users', (), ('activeUsers',)),
+    Query('pageviews', (), ('screenPageViews',)),
+    Query('sessions', (), ('sessions',)),
+    Query('ecommerce', (), ('purchaseRevenue', 'transactions', 'averagePurchaseRevenue',
+                            'addToCarts', 'checkouts', 'ecommercePurchases')),
+    Query('top_pages', ('pagePath',), ('screenPageViews',), limit=TOP_N_PLANNED, order_by='screenPageViews'),
+    Query('top_events', ('eventName',), ('eventCount',), limit=TOP_N_PLANNED, order_by='eventCount'),
+    Query('checkout_funnel', ('eventName',), ('eventCount',), dimension_in=CHECKOUT_STEPS),
+    Query('country_stats', ('country',), ('activeUsers', 'sessions'), limit=TOP_N_PLANNED, order_by='activeUsers'),
+    Query('device_stats', ('deviceCategory',), ('sessions', 'activeUsers'), order_by='sessions'),
+]}
+
+
+class PlannedReport:
+    """A merged report answering one or more queries."""
+
+    def __init__(self, dimensions: Tuple[str, ...], metrics: List[str], members: List[Query]):
+        self.dimensions = dimensions
+        self.metrics = metrics
+        self.members = members
+
+    def to_request(self, start_date: str, end_date: str) -> Dict[str, Any]:
+        if len(self.members) == 1:
+            # Sole member: push its filter / ordering / limit to the server
+            q = self.members[0]
+            extra = {}
+            if q.dimension_in:
+                extra['dimensionFilter'] = {'filter': {
+                    'fieldName': q.dimensions[0],
+                    'inListFilter': {'values': list(q.dimension_in)},
+                }}
+            return report_request(list(self.dimensions), self.metrics, start_date, end_date,
+                                  limit=q.limit, order_by_metric=q.order_by, **extra)
+        # Merged: fetch every row once, each member slices it locally
+        return report_request(list(self.dimensions), self.metrics, start_date, end_date)
+
+
+def plan_queries(queries: List[Query]) -> List[PlannedReport]:
+    """Merge queries sharing the same dimensions into as few reports as possible."""
+    groups: Dict[Tuple[str, ...], List[Query]] = {}
+    for q in queries:
+        groups.setdefault(q.dimensions, []).append(q)
+
+    plan: List[PlannedReport] = []
+    for dimensions, members in groups.items():
+        metrics: List[str] = []
+        current: List[Query] = []
+        for q in members:
+            new_metrics = [m for m in q.metrics if m not in metrics]
+            if current and len(metrics) + len(new_metrics) > MAX_METRICS_PER_REPORT:
+                plan.append(PlannedReport(dimensions, metrics, current))
+                metrics, current = [], []
+                new_metrics = list(q.metrics)
+            metrics.extend(new_metrics)
+            current.append(q)
+        plan.append(PlannedReport(dimensions, metrics, current))
+    return plan
+
+
+def _slice(columns: Dict[str, np.ndarray], q: Query) -> Dict[str, np.ndarray]:
+    """Project a merged report onto one query: filter, order, limit."""
+    keep = list(q.dimensions) + list(q.metrics)
+    view = {name: columns[name] for name in keep if name in columns}
+    if not view:
+        return view
+    n = len(next(iter(view.values())))
+    index = np.arange(n)
+    if q.dimension_in:
+        index = index[np.isin(view[q.dimensions[0]][index], q.dimension_in)]
+    if q.order_by:
+        index = index[np.argsort(-view[q.order_by][index], kind='stable')]
+    if q.limit:
+        index = index[:q.limit]
+    return {name: values[index] for name, values in view.items()}
+
+
+def _num(value) -> Any:
+    value = value.item() if hasattr(value, 'item') else value
+    return round(value, 2) if isinstance(value, float) else value
+
+
+class GA4Client:
+    """Planned, batched and memoized GA4 queries for one date range."""
+
+    def __init__(self, property_id: Optional[str] = None, access_token: Optional[str] = None,
+                 start_date: str = '7daysAgo', end_date: str = 'yesterday'):
+        self.property_id = property_id or os.getenv('GA4_PROPERTY_ID')
+        if not self.property_id:
+            raise ValueError('GA4_PROPERTY_ID is not set')
+        # Without an explicit token, resolve lazily through the shared token cache
+        self.data_client = GA4DataClient(self.property_id, access_token or get_ga4_access_token)
+        self.start_date = start_date
+        self.end_date = end_date
+        self._results: Dict[str, Dict[str, np.ndarray]] = {}
+
+    # -- planning / execution -------------------------------------------------
+
+    def prefetch(self, queries: Optional[List[Query]] = None):
+        """Run the (remaining) query plan in as few batch calls as possible."""
+        queries = [q for q in (queries or QUERIES.values()) if q.name not in self._results]
+        if not queries:
+            return
+        plan = plan_queries(queries)
+        reports = self.data_client.run_reports_columnar(
+            [planned.to_request(self.start_date, self.end_date) for planned in plan]
+        )
+        for planned, columns in zip(plan, reports):
+            for q in planned.members:
+                self._results[q.name] = _slice(columns, q)
+        print(f"📊 GA4: {len(queries)} queries → {len(plan)} reports → "
+              f"{self.data_client.round_trips} API call(s) so far")
+
+    def _result(self, name: str, limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        planned = QUERIES[name]
+        if limit and planned.limit and limit > planned.limit:
+            # Asked for more rows than the shared plan fetched: dedicated query
+            key = f"{name}:{limit}"
+            if key not in self._results:
+                q = planned.with_limit(limit)
+                request = PlannedReport(q.dimensions, list(q.metrics), [q]).to_request(self.start_date, self.end_date)
+                self._results[key] = _slice(self.data_client.run_reports_columnar([request])[0], q)
+            return self._results[key]
+        if name not in self._results:
+            self.prefetch()
+        result = self._results[name]
+        if limit:
+            result = {col: values[:limit] for col, values in result.items()}
+        return result
+
+    def _total(self, name: str, metric: str) -> Any:
+        values = self._result(name).get(metric)
+        return _num(values[0]) if values is not None and len(values) else 0
+
+    def _rows(self, name: str, rename: Dict[str, str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        columns = self._result(name, limit)
+        if not columns:
+            return []
+        n = len(next(iter(columns.values())))
+        return [{rename.get(col, col): _num(values[i]) for col, values in columns.items()} for i in range(n)]
+
+    # -- public API -----------------------------------------------------------
+
+    def get_active_users(self) -> int:
+        return self._total('active_users', 'activeUsers')
+
+    def get_pageviews(self) -> int:
+        return self._total('pageviews', 'screenPageViews')
+
+    def get_sessions(self) -> int:
+        return self._total('sessions', 'sessions')
+
+    def get_top_pages(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._rows('top_pages', {'pagePath': 'page', 'screenPageViews': 'views'}, limit)
+
+    def get_top_events(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._rows('top_events', {'eventName': 'event', 'eventCount': 'count'}, limit)
+
+    def get_country_stats(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._rows('country_stats', {'activeUsers': 'active_users'}, limit)
+
+    def get_device_stats(self) -> List[Dict[str, Any]]:
+        return self._rows('device_stats', {'deviceCategory': 'device', 'activeUsers': 'active_users'})
+
+    def get_ecommerce_overview(self) -> Dict[str, Any]:
+        return {
+            'revenue': self._total('ecommerce', 'purchaseRevenue'),
+            'transactions': self._total('ecommerce', 'transactions'),
+            'average_order_value': self._total('ecommerce', 'averagePurchaseRevenue'),
+            'add_to_carts': self._total('ecommerce', 'addToCarts'),
+            'checkouts': self._total('ecommerce', 'checkouts'),
+            'purchases': self._total('ecommerce', 'ecommercePurchases'),
+        }
+
+    def get_checkout_funnel(self) -> List[Dict[str, Any]]:
+        columns = self._result('checkout_funnel')
+        counts = dict(zip(columns.get('eventName', []), columns.get('eventCount', [])))
+        funnel = []
+        previous = None
+        for step in CHECKOUT_STEPS:
+            count = _num(counts.get(step, 0))
+            funnel.append({
+                'step': step,
+                'count': count,
+                'rate_from_previous': round(count / previous, 4) if previous else None,
+            })
+            previous = count
+        return funnel
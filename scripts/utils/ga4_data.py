@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Batched GA4 Data API Client
+===========================
+
+Thin client over the GA4 Data API (v1beta) built for the weekly reports:
+- packs up to five report requests into each ``batchRunReports`` call
+- pages large reports with offset/limit, batching the follow-up pages too
+- decodes rows straight into columnar NumPy arrays / pandas DataFrames
+- tags each batch with its last covered day so closed ranges hit the
+  transport's response cache instead of the API
+- feeds the returned property quota back into the ``ga4`` rate-limit bucket
+
+Usage:
+    from utils.ga4_data import GA4DataClient, report_request
+
+    client = GA4DataClient(property_id, access_token)
+    sessions, sources = client.run_reports([
+        report_request(["date"], ["sessions"], "7daysAgo", "yesterday"),
+        report_request(["sessionDefaultChannelGroup"], ["sessions"], "7daysAgo", "yesterday"),
+    ])
+"""
+
+import copy
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.http_transport import HTTPTransport, get_transport
+from utils.rate_limits import get_scheduler
+from utils.response_cache import resolve_day
+
+API_ROOT = "https://analyticsdata.googleapis.com/v1beta/"
+MAX_REPORTS_PER_BATCH = 5     # hard limit of batchRunReports
+DEFAULT_PAGE_SIZE = 10000
+MAX_PAGE_SIZE = 250000
+
+_METRIC_DTYPES = {
+    'TYPE_INTEGER': np.int64,
+}
+
+
+# Client-side key (stripped before sending): stop paging after this many rows
+MAX_ROWS_KEY = '_maxRows'
+
+
+def report_request(dimensions: List[str], metrics: List[str], start_date: str, end_date: str,
+                   limit: Optional[int] = None, order_by_metric: Optional[str] = None,
+                   descending: bool = True, **extra: Any) -> Dict[str, Any]:
+    """Build one ``RunReportRequest`` body.
+
+    ``limit`` caps the result (top-N); without it every row is paged in.
+    """
+    request = {
+        'dateRanges': [{'startDate': start_date, 'endDate': end_date}],
+        'dimensions': [{'name': name} for name in dimensions],
+        'metrics': [{'name': name} for name in metrics],
+        'limit': str(min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)),
+    }
+    if limit:
+        request[MAX_ROWS_KEY] = limit
+    if order_by_metric:
+        request['orderBys'] = [{'metric': {'metricName': order_by_metric}, 'desc': descending}]
+    request.update(extra)
+    return request
+
+
+def decode_report(report: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Decode one ``RunReportResponse`` into ``{column: ndarray}``.
+
+    Dimensions become object arrays, metrics float64 (int64 for integer
+    metrics). Rows are walked once per column, never materialised as dicts.
+    """
+    rows = report.get('rows') or []
+    n = len(rows)
+    columns: Dict[str, np.ndarray] = {}
+
+    for i, header in enumerate(report.get('dimensionHeaders') or []):
+        col = np.empty(n, dtype=object)
+        col[:] = [row['dimensionValues'][i].get('value') for row in rows]
+        columns[header['name']] = col
+
+    for j, header in enumerate(report.get('metricHeaders') or []):
+        values = np.fromiter((float(row['metricValues'][j].get('value') or 0) for row in rows),
+                             dtype=np.float64, count=n)
+        dtype = _METRIC_DTYPES.get(header.get('type'))
+        columns[header['name']] = values.astype(dtype) if dtype is not None else values
+
+    return columns
+
+
+def _last_day(requests: List[Dict[str, Any]]):
+    """Last calendar day covered by a batch (``None`` if a date is unparseable)."""
+    try:
+        return max(resolve_day(r['endDate']) for req in requests for r in req.get('dateRanges') or [])
+    except (KeyError, ValueError):
+        return None
+
+
+# Additive daily metrics kept in the local history (see utils.history)
+DAILY_METRICS = ['sessions', 'totalUsers', 'newUsers', 'screenPageViews', 'transactions', 'totalRevenue']
+
+
+def daily_request(start_date: str, end_date: str, metrics: List[str] = None,
+                  dimensions: List[str] = ()) -> Dict[str, Any]:
+    """One row per ``date`` (and per value of ``dimensions``) over the window (ISO dates or GA4 relative dates)."""
+    return report_request(['date'] + list(dimensions), metrics or DAILY_METRICS, start_date, end_date,
+                          orderBys=[{'dimension': {'dimensionName': 'date'}}])
+
+
+def daily_frame(columns: Dict[str, np.ndarray], start, end, fill: bool = True) -> pd.DataFrame:
+    """Decoded daily report -> DataFrame with ISO ``date``.
+
+    With ``fill`` every day of ``[start, end]`` is present (zeros for days
+    GA4 returned no row for); without it, only the days GA4 returned.
+    """
+    frame = pd.DataFrame(columns, copy=False)
+    days = pd.date_range(start, end, freq='D').strftime('%Y-%m-%d')
+    if frame.empty:
+        return pd.DataFrame({'date': days if fill else []}).assign(**{m: 0 for m in DAILY_METRICS})
+    frame['date'] = pd.to_datetime(frame['date'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
+    if not fill:
+        return frame.reset_index(drop=True)
+    return frame.set_index('date').reindex(days, fill_value=0).rename_axis('date').reset_index()
+
+
+def _record_quota(reports: List[Dict[str, Any]]):
+    """Sync the ``ga4`` bucket with ``propertyQuota.tokensPerHour``."""
+    scheduler = get_scheduler()
+    hourly = [r['propertyQuota']['tokensPerHour'] for r in reports
+              if (r.get('propertyQuota') or {}).get('tokensPerHour')]
+    if scheduler is None or not hourly:
+        return
+    consumed = sum(int(q.get('consumed') or 0) for q in hourly)
+    remaining = min(int(q.get('remaining') or 0) for q in hourly)
+    scheduler.record('ga4', remaining=remaining, cost=consumed or None)
+
+
+def _concat_columns(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+class GA4DataClient:
+    """Batched ``batchRunReports`` client for one GA4 property."""
+
+    def __init__(self, property_id: str, access_token: Union[str, Callable[[], str]],
+                 transport: HTTPTransport = None, api_root: str = API_ROOT):
+        self.property_id = str(property_id)
+        # Either a token string or a callable returning a fresh one
+        self._access_token = access_token
+        self.transport = transport or get_transport()
+        self.batch_url = f"{api_root}properties/{self.property_id}:batchRunReports"
+        self.round_trips = 0
+
+    def _headers(self) -> Dict[str, str]:
+        token = self._access_token() if callable(self._access_token) else self._access_token
+        return {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+
+    def batch_run_reports(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run ``requests`` in as few ``batchRunReports`` calls as possible.
+
+        Returns the raw reports in request order.
+        """
+        reports: List[Dict[str, Any]] = []
+        for start in range(0, len(requests), MAX_REPORTS_PER_BATCH):
+            chunk = [dict({k: v for k, v in req.items() if k != MAX_ROWS_KEY}, returnPropertyQuota=True)
+                     for req in requests[start:start + MAX_REPORTS_PER_BATCH]]
+            response = self.transport.request('POST', self.batch_url, json={'requests': chunk},
+                                              headers=self._headers(),
+                                              provider='ga4', as_of=_last_day(chunk))
+            self.round_trips += 1
+            response.raise_for_status()
+            batch = response.json().get('reports') or []
+            if len(batch) != len(chunk):
+                raise ValueError(f"batchRunReports returned {len(batch)} reports for {len(chunk)} requests")
+            if 'X-TPS-Cache' not in response.headers:
+                _record_quota(batch)
+            reports.extend(batch)
+        return reports
+
+    def run_reports_columnar(self, requests: List[Dict[str, Any]]) -> List[Dict[str, np.ndarray]]:
+        """Run every request to completion (all pages) and decode columnar.
+
+        Follow-up pages of different reports share batch calls, so paging
+        three large reports costs one extra round trip, not three.
+        """
+        parts: List[List[Dict[str, np.ndarray]]] = [[] for _ in requests]
+        pending = [(i, copy.deepcopy(req)) for i, req in enumerate(requests)]
+
+        while pending:
+            reports = self.batch_run_reports([req for _, req in pending])
+            next_pending = []
+            for (i, req), report in zip(pending, reports):
+                columns = decode_report(report)
+                parts[i].append(columns)
+                fetched = int(req.get('offset', 0)) + len(report.get('rows') or [])
+                total = int(report.get('rowCount') or 0)
+                if req.get(MAX_ROWS_KEY):
+                    total = min(total, int(req[MAX_ROWS_KEY]))
+                if report.get('rows') and fetched < total:
+                    remaining = total - fetched
+                    follow_up = dict(req, offset=str(fetched),
+                                     limit=str(min(int(req.get('limit', DEFAULT_PAGE_SIZE)), remaining)))
+                    next_pending.append((i, follow_up))
+            pending = next_pending
+
+        return [_concat_columns(p) if p else {} for p in parts]
+
+    def fetch_daily(self, start, end, fill: bool = True) -> pd.DataFrame:
+        """Daily additive metrics for ``[start, end]`` (dates), for the local history.
+
+        ``fill=False`` leaves out the days GA4 returned no row for (not yet
+        processed), so callers can tell a missing day from a zero one.
+        """
+        request = daily_request(start.isoformat(), end.isoformat())
+        return daily_frame(self.run_reports_columnar([request])[0], start, end, fill=fill)
+
+    def fetch_daily_breakdown(self, start, end, dimension: str) -> pd.DataFrame:
+        """Daily additive metrics per value of ``dimension`` (e.g. ``countryId``); only returned rows."""
+        request = daily_request(start.isoformat(), end.isoformat(), dimensions=[dimension])
+        frame = pd.DataFrame(self.run_reports_columnar([request])[0], copy=False)
+        if frame.empty:
+            return pd.DataFrame(columns=['date', dimension] + DAILY_METRICS)
+        frame['date'] = pd.to_datetime(frame['date'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
+        return frame
+
+    def run_reports(self, requests: List[Dict[str, Any]]) -> List[pd.DataFrame]:
+        """Like :meth:`run_reports_columnar` but wraps each result in a DataFrame."""
+        return [pd.DataFrame(columns, copy=False) for columns in self.run_reports_columnar(requests)]
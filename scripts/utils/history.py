@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Local Daily History with Ingestion Watermarks
+=============================================
+
+Each source (``ga4``, ``shopify``, ``ahrefs``, ...) keeps:
+
+- a daily history table ``<root>/<source>.csv`` (one row per ``date``, or
+  per ``date`` and ``market`` for the :data:`MARKET_SOURCES` breakdowns,
+  whose warehouse rows go to their parent source under each market),
+- a watermark in ``<root>/watermarks.json``: the last fully ingested day
+  (plus an optional provider cursor).
+
+A daily job calls :meth:`HistoryStore.ingest`, which fetches only the days
+after the watermark up to the last *closed* day and appends them. Reports
+then read whole weeks back with :meth:`HistoryStore.split`, which returns the
+stored rows plus whatever range is still missing, so already-ingested days
+never cost an API call again. Every upsert is also written through to the
+metrics warehouse (``utils.warehouse``).
+
+Usage:
+    from utils.history import HistoryStore
+
+    history = HistoryStore()
+    history.ingest('ga4', fetch_days, backfill_start=date(2025, 1, 1))
+    frame, missing = history.split('ga4', week_start, week_end)
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import pandas as pd
+
+from utils.response_cache import SETTLE_DAYS
+from utils.warehouse import MetricsWarehouse
+
+DEFAULT_HISTORY_DIR = 'report_data/history'
+
+DayRange = Tuple[date, date]
+
+# Per-market breakdowns (one row per date and market) -> the source they break down
+MARKET_SOURCES = {
+    'ga4_markets': 'ga4',
+}
+
+
+def last_closed_day(source: str, today: Optional[date] = None) -> date:
+    """Latest day whose numbers will no longer change for ``source``."""
+    today = today or date.today()
+    return today - timedelta(days=1 + SETTLE_DAYS.get(MARKET_SOURCES.get(source, source), 0))
+
+
+def _day(value: Union[str, date, datetime]) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+class HistoryStore:
+    """Per-source daily tables plus their ingestion watermarks."""
+
+    def __init__(self, root: Union[str, Path] = None):
+        self.root = Path(root or os.getenv('TPS_HISTORY_DIR', DEFAULT_HISTORY_DIR))
+
+    # -- watermarks -----------------------------------------------------------
+
+    def _watermarks_path(self) -> Path:
+        return self.root / 'watermarks.json'
+
+    def _read_watermarks(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._watermarks_path(), 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def watermark(self, source: str) -> Optional[Dict[str, Any]]:
+        return self._read_watermarks().get(source)
+
+    def last_day(self, source: str) -> Optional[date]:
+        mark = self.watermark(source)
+        return _day(mark['day']) if mark and mark.get('day') else None
+
+    def set_watermark(self, source: str, day: date, cursor: Optional[str] = None):
+        marks = self._read_watermarks()
+        marks[source] = {
+            'day': day.isoformat(),
+            'cursor': cursor,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        self._atomic_write(self._watermarks_path(), json.dumps(marks, indent=2))
+
+    # -- daily tables ---------------------------------------------------------
+
+    def _table_path(self, source: str) -> Path:
+        return self.root / f"{source}.csv"
+
+    def load(self, source: str) -> pd.DataFrame:
+        path = self._table_path(source)
+        if not path.exists():
+            return pd.DataFrame(columns=['date'])
+        return pd.read_csv(path, dtype={'date': str})
+
+    def upsert(self, source: str, frame: pd.DataFrame):
+        """Merge ``frame`` (must have a ``date`` column) into the history; new rows win."""
+        if frame is None or frame.empty:
+            return
+        frame = frame.copy()
+        frame['date'] = frame['date'].map(lambda d: _day(d).isoformat())
+        new_rows = frame
+        current = self.load(source)
+        if not current.empty:
+            current = current[~current['date'].isin(frame['date'])]
+            frame = pd.concat([current, frame], ignore_index=True)
+        frame = frame.sort_values('date').reset_index(drop=True)
+        self._atomic_write(self._table_path(source), frame.to_csv(index=False))
+        try:
+            if source in MARKET_SOURCES:
+                for market, part in new_rows.groupby('market'):
+                    MetricsWarehouse().record_daily(MARKET_SOURCES[source], part.drop(columns='market'), market=market)
+            else:
+                MetricsWarehouse().record_daily(source, new_rows)
+        except Exception as e:
+            print(f"⚠️  {source}: warehouse write failed ({e})")
+
+    def _atomic_write(self, path: Path, text: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+
+    # -- reading windows ------------------------------------------------------
+
+    def split(self, source: str, start: Union[date, datetime],
+              end: Union[date, datetime]) -> Tuple[pd.DataFrame, Optional[DayRange]]:
+        """Return ``(stored rows in [start, end], missing day range or None)``.
+
+        Only days up to the watermark count as stored; everything after it
+        (typically the still-open tail of the current week) is reported as
+        missing so the caller can fetch just that.
+        """
+        start, end = _day(start), _day(end)
+        frame = self.load(source)
+        if not frame.empty:
+            frame = frame[(frame['date'] >= start.isoformat()) & (frame['date'] <= end.isoformat())]
+
+        mark = self.last_day(source)
+        first = _day(frame['date'].min()) if not frame.empty else None
+        if mark is None or first is None or first > start:
+            return frame.iloc[0:0], (start, end)
+        frame = frame[frame['date'] <= mark.isoformat()].reset_index(drop=True)
+        if mark >= end:
+            return frame, None
+        return frame, (mark + timedelta(days=1), end)
+
+    # -- ingestion ------------------------------------------------------------
+
+    def pending_range(self, source: str, backfill_start: date,
+                      until: Optional[date] = None) -> Optional[DayRange]:
+        """Days still to ingest: after the watermark (or from ``backfill_start``) through ``until``."""
+        until = until or last_closed_day(source)
+        mark = self.last_day(source)
+        start = mark + timedelta(days=1) if mark else backfill_start
+        return (start, until) if start <= until else None
+
+    def ingest(self, source: str, fetch_days: Callable[[date, date], pd.DataFrame],
+               backfill_start: date, until: Optional[date] = None) -> pd.DataFrame:
+        """Fetch and append the delta since the watermark; advance the watermark.
+
+        ``fetch_days(start, end)`` must return one row per day with a ``date``
+        column. The watermark only moves after the rows are on disk, so an
+        interrupted run simply fetches the same delta again.
+        """
+        pending = self.pending_range(source, backfill_start, until)
+        if pending is None:
+            print(f"✅ {source}: history up to date (watermark {self.last_day(source)})")
+            return pd.DataFrame(columns=['date'])
+        start, end = pending
+        print(f"📥 {source}: ingesting {start} → {end}")
+        frame = fetch_days(start, end)
+        self.upsert(source, frame)
+        self.set_watermark(source, end)
+        print(f"✅ {source}: {frame['date'].nunique() if not frame.empty else 0} day(s) appended, watermark → {end}")
+        return frame
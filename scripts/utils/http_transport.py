@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP Transport for TPS-STAR Connectors
+=============================================
+
+One shared transport used by every analytics connector:
+- keep-alive connection pool per host (no TCP/TLS handshake per request)
+- GET and POST with query params or JSON bodies
+- exponential backoff with full jitter, honouring ``Retry-After``
+- gzip/deflate response negotiation
+- optional immutable-day response cache (see ``utils.response_cache``)
+- per-provider pacing through the shared rate-limit scheduler
+  (see ``utils.rate_limits``)
+- record / replay of every response to cassettes (see ``utils.cassettes``)
+- per-provider circuit breakers and optional hedging of slow GETs
+  (see ``utils.resilience``)
+
+Usage:
+    from utils.http_transport import get_transport
+
+    transport = get_transport()
+    response = transport.request("POST", url, json={"requests": [...]})
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.cassettes import Cassette, cassette_from_env
+from utils.rate_limits import RateLimitScheduler, get_scheduler
+from utils.resilience import CircuitBreaker, CircuitOpen, LatencyTracker, get_breaker, hedging_from_env
+from utils.response_cache import ResponseCache, cache_from_env
+
+# Statuses worth retrying: throttling and transient upstream failures
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'TPS-STAR-Analytics/1.0',
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the delay in seconds requested by a ``Retry-After`` header.
+
+    Accepts both forms allowed by RFC 9110: delta-seconds and HTTP-date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class HTTPTransport:
+    """Thread-safe pooled transport with retries.
+
+    One ``requests.Session`` is kept per ``scheme://host`` so connections to
+    each provider stay alive across calls and threads.
+    """
+
+    def __init__(self, pool_maxsize: int = 10, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0,
+                 timeout: float = 30.0, cache: Optional[ResponseCache] = None,
+                 scheduler: Optional[RateLimitScheduler] = None,
+                 cassette: Optional[Cassette] = None,
+                 breaker: Optional[CircuitBreaker] = None, hedge: bool = False):
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.cache = cache
+        self.scheduler = scheduler
+        self.cassette = cassette
+        self.breaker = breaker
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def _session_for(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host_key)
+            if session is None:
+                session = requests.Session()
+                # Retries are handled here (with jitter + Retry-After), not by urllib3
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                session.mount(f"{parts.scheme}://", adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                self._sessions[host_key] = session
+            return session
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_cap * 4))
+        return delay
+
+    def request(self, method: str, url: str, params: Dict = None, json: Dict = None,
+                data=None, headers: Dict = None, timeout: float = None,
+                retry: bool = True, stream: bool = False,
+                provider: Optional[str] = None, as_of: Optional[date] = None,
+                hedge: Optional[bool] = None) -> requests.Response:
+        """Send a request, retrying throttled/transient failures.
+
+        Returns the final ``requests.Response`` (which may still be an error
+        status once retries are exhausted). Network errors are re-raised after
+        the last attempt.
+
+        ``provider`` names the API being called: every attempt first waits
+        for that provider's rate-limit budget. ``as_of`` is the last calendar
+        day the request covers; when given (and a cache is configured)
+        successful responses are cached, forever once that day is closed.
+
+        A provider whose circuit is open fails fast with ``CircuitOpen`` (a
+        ``ConnectionError``). ``hedge`` overrides the transport default for
+        hedging: a GET still unanswered after the provider's p95 latency is
+        sent a second time and the first answer wins.
+
+        With a cassette attached, replay never touches the network (nor the
+        cache or rate limits) and record stores every final response.
+        """
+        body = json if json is not None else data
+        if self.cassette is not None and self.cassette.mode == 'replay':
+            return self.cassette.replay(method, url, params, body)
+
+        # Recording must see real responses, not cached ones
+        cache = self.cache if as_of is not None and not stream and self.cassette is None else None
+        if cache is not None:
+            key = cache.key(provider, method, url, params, body, as_of)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = self._send(method, url, params, json, data, headers, timeout, retry, stream, provider, hedge)
+
+        if self.cassette is not None:
+            return self.cassette.record(method, url, params, body, response)
+
+        if cache is not None and 200 <= response.status_code < 300:
+            cache.put(key, response, provider, as_of)
+        return response
+
+    def _attempt(self, session, method, url, params, json, data, headers, timeout, stream,
+                 provider) -> requests.Response:
+        started = time.monotonic()
+        response = session.request(
+            method.upper(), url, params=params, json=json, data=data,
+            headers=headers, timeout=timeout or self.timeout, stream=stream
+        )
+        if provider and not stream and response.status_code < 500:
+            self.latency.add(provider, time.monotonic() - started)
+        return response
+
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=self.pool_maxsize * 2, thread_name_prefix='hedge')
+            return self._hedge_pool
+
+    def _hedged(self, send, provider: str) -> requests.Response:
+        """Run ``send``; past the provider's p95, race a second copy against it."""
+        delay = self.latency.hedge_delay(provider)
+        if delay is None:
+            return send()
+        pool = self._hedge_executor()
+        primary = pool.submit(send)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        # A hedge is never worth waiting for rate-limit budget
+        if self.scheduler is not None and not self.scheduler.try_acquire(provider):
+            return primary.result()
+
+        pending = {primary, pool.submit(send)}
+        fallback, error = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                response = future.result()
+                if response.status_code in RETRY_STATUSES and pending:
+                    fallback = response  # keep waiting for a better answer
+                    continue
+                if fallback is not None and fallback is not response:
+                    fallback.close()
+                for loser in pending:
+                    loser.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                return response
+        if fallback is not None:
+            return fallback
+        raise error
+
+    def _send(self, method, url, params, json, data, headers, timeout, retry, stream,
+              provider=None, hedge=None) -> requests.Response:
+        session = self._session_for(url)
+        attempts = (self.max_retries if retry else 0) + 1
+        scheduler = self.scheduler if provider else None
+        breaker = self.breaker if provider else None
+        hedging = (bool(provider) and not stream and method.upper() == 'GET'
+                   and (self.hedge if hedge is None else hedge))
+
+        def send():
+            return self._attempt(session, method, url, params, json, data, headers, timeout, stream, provider)
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            # Fails fast (CircuitOpen) while the provider is known to be down
+            probe = breaker.before(provider) if breaker is not None else False
+            if scheduler is not None:
+                waited = scheduler.acquire(provider)
+                if waited >= 1.0:
+                    print(f"⏳ {provider}: waited {waited:.1f}s for rate-limit budget")
+            try:
+                # The recovery probe is a single request, never hedged
+                response = self._hedged(send, provider) if hedging and not probe else send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if breaker is not None and breaker.failure(provider, e):
+                    raise CircuitOpen(f"{provider}: circuit open ({e})") from e
+                if last_attempt:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"↻ {method.upper()} {urlsplit(url).netloc}: {e.__class__.__name__}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if scheduler is not None:
+                scheduler.observe(provider, response)
+            if breaker is not None:
+                if response.status_code >= 500 or response.status_code == 408:
+                    if breaker.failure(provider, f"HTTP {response.status_code}"):
+                        return response
+                else:
+                    breaker.success(provider)
+
+            retry_after = None
+            if response.status_code in RETRY_STATUSES:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code == 429 and scheduler is not None:
+                # Throttled: hold back every process sharing this provider's quota
+                scheduler.record(provider, retry_after=retry_after if retry_after is not None else self._backoff(attempt))
+
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+
+            response.close()
+            if response.status_code == 429 and scheduler is not None:
+                # The scheduler holds the next attempt back until the pause is over
+                print(f"↻ {method.upper()} {urlsplit(url).netloc}: HTTP 429, waiting for {provider} budget")
+                continue
+            delay = self._backoff(attempt, retry_after)
+            print(f"↻ {method.upper()} {urlsplit(url).netloc}: HTTP {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+        return response
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            if self._hedge_pool is not None:
+                self._hedge_pool.shutdown(wait=False)
+                self._hedge_pool = None
+
+
+_shared_transport: Optional[HTTPTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """Process-wide transport shared by all connectors."""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HTTPTransport(
+                pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '10')),
+                max_retries=int(os.getenv('HTTP_MAX_RETRIES', '4')),
+                cache=cache_from_env(),
+                scheduler=get_scheduler(),
+                cassette=cassette_from_env(),
+                breaker=get_breaker(),
+                hedge=hedging_from_env(),
+            )
+        return _shared_transport
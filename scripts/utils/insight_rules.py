@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Declarative Insight Rules
+=========================
+
+The "insights & recommendations" of the reports are rules, not code. Each
+rule of ``scripts/insight_rules.json`` names a metric, a condition, a
+window, a severity and the texts to show::
+
+    {"id": "ga4-bounce-rate", "metric": "ga4.bounce_rate", "window": "7d",
+     "condition": "> 50%", "severity": "high", "type": "warning",
+     "category": "Traffic Quality",
+     "insight": "Bounce rate is {value:.1%}, above the 50% threshold.",
+     "recommendation": "Improve page load speed ...", "reports": ["weekly"]}
+
+- ``metric``     ``source.metric`` (weekly report sections are addressed the
+  same way: ``ga4.sessions`` is the daily history rolled up, or the section
+  value when there is no history)
+- ``window``     ``1d``, ``7d``, ``28d`` ... (trailing days ending on the
+  evaluated day; sums for additive metrics, means for rates)
+- ``condition``  ``"<op> <number>[%]"`` on the window value, or
+  ``"change <op> <number>[%]"`` on its change vs the window before
+  (``-20%`` = -0.2); a list of conditions must all hold
+- ``insight`` / ``recommendation`` are format strings over ``value``,
+  ``previous``, ``change``, ``market`` and ``date``
+
+Rules compile into arrays (metric, window, field, operator, threshold), so a
+rule set is evaluated for every market and every week in one vectorized pass
+per window length: values are gathered into a ``weeks x markets x rules``
+cube and each operator is applied to all the rules that use it at once.
+
+Usage:
+    from utils.insight_rules import InsightRules
+
+    rules = InsightRules.from_file()
+    hits = rules.evaluate(windows=to_long('weekly', day, sections), report='weekly')
+    rules.insights(hits)   # [{'type': 'warning', 'category': ..., 'priority': 'High'}, ...]
+
+Environment:
+    TPS_INSIGHT_RULES=...        rules file (default scripts/insight_rules.json)
+"""
+
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.metrics_join import AVERAGED_METRICS
+from utils.period_compare import WINDOW_DAYS, WINDOW_TOLERANCE_DAYS
+from utils.warehouse import DEFAULT_MARKET, SNAPSHOT_SOURCES, WEEK_WINDOW, MetricsWarehouse
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parent.parent / 'insight_rules.json'
+
+SEVERITIES = ('critical', 'high', 'medium', 'low')
+SEVERITY_RANK = {name: rank for rank, name in enumerate(SEVERITIES)}
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+OPERATOR_CODES = {op: code for code, op in enumerate(OPERATORS)}
+FIELDS = ('value', 'change')
+
+_CONDITION = re.compile(r'^\s*(?:(value|change)\s+)?(>=|<=|==|!=|>|<)\s*([-+]?\d+(?:\.\d+)?)\s*(%?)\s*$')
+_WINDOW = re.compile(r'^\s*(\d+)\s*d\s*$')
+
+HIT_COLUMNS = ['date', 'market', 'rule', 'metric', 'value', 'previous', 'change', 'severity', 'type',
+               'category', 'insight', 'recommendation', 'priority']
+
+DateLike = Union[str, date, datetime]
+
+
+def metric_key(source: str, metric: str) -> str:
+    """Rule address of a stored metric: ``source.metric`` (weekly sections already are)."""
+    return metric if source == 'weekly' else f"{source}.{metric}"
+
+
+def parse_condition(condition: str) -> Tuple[str, str, float]:
+    """``"change < -20%"`` -> ``('change', '<', -0.2)``."""
+    match = _CONDITION.match(str(condition))
+    if not match:
+        raise ValueError(f"invalid condition {condition!r} (expected e.g. '> 0.5', '< 3%', 'change < -20%')")
+    field, op, number, percent = match.groups()
+    threshold = float(number) / (100 if percent else 1)
+    return field or 'value', op, threshold
+
+
+def parse_window(window: Union[str, int]) -> int:
+    """``"7d"`` -> 7."""
+    if isinstance(window, int):
+        days = window
+    else:
+        match = _WINDOW.match(str(window))
+        if not match:
+            raise ValueError(f"invalid window {window!r} (expected e.g. '1d', '7d', '28d')")
+        days = int(match.group(1))
+    if days < 1:
+        raise ValueError(f"window must be at least one day, got {window!r}")
+    return days
+
+
+def _wide(frame: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Long rows -> dates x (market, rule metric key); the last row of a key wins."""
+    if frame is None or frame.empty:
+        return pd.DataFrame()
+    source, metric = frame['source'].astype(str), frame['metric'].astype(str)
+    keys = metric.where(source == 'weekly', source + '.' + metric)
+    frame = frame.assign(key=keys, market=frame['market'].fillna(DEFAULT_MARKET))
+    wide = frame.pivot_table(index='date', columns=['market', 'key'], values='value', aggfunc='last')
+    wide.index = pd.to_datetime(wide.index)
+    return wide.sort_index()
+
+
+def _rolled(daily: pd.DataFrame, days: int) -> pd.DataFrame:
+    """Trailing ``days`` values of every daily column (gap-free index)."""
+    if days == 1 or daily.empty:
+        return daily
+    keys = daily.columns.get_level_values('key').astype(str)
+    level = np.asarray(keys.str.split('.').str[0].isin(SNAPSHOT_SOURCES))
+    averaged = ~level & np.asarray(keys.str.contains(AVERAGED_METRICS))
+    summed = ~level & ~averaged
+    parts = []
+    if summed.any():
+        # A window with a missing day is not a total over the window
+        parts.append(daily.loc[:, summed].rolling(days, min_periods=days).sum())
+    if averaged.any():
+        parts.append(daily.loc[:, averaged].rolling(days, min_periods=1).mean())
+    if level.any():
+        parts.append(daily.loc[:, level].ffill())
+    return pd.concat(parts, axis=1)
+
+
+class InsightRules:
+    """A rule set compiled to vectorized predicates."""
+
+    def __init__(self, rules: Iterable[Dict[str, Any]]):
+        self.rules: List[Dict[str, Any]] = []
+        compiled = []
+        for position, rule in enumerate(rules):
+            rule = dict(rule)
+            rule.setdefault('id', f"rule-{position + 1}")
+            if not rule.get('metric'):
+                raise ValueError(f"rule {rule['id']}: 'metric' is required")
+            severity = str(rule.get('severity', 'medium')).lower()
+            if severity not in SEVERITY_RANK:
+                raise ValueError(f"rule {rule['id']}: unknown severity {severity!r} (one of {', '.join(SEVERITIES)})")
+            rule['severity'] = severity
+            conditions = rule.get('condition')
+            conditions = [conditions] if isinstance(conditions, str) else list(conditions or [])
+            if not conditions:
+                raise ValueError(f"rule {rule['id']}: 'condition' is required")
+            try:
+                terms = [parse_condition(c) for c in conditions]
+                window = parse_window(rule.get('window', f'{WINDOW_DAYS}d'))
+            except ValueError as e:
+                raise ValueError(f"rule {rule['id']}: {e}") from None
+            if len({field for field, _, _ in terms}) > 1:
+                raise ValueError(f"rule {rule['id']}: conditions must all test the value or all the change")
+            self.rules.append(rule)
+            compiled.append((rule['metric'], window, FIELDS.index(terms[0][0]), terms))
+
+        width = max((len(terms) for *_, terms in compiled), default=0)
+        count = len(compiled)
+        self.metrics = np.array([metric for metric, *_ in compiled], dtype=object)
+        self.windows = np.array([window for _, window, _, _ in compiled], dtype=int)
+        self.fields = np.array([field for _, _, field, _ in compiled], dtype=int)
+        # (rules x terms) operator codes and thresholds; -1 pads shorter condition lists
+        self.operators = np.full((count, width), -1, dtype=int)
+        self.thresholds = np.full((count, width), np.nan)
+        for r, (*_, terms) in enumerate(compiled):
+            for t, (_, op, threshold) in enumerate(terms):
+                self.operators[r, t] = OPERATOR_CODES[op]
+                self.thresholds[r, t] = threshold
+        self.reports = [set(rule.get('reports') or ()) for rule in self.rules]
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path] = None) -> 'InsightRules':
+        path = Path(path or os.getenv('TPS_INSIGHT_RULES') or DEFAULT_RULES_PATH)
+        with open(path, 'r', encoding='utf-8') as fh:
+            payload = json.load(fh)
+        return cls(payload['rules'] if isinstance(payload, dict) else payload)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    # -- inputs ---------------------------------------------------------------
+
+    def sources(self) -> List[str]:
+        """Warehouse sources the rules read (``weekly`` holds the report sections)."""
+        return sorted({str(metric).split('.')[0] for metric in self.metrics} | {'weekly'})
+
+    def read_inputs(self, warehouse: MetricsWarehouse = None, as_of: Optional[DateLike] = None,
+                    weeks: int = 1, markets=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Stored daily rows and 7-day window rows covering ``weeks`` evaluations up to ``as_of``."""
+        warehouse = warehouse or MetricsWarehouse()
+        end = pd.Timestamp(as_of or date.today()).normalize()
+        span = 2 * int(self.windows.max(initial=WINDOW_DAYS)) + WINDOW_DAYS * weeks + WINDOW_TOLERANCE_DAYS
+        start = end - timedelta(days=span)
+        columns = ['date', 'source', 'market', 'metric', 'value']
+        kwargs = dict(sources=self.sources(), start=start, end=end, markets=markets, columns=columns)
+        return warehouse.read(dimensions='', **kwargs), warehouse.read(dimensions=WEEK_WINDOW, **kwargs)
+
+    # -- evaluation -----------------------------------------------------------
+
+    def _values(self, daily: pd.DataFrame, windows: pd.DataFrame, days: int, end: pd.Timestamp) -> pd.DataFrame:
+        """Window values of every column on every day up to ``end``."""
+        frames = [w for w in (daily, windows) if not w.empty]
+        first = min(w.index.min() for w in frames)
+        span = pd.date_range(min(first, end), end)
+        values = _rolled(daily.reindex(span), days) if not daily.empty else pd.DataFrame(index=span)
+        if days == WINDOW_DAYS and not windows.empty:
+            # Stored 7-day totals fill in where there is no complete daily history
+            stored = windows.reindex(span).ffill(limit=WINDOW_TOLERANCE_DAYS)
+            values = values.combine_first(stored) if not values.empty else stored
+        return values
+
+    def evaluate(self, daily: Optional[pd.DataFrame] = None, windows: Optional[pd.DataFrame] = None,
+                 as_of: Optional[DateLike] = None, weeks: int = 1, markets=None,
+                 report: Optional[str] = None) -> pd.DataFrame:
+        """Rules that hold, one row per (week, market, rule), most severe first.
+
+        ``daily``: long rows of daily values; ``windows``: long rows that
+        already are 7-day totals (``window=7d``). Evaluated on ``as_of``
+        (default: the last day with data) and the ``weeks - 1`` weeks before.
+        ``report`` keeps the rules without ``reports`` plus those naming it.
+        """
+        daily, windows = _wide(daily), _wide(windows)
+        if daily.empty and windows.empty:
+            return pd.DataFrame(columns=HIT_COLUMNS)
+        if as_of is None:
+            as_of = max(w.index.max() for w in (daily, windows) if not w.empty)
+        end = pd.Timestamp(as_of).normalize()
+        dates = pd.DatetimeIndex([end - timedelta(days=WINDOW_DAYS * k) for k in range(weeks)])
+        present = {m for w in (daily, windows) if not w.empty for m in w.columns.get_level_values('market')}
+        markets = [m for m in (markets or sorted(present)) if m in present]
+
+        selected = np.array([not report or not reports or report in reports for reports in self.reports], dtype=bool)
+        hits = []
+        for days in np.unique(self.windows[selected]):
+            rules = np.flatnonzero(selected & (self.windows == days))
+            values = self._values(daily, windows, int(days), end)
+            columns = pd.MultiIndex.from_product([markets, self.metrics[rules]])
+            shape = (len(dates), len(markets), len(rules))
+            current = values.reindex(index=dates, columns=columns).to_numpy(dtype=float).reshape(shape)
+            previous = values.reindex(index=dates - timedelta(days=int(days)),
+                                      columns=columns).to_numpy(dtype=float).reshape(shape)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                change = (current - previous) / np.abs(previous)
+            change = np.where(np.isfinite(change), change, np.nan)
+            subject = np.where(self.fields[rules] == FIELDS.index('change'), change, current)
+
+            # One operator over every rule using it, term by term
+            holds = ~np.isnan(subject)
+            operators, thresholds = self.operators[rules], self.thresholds[rules]
+            for term in range(operators.shape[1]):
+                for op, code in OPERATOR_CODES.items():
+                    use = operators[:, term] == code
+                    if use.any():
+                        holds[..., use] &= OPERATORS[op](subject[..., use], thresholds[use, term])
+
+            d, m, r = np.nonzero(holds)
+            if len(d):
+                hits.append(pd.DataFrame({
+                    'date': dates[d],
+                    'market': np.asarray(markets, dtype=object)[m],
+                    'position': rules[r],
+                    'value': current[d, m, r],
+                    'previous': previous[d, m, r],
+                    'change': change[d, m, r],
+                }))
+        if not hits:
+            return pd.DataFrame(columns=HIT_COLUMNS)
+        return self._describe(pd.concat(hits, ignore_index=True))
+
+    def _describe(self, hits: pd.DataFrame) -> pd.DataFrame:
+        """Attach rule attributes and formatted texts to raw hits."""
+        rules = [self.rules[p] for p in hits['position']]
+        hits['rule'] = [rule['id'] for rule in rules]
+        hits['metric'] = [rule['metric'] for rule in rules]
+        hits['severity'] = [rule['severity'] for rule in rules]
+        hits['type'] = [rule.get('type', 'warning') for rule in rules]
+        hits['category'] = [rule.get('category', '') for rule in rules]
+        hits['priority'] = hits['severity'].str.capitalize()
+        texts = {'insight': [], 'recommendation': []}
+        for rule, hit in zip(rules, hits.itertuples(index=False)):
+            fields = {'value': hit.value, 'previous': hit.previous, 'change': hit.change,
+                      'market': hit.market, 'date': hit.date.strftime('%Y-%m-%d')}
+            for name in texts:
+                text = rule.get(name, '')
+                try:
+                    text = text.format(**fields)
+                except (KeyError, IndexError, ValueError):
+                    pass   # a template that does not fit (e.g. no previous window) is shown as written
+                if name == 'insight' and hit.market != DEFAULT_MARKET:
+                    text = f"[{hit.market}] {text}"
+                texts[name].append(text)
+        hits['insight'], hits['recommendation'] = texts['insight'], texts['recommendation']
+        hits['_rank'] = hits['severity'].map(SEVERITY_RANK)
+        hits = hits.sort_values(['_rank', 'date', 'position', 'market'], ascending=[True, False, True, True])
+        return hits[HIT_COLUMNS].reset_index(drop=True)
+
+    @staticmethod
+    def insights(hits: pd.DataFrame) -> List[Dict[str, str]]:
+        """Hits -> the ``type/category/insight/recommendation/priority`` dicts the reports render."""
+        keys = ['type', 'category', 'insight', 'recommendation', 'priority']
+        return hits[keys].to_dict('records') if not hits.empty else []
+
+
+def health_rows(df_health: pd.DataFrame, day: Optional[DateLike] = None) -> pd.DataFrame:
+    """Service health table (``Service``, ``Status``) -> daily ``health`` rows.
+
+    One metric per service (1 when ``OK``, else 0) plus ``score``, the share
+    of services OK in %.
+    """
+    day = pd.Timestamp(day or date.today()).normalize()
+    ok = (df_health['Status'].astype(str) == 'OK').astype(float)
+    metrics = list(df_health['Service'].astype(str)) + ['score']
+    values = list(ok) + [ok.mean() * 100 if len(ok) else np.nan]
+    return pd.DataFrame({'date': day, 'source': 'health', 'market': DEFAULT_MARKET,
+                         'metric': metrics, 'value': values}).dropna(subset=['value'])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Storefront Markets
+==================
+
+The markets the reports fan out to are the theme's storefront markets
+(``config/markets.json``, e.g. ``allemagne``). The file is written by the
+Shopify admin with a ``/* ... */`` header, which is stripped before parsing.
+
+Warehouse rows carry their market in the ``market`` column (``all`` for
+shop-wide totals); :func:`split_markets` slices a frame for every market in
+one groupby instead of one filter per market.
+
+Market rows are produced from GA4's ``countryId`` breakdown: each market
+handle maps to the countries it sells to (:data:`MARKET_COUNTRIES`), and
+:func:`fold_countries` sums a per-country daily report into per-market days.
+
+Usage:
+    from utils.markets import load_markets, split_markets
+
+    load_markets()                                   # ['allemagne']
+    split_markets(rows, ['allemagne', 'france'])     # {'allemagne': <rows>, 'france': <empty>}
+    country_markets(['allemagne'])                   # {'DE': 'allemagne'}
+
+Environment:
+    TPS_MARKETS=a,b              markets to report (overrides config/markets.json)
+    TPS_MARKET_COUNTRIES=allemagne=DE+AT,suisse=CH   countries of each market (overrides the defaults)
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Union
+
+import pandas as pd
+
+from utils.warehouse import DEFAULT_MARKET
+
+DEFAULT_MARKETS_PATH = Path(__file__).resolve().parents[2] / 'config' / 'markets.json'
+
+_BLOCK_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+# GA4 ``countryId`` (ISO 3166-1 alpha-2) of the storefront market handles
+MARKET_COUNTRIES = {
+    'allemagne': ['DE'],
+    'autriche': ['AT'],
+    'belgique': ['BE'],
+    'espagne': ['ES'],
+    'france': ['FR'],
+    'italie': ['IT'],
+    'luxembourg': ['LU'],
+    'pays-bas': ['NL'],
+    'portugal': ['PT'],
+    'royaume-uni': ['GB'],
+    'suisse': ['CH'],
+}
+
+
+def load_markets(path: Union[str, Path] = None) -> List[str]:
+    """Market handles, in file order (``TPS_MARKETS`` wins when set)."""
+    configured = os.getenv('TPS_MARKETS')
+    if configured and not path:
+        return [m.strip() for m in configured.split(',') if m.strip()]
+    path = Path(path or DEFAULT_MARKETS_PATH)
+    if not path.exists():
+        return []
+    payload = json.loads(_BLOCK_COMMENT.sub('', path.read_text(encoding='utf-8')))
+    return [name for name in payload.get('markets', {}) if name != DEFAULT_MARKET]
+
+
+def country_markets(markets: Iterable[str]) -> Dict[str, str]:
+    """``{country: market}`` for the given markets (markets without known countries are left out)."""
+    countries = {m: list(c) for m, c in MARKET_COUNTRIES.items()}
+    for entry in (os.getenv('TPS_MARKET_COUNTRIES') or '').split(','):
+        market, _, codes = entry.partition('=')
+        if market.strip() and codes.strip():
+            countries[market.strip()] = [c.strip().upper() for c in codes.split('+') if c.strip()]
+    return {country: market for market in markets for country in countries.get(market, [])}
+
+
+def fold_countries(frame: pd.DataFrame, countries: Dict[str, str], start, end,
+                   country_column: str = 'countryId') -> pd.DataFrame:
+    """Per-country daily rows -> one row per ``(date, market)``, every day of ``[start, end]``.
+
+    Countries outside every market are dropped (they only count in the shop
+    total); a market without rows on a day gets zeros, so only pass closed days.
+    """
+    markets = sorted(set(countries.values()))
+    days = pd.date_range(start, end, freq='D').strftime('%Y-%m-%d')
+    full = pd.MultiIndex.from_product([days, markets], names=['date', 'market'])
+    if frame is None or frame.empty or not markets:
+        return pd.DataFrame(index=full).reset_index()
+    metrics = [c for c in frame.columns if c not in ('date', country_column)
+               and pd.api.types.is_numeric_dtype(frame[c])]
+    rows = frame.assign(market=frame[country_column].map(countries)).dropna(subset=['market'])
+    totals = rows.groupby(['date', 'market'])[metrics].sum()
+    return totals.reindex(full, fill_value=0).reset_index()
+
+
+def split_markets(frame: pd.DataFrame, markets: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    """Rows of each market (an empty frame for a market without rows)."""
+    markets = list(markets)
+    if frame is None or frame.empty:
+        empty = pd.DataFrame(columns=frame.columns if frame is not None else None)
+        return {market: empty for market in markets}
+    groups = dict(tuple(frame.groupby(frame['market'].fillna(DEFAULT_MARKET).astype(str), sort=False)))
+    return {market: groups.get(market, frame.iloc[0:0]).reset_index(drop=True) for market in markets}
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Keyed Metrics Join
+==================
+
+Aligns metrics from every source on a common ``(period, market)`` key
+instead of gluing exports together by row position.
+
+1. Every input is normalized to long rows keyed by
+   ``(date, market, source, metric)`` (:func:`normalize_export` for the
+   per-source CSV exports, warehouse rows as they are). When the same key
+   comes twice, the later input wins, so re-ingested days restate the old
+   values.
+2. Dates are mapped to periods of the chosen grain in one vectorized step:
+   ``D`` (day), ``W`` (ISO week, labelled by its Monday), ``M`` (month,
+   labelled by its first day) or ``<n>D`` (trailing n-day windows labelled
+   by their last day, ending on the as-of day).
+3. One groupby rolls every metric up to its period: additive metrics are
+   summed, rates and averages are averaged, snapshot sources (Ahrefs) keep
+   their last value and are carried forward to periods without a snapshot.
+4. One pivot joins all sources: a row per ``(period, market)``, a
+   ``source.metric`` column per metric.
+
+Late-arriving data: the default as-of day is the last day *every* daily
+source has data for, so a source whose yesterday has not landed yet does not
+leave a short window next to full ones. The late day restates its period the
+next time the join runs.
+
+Usage:
+    from utils.metrics_join import MetricsJoin
+
+    join = MetricsJoin.from_warehouse(MetricsWarehouse())
+    join.join(grain='W')          # weekly, every source side by side
+    join.report_rows()            # source/metric/value for metrics_full_report.csv
+"""
+
+import re
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.warehouse import (COLUMNS, DEFAULT_MARKET, REPORT_LABELS, SNAPSHOT_SOURCES,
+                             MetricsWarehouse, daily_to_long, to_long)
+
+KEY = ['date', 'market', 'source', 'metric']
+
+# Daily history columns -> executive summary labels (sums over the 7-day window)
+DAILY_REPORT_LABELS = {
+    'shopify': {
+        'orders': 'Conversions (7d)',
+        'revenue': 'Revenue (7d)',
+    },
+    'ga4': {
+        'sessions': 'Sessions (7d)',
+        'screenPageViews': 'Pageviews (7d)',
+        'totalRevenue': 'Revenue (7d)',
+        'transactions': 'Conversions (7d)',
+    },
+}
+
+# Labels computed from other columns of the same row, after the roll-up
+DERIVED_REPORT_LABELS = {
+    'shopify': {
+        'AOV (7d)': lambda w: (w['shopify.revenue'] / w['shopify.orders']).where(w['shopify.orders'] > 0, 0.0),
+        'Net Revenue (7d)': lambda w: w['shopify.revenue'] - w['shopify.refunds'],
+    },
+}
+
+# Metrics that are averaged rather than summed over a period
+AVERAGED_METRICS = re.compile(r'(?:rate|ratio|avg|average|percent|pct|duration|depth|per_)', re.I)
+# Columns of the CSV exports that date a one-row snapshot, by preference
+_SNAPSHOT_DATE_COLUMNS = ('period_end', 'date', 'timestamp', 'generated_at')
+
+DateLike = Union[str, date, datetime]
+
+
+def normalize_export(source: str, frame: pd.DataFrame, market: str = DEFAULT_MARKET) -> pd.DataFrame:
+    """A per-source CSV export -> long keyed rows.
+
+    Daily tables (with a ``date`` column and several rows) are melted as
+    they are; one-row snapshots (``shopify_metrics.csv``, ``ga4_metrics.csv``)
+    are dated by their ``period_end`` / ``generated_at`` column, or today.
+    """
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    if 'date' in frame.columns and len(frame) > 1:
+        return daily_to_long(source, frame, market=market)
+    rows = []
+    for record in frame.to_dict('records'):
+        stamp = next((record[c] for c in _SNAPSHOT_DATE_COLUMNS if isinstance(record.get(c), str)), None)
+        day = pd.Timestamp(stamp).date() if stamp else date.today()
+        numbers = {k: v for k, v in record.items() if k not in _SNAPSHOT_DATE_COLUMNS}
+        rows.append(to_long(source, day, numbers, market=market))
+    return pd.concat(rows, ignore_index=True)
+
+
+def period_length(grain: str) -> Optional[int]:
+    """Days per period for fixed-size grains (None for months)."""
+    if grain == 'D':
+        return 1
+    if grain == 'W':
+        return 7
+    match = re.fullmatch(r'(\d+)D', grain)
+    if match:
+        return int(match.group(1))
+    if grain == 'M':
+        return None
+    raise ValueError(f"unknown grain: {grain} (use D, W, M or <n>D)")
+
+
+def assign_periods(days: pd.Series, grain: str, as_of: pd.Timestamp) -> pd.Series:
+    """Period label of every date (datetime64 Series), vectorized."""
+    if grain == 'D':
+        return days
+    if grain == 'W':
+        return days - pd.to_timedelta(days.dt.weekday, unit='D')
+    if grain == 'M':
+        return days.dt.to_period('M').dt.start_time
+    n = period_length(grain)
+    # Trailing windows: bucket k covers (as_of - (k+1)n, as_of - kn]
+    buckets = (as_of - days).dt.days // n
+    return as_of - pd.to_timedelta(buckets * n, unit='D')
+
+
+class MetricsJoin:
+    """Long keyed metric rows from any number of sources, joinable at any grain."""
+
+    def __init__(self, frames: Iterable[pd.DataFrame]):
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            self.rows = pd.DataFrame(columns=KEY + ['value'])
+            return
+        rows = pd.concat([f[[c for c in COLUMNS if c in f.columns]] for f in frames], ignore_index=True)
+        if 'dimensions' in rows:
+            # Totals only: breakdowns are joined through their own metrics
+            rows = rows[rows['dimensions'].fillna('') == '']
+        rows = rows.drop_duplicates(subset=KEY, keep='last')
+        self.rows = pd.DataFrame({
+            'date': pd.to_datetime(rows['date']),
+            'market': rows['market'].fillna(DEFAULT_MARKET).astype('category'),
+            'source': rows['source'].astype('category'),
+            'metric': rows['metric'].astype('category'),
+            'value': rows['value'].astype(float),
+        }).sort_values('date', kind='stable').reset_index(drop=True)
+
+    @classmethod
+    def from_warehouse(cls, warehouse: MetricsWarehouse = None, sources: Optional[Iterable[str]] = None,
+                       start: Optional[DateLike] = None, end: Optional[DateLike] = None,
+                       markets: Optional[Iterable[str]] = None) -> 'MetricsJoin':
+        """Daily and snapshot totals from the warehouse (weekly report sections excluded)."""
+        warehouse = warehouse or MetricsWarehouse()
+        sources = list(sources) if sources is not None else \
+            sorted({s for s, _, _ in warehouse.partitions()} - {'weekly'})
+        return cls([warehouse.read(sources, start=start, end=end, markets=markets, dimensions='',
+                                   columns=['date', 'source', 'market', 'metric', 'value'])])
+
+    # -- keys -----------------------------------------------------------------
+
+    def watermarks(self) -> Dict[str, pd.Timestamp]:
+        """Last day with data, per source."""
+        if self.rows.empty:
+            return {}
+        last = self.rows.groupby('source', observed=True)['date'].max()
+        return last.to_dict()
+
+    def as_of(self, sources: Optional[Iterable[str]] = None) -> Optional[pd.Timestamp]:
+        """Last day every daily (non-snapshot) source in ``sources`` has data for."""
+        marks = self.watermarks()
+        if sources is not None:
+            wanted = set(sources)
+            marks = {s: d for s, d in marks.items() if s in wanted}
+        daily = [d for s, d in marks.items() if s not in SNAPSHOT_SOURCES] or list(marks.values())
+        return min(daily) if daily else None
+
+    def lagging(self) -> Dict[str, pd.Timestamp]:
+        """Daily sources whose data stops before the newest source's."""
+        marks = {s: d for s, d in self.watermarks().items() if s not in SNAPSHOT_SOURCES}
+        newest = max(marks.values()) if marks else None
+        return {s: d for s, d in marks.items() if newest is not None and d < newest}
+
+    # -- roll-up and join -----------------------------------------------------
+
+    def rollup(self, grain: str = 'W', as_of: Optional[DateLike] = None) -> pd.DataFrame:
+        """One value per ``(period, market, source, metric)``, plus the days it covers."""
+        as_of = pd.Timestamp(as_of) if as_of is not None else self.as_of()
+        rows = self.rows if as_of is None else self.rows[self.rows['date'] <= as_of]
+        if rows.empty:
+            return pd.DataFrame(columns=['period', 'market', 'source', 'metric', 'value', 'days', 'complete'])
+        periods = assign_periods(rows['date'], grain, as_of)
+
+        grouped = rows.groupby([periods.rename('period'), 'market', 'source', 'metric'],
+                               observed=True, sort=False)['value']
+        out = grouped.agg(['sum', 'mean', 'last', 'size']).reset_index()
+
+        metric = out['metric'].astype(str)
+        snapshot = out['source'].astype(str).isin(SNAPSHOT_SOURCES).to_numpy()
+        averaged = metric.str.contains(AVERAGED_METRICS).to_numpy()
+        out['value'] = np.select([snapshot, averaged], [out['last'], out['mean']], default=out['sum'])
+
+        # Coverage: distinct days each source contributed to the period
+        days = rows.groupby([periods.rename('period'), 'market', 'source'], observed=True)['date'].nunique()
+        out = out.drop(columns=['sum', 'mean', 'last', 'size']).join(days.rename('days'),
+                                                                    on=['period', 'market', 'source'])
+        length = period_length(grain)
+        expected = out['period'].dt.days_in_month if length is None else length
+        out['complete'] = snapshot | (out['days'] >= expected).to_numpy()
+        return out
+
+    def join(self, grain: str = 'W', as_of: Optional[DateLike] = None,
+             markets: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Wide frame: one row per ``(period, market)``, one ``source.metric`` column per metric.
+
+        Snapshot sources are carried forward to later periods of the same
+        market, as an as-of join would.
+        """
+        rolled = self.rollup(grain, as_of)
+        if markets is not None:
+            rolled = rolled[rolled['market'].isin(list(markets))]
+        if rolled.empty:
+            return pd.DataFrame()
+        column = rolled['source'].astype(str) + '.' + rolled['metric'].astype(str)
+        wide = rolled.assign(column=column).pivot_table(index=['period', 'market'], columns='column',
+                                                        values='value', aggfunc='last', observed=True)
+        wide.columns.name = None
+        carried = [c for c in wide.columns if c.split('.', 1)[0] in SNAPSHOT_SOURCES]
+        if carried:
+            wide[carried] = wide[carried].groupby(level='market', observed=True).ffill()
+        return wide.sort_index()
+
+    # -- report ---------------------------------------------------------------
+
+    def report_rows(self, as_of: Optional[DateLike] = None, market: str = DEFAULT_MARKET,
+                    window_days: int = 7) -> pd.DataFrame:
+        """``source, metric, value`` rows of the trailing window ending on ``as_of``.
+
+        Only labelled metrics (:data:`DAILY_REPORT_LABELS`, derived ratios and
+        snapshot labels from :data:`REPORT_LABELS`) are emitted, in that order.
+        """
+        as_of = pd.Timestamp(as_of) if as_of is not None else self.as_of(DAILY_REPORT_LABELS)
+        columns = ['source', 'metric', 'value']
+        if as_of is None:
+            return pd.DataFrame(columns=columns)
+        wide = self.join(grain=f'{window_days}D', as_of=as_of, markets=[market])
+        if wide.empty or (as_of, market) not in wide.index:
+            return pd.DataFrame(columns=columns)
+        window = wide.loc[[(as_of, market)]]
+
+        rows = []
+        for source in [*DAILY_REPORT_LABELS, *SNAPSHOT_SOURCES]:
+            labels = DAILY_REPORT_LABELS.get(source) or REPORT_LABELS.get(source, {})
+            for metric, label in labels.items():
+                if f'{source}.{metric}' in window:
+                    rows.append((source, label, window[f'{source}.{metric}'].iloc[0]))
+            for label, formula in DERIVED_REPORT_LABELS.get(source, {}).items():
+                try:
+                    rows.append((source, label, float(formula(window).iloc[0])))
+                except KeyError:
+                    continue
+        report = pd.DataFrame(rows, columns=columns)
+        return report.dropna(subset=['value']).reset_index(drop=True)
+
+    def latest_rows(self, labels: Dict[str, Dict[str, str]] = None,
+                    market: str = DEFAULT_MARKET) -> pd.DataFrame:
+        """Most recent value of every metric per source, labelled where a label exists."""
+        labels = REPORT_LABELS if labels is None else labels
+        rows = self.rows[self.rows['market'] == market]
+        last = rows.groupby(['source', 'metric'], observed=True, sort=False)['value'].last().reset_index()
+        last['source'] = last['source'].astype(str)
+        last['metric'] = [labels.get(s, {}).get(m, m) for s, m in zip(last['source'], last['metric'].astype(str))]
+        return last[['source', 'metric', 'value']]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Shared OAuth Access-Token Cache
+===============================
+
+Every GA4 call path used to exchange the refresh token at
+``oauth2.googleapis.com/token`` on each run. :class:`TokenManager` keeps the
+access token on disk with its expiry and only refreshes shortly before it
+lapses. Refreshes are single-flight: a file lock (plus an in-process lock)
+makes concurrent report processes wait for one refresh and then reuse its
+result instead of each hitting the token endpoint.
+
+Usage:
+    from utils.oauth_tokens import get_ga4_access_token
+
+    token = get_ga4_access_token()   # cached, refreshed when near expiry
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+import requests
+
+from utils.http_transport import HTTPTransport, get_transport
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+DEFAULT_CACHE_DIR = Path(os.getenv('TPS_TOKEN_CACHE_DIR', Path.home() / '.cache' / 'tps-star'))
+REFRESH_MARGIN = 300  # refresh when fewer than 5 minutes remain
+
+
+class TokenRefreshError(RuntimeError):
+    """Raised when no token could be obtained: endpoint unreachable, refresh token refused, bad answer."""
+
+
+class TokenManager:
+    """Disk-cached, single-flight OAuth2 refresh-token exchange."""
+
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, client_id: str, client_secret: str, refresh_token: str,
+                 token_url: str = GOOGLE_TOKEN_URL, cache_dir: Path = None,
+                 refresh_margin: float = REFRESH_MARGIN, transport: HTTPTransport = None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.transport = transport or get_transport()
+
+        # One cache file per credential set; the key never contains the secret itself
+        key = hashlib.sha256(f"{token_url}|{client_id}|{refresh_token}".encode()).hexdigest()[:16]
+        cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.cache_path = cache_dir / f"oauth-{key}.json"
+        self.lock_path = cache_dir / f"oauth-{key}.lock"
+        with self._thread_locks_guard:
+            self._thread_lock = self._thread_locks.setdefault(key, threading.Lock())
+
+    def _read_cache(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _is_fresh(self, cached: Optional[Dict[str, Any]]) -> bool:
+        return bool(cached and cached.get('access_token')
+                    and float(cached.get('expires_at', 0)) - self.refresh_margin > time.time())
+
+    def _write_cache(self, payload: Dict[str, Any]):
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix('.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump(payload, fh)
+        os.replace(tmp, self.cache_path)
+
+    @contextmanager
+    def _exclusive(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, 'a') as lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _refresh(self) -> Dict[str, Any]:
+        """New token from the OAuth endpoint; every failure surfaces as ``TokenRefreshError``."""
+        try:
+            response = self.transport.request('POST', self.token_url, data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'refresh_token': self.refresh_token,
+                'grant_type': 'refresh_token',
+            })
+        except requests.exceptions.RequestException as e:
+            raise TokenRefreshError(f"token refresh failed: {e}") from e
+        if response.status_code != 200:
+            raise TokenRefreshError(f"token refresh failed: HTTP {response.status_code} {response.text[:200]}")
+        try:
+            data = response.json()
+            return {
+                'access_token': data['access_token'],
+                'expires_at': time.time() + float(data.get('expires_in', 3600)),
+                'scope': data.get('scope'),
+                'token_type': data.get('token_type', 'Bearer'),
+            }
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise TokenRefreshError(f"token refresh failed: no access_token in the response ({e!r})") from e
+
+    def get_access_token(self, force_refresh: bool = False) -> str:
+        """Return a valid access token, refreshing at most once across processes."""
+        cached = self._read_cache()
+        if not force_refresh and self._is_fresh(cached):
+            return cached['access_token']
+
+        with self._exclusive():
+            # Someone else may have refreshed while we waited for the lock
+            cached = self._read_cache()
+            if not force_refresh and self._is_fresh(cached):
+                return cached['access_token']
+            fresh = self._refresh()
+            self._write_cache(fresh)
+            print("🔑 OAuth access token refreshed (cached until "
+                  f"{time.strftime('%H:%M:%S', time.localtime(fresh['expires_at']))})")
+            return fresh['access_token']
+
+    def __call__(self) -> str:
+        return self.get_access_token()
+
+
+def ga4_token_manager_from_env() -> Optional[TokenManager]:
+    """Build a TokenManager from GA4_CLIENT_ID / GA4_CLIENT_SECRET / GA4_REFRESH_TOKEN."""
+    client_id = os.getenv('GA4_CLIENT_ID')
+    client_secret = os.getenv('GA4_CLIENT_SECRET')
+    refresh_token = os.getenv('GA4_REFRESH_TOKEN')
+    if not (client_id and client_secret and refresh_token):
+        return None
+    return TokenManager(client_id, client_secret, refresh_token)
+
+
+def get_ga4_access_token() -> Optional[str]:
+    """Cached GA4 access token, or GA4_ACCESS_TOKEN when no refresh credentials exist."""
+    manager = ga4_token_manager_from_env()
+    if manager is None:
+        return os.getenv('GA4_ACCESS_TOKEN')
+    return manager.get_access_token()
+
+
+def has_ga4_credentials() -> bool:
+    return bool(ga4_token_manager_from_env() or os.getenv('GA4_ACCESS_TOKEN'))
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Period-over-Period Comparisons
+==============================
+
+Every delta the reports show ("+8.7% vs last week") comes from here, computed
+for all metrics and markets of the warehouse in one pass:
+
+- ``wow``           last 7 days vs the 7 days before
+- ``mom``           last 4 weeks vs the 4 weeks before (weekdays line up)
+- ``yoy``           last 7 days vs the same 7 days 52 weeks earlier
+- ``rolling_4w``    average 7-day value over the last 4 weeks
+- ``same_weekday``  the last day vs the average of the same weekday over the
+  4 previous weeks
+
+Daily rows are first rolled into trailing 7-day windows (sums for additive
+metrics, means for rates, last value for snapshot sources). Rows that already
+are 7-day totals (``window=7d``: weekly report sections, exporter windows)
+are used as they are, carried forward up to 3 days so a report run a day late
+still lines up with last week's. Ratios (conversion rate, AOV) are computed
+from the windowed numerator and denominator, never averaged.
+
+Usage:
+    from utils.period_compare import PeriodComparison
+
+    comparison = PeriodComparison.from_warehouse()     # each source as of its last day
+    comparison.pct('weekly', 'ga4.sessions')           # WoW, in %
+    comparison.labelled('shopify', kind='yoy')         # {'Revenue (7d)': 8.7, ...}
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.metrics_join import AVERAGED_METRICS, DAILY_REPORT_LABELS
+from utils.warehouse import DEFAULT_MARKET, REPORT_LABELS, SNAPSHOT_SOURCES, WEEK_WINDOW, MetricsWarehouse
+
+WINDOW_DAYS = 7
+WEEKS = 4
+YEAR_LAG_DAYS = 364          # 52 weeks: same weekdays as this year
+WINDOW_TOLERANCE_DAYS = 3    # how long a 7-day total stands in for later days
+HISTORY_DAYS = YEAR_LAG_DAYS + WINDOW_DAYS + WINDOW_TOLERANCE_DAYS
+
+# Ratios recomputed from windowed totals: name -> (numerator, denominator)
+RATIO_METRICS = {
+    'ga4': {
+        'conversion_rate': ('transactions', 'sessions'),
+        'avg_order_value': ('totalRevenue', 'transactions'),
+    },
+    'shopify': {
+        'avg_order_value': ('revenue', 'orders'),
+    },
+    'weekly': {
+        'ga4.avg_order_value': ('ga4.revenue', 'ga4.transactions'),
+    },
+}
+
+RATIO_LABELS = {
+    'ga4': {'conversion_rate': 'ConvRate (7d)'},
+}
+
+DateLike = Union[str, date, datetime]
+
+
+def _wide(frame: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Long rows -> dates x (source, market, metric)."""
+    if frame is None or frame.empty:
+        return pd.DataFrame()
+    frame = frame.assign(market=frame['market'].fillna(DEFAULT_MARKET))
+    wide = frame.pivot_table(index='date', columns=['source', 'market', 'metric'], values='value', aggfunc='last')
+    wide.index = pd.to_datetime(wide.index)
+    return wide.sort_index()
+
+
+def _with_ratios(wide: pd.DataFrame) -> pd.DataFrame:
+    """Add the :data:`RATIO_METRICS` columns that are missing, for every market."""
+    added = {}
+    for source, market in {(s, m) for s, m, _ in wide.columns}:
+        for name, (numerator, denominator) in RATIO_METRICS.get(source, {}).items():
+            num, den = (source, market, numerator), (source, market, denominator)
+            if (source, market, name) in wide or num not in wide or den not in wide:
+                continue
+            added[(source, market, name)] = wide[num] / wide[den].where(wide[den] != 0)
+    if not added:
+        return wide
+    return pd.concat([wide, pd.DataFrame(added, index=wide.index)], axis=1)
+
+
+def _pct(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = (current - previous) / np.abs(previous) * 100
+    return np.where(np.isfinite(pct), pct, np.nan)
+
+
+def _summarize(windows: pd.DataFrame, days: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Comparison table from window values at the lag dates (and day values)."""
+    values = windows.to_numpy(dtype=float)
+    out = pd.DataFrame(index=windows.columns)
+    out['value'] = values[0]
+    out['wow'] = values[1]
+    # NaN in any week leaves the 4-week figures undefined rather than skewed
+    out['rolling_4w'] = values[0:WEEKS].mean(axis=0)
+    out['mom'] = values[WEEKS:2 * WEEKS].mean(axis=0)
+    out['yoy'] = values[2 * WEEKS]
+    for kind, current in (('wow', 'value'), ('mom', 'rolling_4w'), ('yoy', 'value')):
+        out[f'{kind}_pct'] = _pct(out[current].to_numpy(), out[kind].to_numpy())
+    if days is not None:
+        out['day'] = days.iloc[0].to_numpy()
+        out['same_weekday'] = days.iloc[1:].mean().to_numpy()
+        out['same_weekday_pct'] = _pct(out['day'].to_numpy(), out['same_weekday'].to_numpy())
+    return out
+
+
+class PeriodComparison:
+    """WoW / MoM / YoY / rolling / same-weekday comparisons of every stored metric."""
+
+    def __init__(self, daily: Optional[pd.DataFrame] = None, windows: Optional[pd.DataFrame] = None,
+                 as_of: Optional[DateLike] = None, source_as_of: Optional[Dict[str, DateLike]] = None):
+        """``daily``: long rows of daily totals; ``windows``: long rows that already are 7-day totals.
+
+        ``source_as_of`` compares the listed sources as of their own day
+        instead of ``as_of``.
+        """
+        self.daily = _wide(daily)
+        self.windows = _wide(windows)
+        if as_of is None:
+            ends = [w.index.max() for w in (self.daily, self.windows) if not w.empty]
+            as_of = max(ends) if ends else pd.Timestamp(date.today())
+        self.as_of = pd.Timestamp(as_of).normalize()
+        self.source_as_of = {s: pd.Timestamp(d).normalize() for s, d in (source_as_of or {}).items()}
+        self._table: Optional[pd.DataFrame] = None
+
+    @classmethod
+    def from_warehouse(cls, warehouse: MetricsWarehouse = None, as_of: Optional[DateLike] = None,
+                       markets=None) -> 'PeriodComparison':
+        """Comparisons from the last year of stored rows.
+
+        Without ``as_of`` every source is compared as of its own last day
+        (:meth:`MetricsWarehouse.last_days`): a provider that has not landed today's
+        rows yet does not compare a partial week, and one that stopped
+        weeks ago does not hold the others back. Pass ``date.today()`` to
+        compare every source up to today.
+        """
+        warehouse = warehouse or MetricsWarehouse()
+        marks = warehouse.last_days(markets) if as_of is None else {}
+        if as_of is not None or not marks:
+            end = first = pd.Timestamp(as_of if as_of is not None else date.today()).normalize()
+        else:
+            end, first = max(marks.values()), min(marks.values())
+            daily_marks = {s: d for s, d in marks.items() if s not in SNAPSHOT_SOURCES and s != 'weekly'}
+            newest = max(daily_marks.values()) if daily_marks else None
+            for source, day in sorted(daily_marks.items()):
+                if day < newest:
+                    print(f"⏳ {source}: nothing after {day.date()} yet, its comparisons stop there")
+        start = first - timedelta(days=HISTORY_DAYS + WEEKS * WINDOW_DAYS)
+        columns = ['date', 'source', 'market', 'metric', 'value']
+        daily = warehouse.read(start=start, end=end, markets=markets, dimensions='', columns=columns)
+        windows = warehouse.read(start=start, end=end, markets=markets, dimensions=WEEK_WINDOW, columns=columns)
+        return cls(daily, windows, as_of=end if as_of is not None else None, source_as_of=marks)
+
+    # -- computation ----------------------------------------------------------
+
+    @staticmethod
+    def _lags(as_of: pd.Timestamp, count: int) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex([as_of - timedelta(days=WINDOW_DAYS * k) for k in range(count)])
+
+    @staticmethod
+    def _daily_windows(daily: pd.DataFrame, as_of: pd.Timestamp) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Trailing 7-day values of every daily column, and the gap-free daily frame."""
+        full = daily.reindex(pd.date_range(min(daily.index.min(), as_of), as_of))
+        sources = full.columns.get_level_values('source')
+        metrics = full.columns.get_level_values('metric').astype(str)
+        level = np.asarray(sources.isin(SNAPSHOT_SOURCES))
+        averaged = ~level & np.asarray(metrics.str.contains(AVERAGED_METRICS))
+        summed = ~level & ~averaged
+
+        parts = []
+        if summed.any():
+            # A window with a missing day is not a 7-day total
+            parts.append(full.loc[:, summed].rolling(WINDOW_DAYS, min_periods=WINDOW_DAYS).sum())
+        if averaged.any():
+            parts.append(full.loc[:, averaged].rolling(WINDOW_DAYS, min_periods=1).mean())
+        if level.any():
+            parts.append(full.loc[:, level].ffill())
+        return pd.concat(parts, axis=1), full
+
+    def compute(self) -> pd.DataFrame:
+        """One row per ``(source, market, metric)``:
+
+        ``value, wow, wow_pct, rolling_4w, mom, mom_pct, yoy, yoy_pct`` and,
+        for daily metrics, ``day, same_weekday, same_weekday_pct``.
+        """
+        sources = set(self.daily.columns.get_level_values('source') if not self.daily.empty else [])
+        sources |= set(self.windows.columns.get_level_values('source') if not self.windows.empty else [])
+        # One pass per distinct as-of day (usually one or two)
+        groups: Dict[pd.Timestamp, list] = {}
+        for source in sorted(sources):
+            groups.setdefault(self.source_as_of.get(source, self.as_of), []).append(source)
+
+        parts = []
+        for as_of, group in groups.items():
+            daily = self.daily.loc[:, self.daily.columns.get_level_values('source').isin(group)] \
+                if not self.daily.empty else self.daily
+            windows = self.windows.loc[:, self.windows.columns.get_level_values('source').isin(group)] \
+                if not self.windows.empty else self.windows
+            parts.extend(self._compute_at(as_of, daily, windows))
+        if not parts:
+            return pd.DataFrame()
+        table = pd.concat(parts)
+        # Daily history is more precise than a stored window of the same metric
+        table = table[~table.index.duplicated(keep='first')]
+        table.index.names = ['source', 'market', 'metric']
+        return table.sort_index()
+
+    def _compute_at(self, as_of: pd.Timestamp, daily: pd.DataFrame, windows: pd.DataFrame) -> list:
+        lags = self._lags(as_of, 2 * WEEKS).append(pd.DatetimeIndex([as_of - timedelta(days=YEAR_LAG_DAYS)]))
+        parts = []
+        if not daily.empty:
+            rolled, days = self._daily_windows(daily, as_of)
+            rolled = _with_ratios(rolled)
+            days = _with_ratios(days).reindex(index=self._lags(as_of, WEEKS + 1), columns=rolled.columns)
+            parts.append(_summarize(rolled.reindex(lags), days))
+        if not windows.empty:
+            full = windows.reindex(pd.date_range(min(windows.index.min(), as_of), as_of))
+            full = full.ffill(limit=WINDOW_TOLERANCE_DAYS)
+            parts.append(_summarize(_with_ratios(full).reindex(lags), None))
+        return parts
+
+    @property
+    def table(self) -> pd.DataFrame:
+        if self._table is None:
+            self._table = self.compute()
+        return self._table
+
+    # -- lookups --------------------------------------------------------------
+
+    def row(self, source: str, metric: str, market: str = DEFAULT_MARKET) -> Optional[pd.Series]:
+        if self.table.empty:
+            return None
+        try:
+            return self.table.loc[(source, market, metric)]
+        except KeyError:
+            return None
+
+    def pct(self, source: str, metric: str, kind: str = 'wow', market: str = DEFAULT_MARKET) -> Optional[float]:
+        """Change in % (``kind`` = wow, mom, yoy or same_weekday); None when undefined."""
+        row = self.row(source, metric, market)
+        if row is None or f'{kind}_pct' not in row or pd.isna(row[f'{kind}_pct']):
+            return None
+        return float(row[f'{kind}_pct'])
+
+    def labelled(self, source: str, kind: str = 'wow', market: str = DEFAULT_MARKET) -> Dict[str, float]:
+        """Changes keyed by the report labels (daily metrics win over exported windows)."""
+        deltas: Dict[str, float] = {}
+        for labels in (DAILY_REPORT_LABELS, RATIO_LABELS, REPORT_LABELS):
+            for metric, label in labels.get(source, {}).items():
+                pct = self.pct(source, metric, kind, market)
+                if label not in deltas and pct is not None:
+                    deltas[label] = pct
+        return deltas
+
+
+def compare_series(series: pd.Series, name: str = 'value') -> Dict[str, float]:
+    """Comparisons of one daily series (DatetimeIndex), e.g. a chart's data."""
+    frame = pd.DataFrame({'date': series.index, 'source': 'series', 'market': DEFAULT_MARKET,
+                          'metric': name, 'value': series.to_numpy(dtype=float)})
+    table = PeriodComparison(daily=frame).table
+    return table.iloc[0].to_dict() if not table.empty else {}
+
+
+def format_pct(pct: Optional[float], suffix: str = '') -> str:
+    """``+8.7%`` / ``-2.1%`` / ``n/a``."""
+    if pct is None or not np.isfinite(pct):
+        return 'n/a'
+    return f"{pct:+.1f}%{suffix}"
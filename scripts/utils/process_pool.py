@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Process Pool Runner
+===================
+
+Runs independent, CPU-bound report jobs (one market, one week, one chart)
+in worker processes and returns their results in job order, whatever order
+the workers finish in.
+
+Workers are started with ``spawn``: the parent may still hold collection
+threads or open HTTP pools, and a forked copy of those is not safe (spawn is
+also the macOS default, so runs behave the same on laptops and CI). Job
+functions must therefore be module-level and their arguments picklable.
+
+Usage:
+    from utils.process_pool import run_in_pool
+
+    results = run_in_pool(render_market, jobs)           # one worker per core
+    results = run_in_pool(render_market, jobs, workers=1)  # in-process, for debugging
+
+Environment:
+    TPS_POOL_WORKERS=N           default pool size (default: one per core)
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+
+def available_cores() -> int:
+    """Cores this process may run on (CPU affinity / container limits included)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def pool_size(jobs: int, workers: Optional[int] = None) -> int:
+    """Workers to start for ``jobs`` jobs: requested / TPS_POOL_WORKERS / cores, never more than jobs."""
+    if not workers:
+        workers = int(os.getenv('TPS_POOL_WORKERS', '0') or 0) or available_cores()
+    return max(1, min(workers, jobs))
+
+
+def run_in_pool(fn: Callable[[Any], Any], jobs: Sequence[Any], workers: Optional[int] = None) -> List[Any]:
+    """``[fn(job) for job in jobs]``, computed in worker processes.
+
+    With a single worker (or a single job) everything runs in-process.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    size = pool_size(len(jobs), workers)
+    if size == 1:
+        return [fn(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(fn, jobs))
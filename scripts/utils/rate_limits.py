@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Provider-Aware Rate-Limit Scheduler
+===================================
+
+One token bucket per provider, consulted by
+:class:`utils.http_transport.HTTPTransport` before every request that names
+its ``provider``. Each bucket is measured in the unit the provider meters:
+
+- ``shopify``          REST leaky bucket (``X-Shopify-Shop-Api-Call-Limit: 32/40``)
+- ``shopify_graphql``  GraphQL cost points (``extensions.cost.throttleStatus``)
+- ``ga4``              property tokens per hour (``propertyQuota.tokensPerHour``)
+- ``ahrefs``, ``sentry``, ``amplitude``, ``hotjar``, ``clarity``  requests
+
+Buckets refill continuously and are corrected from whatever the provider
+reports back (headers, or explicit :meth:`RateLimitScheduler.record` calls for
+budgets returned in the body). A 429 empties the bucket until its retry delay
+has passed, for every process.
+
+State lives in one small JSON file per provider guarded by a file lock, so
+parallel report jobs on the same machine draw from one shared quota.
+
+Usage:
+    from utils.rate_limits import get_scheduler
+
+    get_scheduler().budget('shopify')
+    # {'provider': 'shopify', 'tokens': 37.5, 'capacity': 40, ...}
+
+Environment:
+    TPS_RATE_LIMITS=0            disable scheduling
+    TPS_RATE_STATE_DIR=...       default ~/.cache/tps-star/ratelimits
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+import requests
+
+# provider -> (capacity, refill per second, estimated cost of one request)
+PROVIDER_LIMITS = {
+    'shopify': (40, 2.0, 1),
+    'shopify_graphql': (1000, 50.0, 10),
+    'ga4': (40000, 40000 / 3600, 10),
+    'ahrefs': (60, 1.0, 1),
+    'sentry': (40, 40.0, 1),
+    'amplitude': (60, 1.0, 1),
+    'hotjar': (60, 1.0, 1),
+    'clarity': (10, 10 / 86400, 1),   # Clarity export API: 10 calls per project per day
+}
+
+MAX_SLEEP = 5.0  # re-check shared state at least this often while waiting
+
+
+def _parse_fraction(value: Optional[str]):
+    """``"32/40"`` -> ``(32.0, 40.0)``."""
+    try:
+        used, capacity = value.split('/')
+        return float(used), float(capacity)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _header_float(headers, *names) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
+
+
+class RateLimitScheduler:
+    """Cross-process token buckets keyed by provider."""
+
+    def __init__(self, state_dir: Union[str, Path], limits: Dict[str, tuple] = None):
+        self.state_dir = Path(state_dir)
+        self.limits = dict(PROVIDER_LIMITS if limits is None else limits)
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    # -- shared state ---------------------------------------------------------
+
+    def _thread_lock(self, provider: str) -> threading.Lock:
+        with self._guard:
+            return self._thread_locks.setdefault(provider, threading.Lock())
+
+    @contextmanager
+    def _exclusive(self, provider: str):
+        with self._thread_lock(provider):
+            if fcntl is None:
+                yield
+                return
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.state_dir / f"ratelimit-{provider}.lock", 'a') as lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _state_path(self, provider: str) -> Path:
+        return self.state_dir / f"ratelimit-{provider}.json"
+
+    def _load(self, provider: str, now: float) -> Dict[str, Any]:
+        capacity, refill, cost = self.limits[provider]
+        try:
+            with open(self._state_path(provider), 'r', encoding='utf-8') as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            state = {'tokens': float(capacity), 'capacity': float(capacity), 'refill': refill,
+                     'cost': float(cost), 'blocked_until': 0.0, 'updated_at': now}
+        # Continuous refill since the last writer
+        elapsed = max(0.0, now - state['updated_at'])
+        state['tokens'] = min(state['capacity'], state['tokens'] + elapsed * state['refill'])
+        state['updated_at'] = now
+        return state
+
+    def _save(self, provider: str, state: Dict[str, Any]):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        path = self._state_path(provider)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(state, fh)
+        os.replace(tmp, path)
+
+    # -- public API -----------------------------------------------------------
+
+    def acquire(self, provider: Optional[str], cost: Optional[float] = None) -> float:
+        """Block until ``provider`` has budget for one request; return seconds waited."""
+        if provider not in self.limits:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._exclusive(provider):
+                now = time.time()
+                state = self._load(provider, now)
+                need = min(state['capacity'], cost if cost is not None else state['cost'])
+                if now >= state['blocked_until'] and state['tokens'] >= need:
+                    state['tokens'] -= need
+                    self._save(provider, state)
+                    return waited
+                delay = max(state['blocked_until'] - now,
+                            (need - state['tokens']) / state['refill'] if state['refill'] else MAX_SLEEP)
+                self._save(provider, state)
+            delay = min(MAX_SLEEP, max(delay, 0.01))
+            time.sleep(delay)
+            waited += delay
+
+    def try_acquire(self, provider: Optional[str], cost: Optional[float] = None) -> bool:
+        """Take budget for one request only if it is available right now."""
+        if provider not in self.limits:
+            return True
+        with self._exclusive(provider):
+            now = time.time()
+            state = self._load(provider, now)
+            need = min(state['capacity'], cost if cost is not None else state['cost'])
+            granted = now >= state['blocked_until'] and state['tokens'] >= need
+            if granted:
+                state['tokens'] -= need
+            self._save(provider, state)
+        return granted
+
+    def record(self, provider: Optional[str], remaining: Optional[float] = None,
+               capacity: Optional[float] = None, refill: Optional[float] = None,
+               cost: Optional[float] = None, retry_after: Optional[float] = None,
+               lower_only: bool = False):
+        """Correct a bucket from what the provider reported."""
+        if provider not in self.limits:
+            return
+        with self._exclusive(provider):
+            now = time.time()
+            state = self._load(provider, now)
+            if capacity:
+                state['capacity'] = float(capacity)
+            if refill:
+                state['refill'] = float(refill)
+            if remaining is not None:
+                remaining = max(0.0, min(state['capacity'], float(remaining)))
+                state['tokens'] = min(state['tokens'], remaining) if lower_only else remaining
+            if cost:
+                state['cost'] = float(cost)
+            if retry_after is not None:
+                state['tokens'] = 0.0
+                state['blocked_until'] = max(state['blocked_until'], now + retry_after)
+            self._save(provider, state)
+
+    def observe(self, provider: Optional[str], response: requests.Response):
+        """Update ``provider``'s bucket from response headers."""
+        if provider not in self.limits:
+            return
+        headers = response.headers
+        remaining = capacity = None
+
+        call_limit = _parse_fraction(headers.get('X-Shopify-Shop-Api-Call-Limit'))
+        if call_limit:
+            used, capacity = call_limit
+            # ``used`` is a rounded-down leaky-bucket level; keep one call in hand
+            remaining = capacity - used - 1
+        else:
+            remaining = _header_float(headers, 'X-Sentry-Rate-Limit-Remaining', 'X-RateLimit-Remaining')
+            capacity = _header_float(headers, 'X-Sentry-Rate-Limit-Limit', 'X-RateLimit-Limit')
+
+        if remaining is not None or capacity is not None:
+            # Headers trail requests already in flight: only ever lower the estimate
+            self.record(provider, remaining=remaining, capacity=capacity, lower_only=True)
+
+    def budget(self, provider: str) -> Dict[str, Any]:
+        """Current (refilled) budget of ``provider``, as seen by every process."""
+        with self._exclusive(provider):
+            state = self._load(provider, time.time())
+        return {
+            'provider': provider,
+            'tokens': round(state['tokens'], 2),
+            'capacity': state['capacity'],
+            'refill_per_second': state['refill'],
+            'request_cost': state['cost'],
+            'blocked_for': round(max(0.0, state['blocked_until'] - time.time()), 2),
+        }
+
+    def budgets(self) -> Dict[str, Dict[str, Any]]:
+        return {provider: self.budget(provider) for provider in self.limits}
+
+
+_shared_scheduler: Optional[RateLimitScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[RateLimitScheduler]:
+    """Process-wide scheduler (None when TPS_RATE_LIMITS=0)."""
+    global _shared_scheduler
+    if os.getenv('TPS_RATE_LIMITS', '1').lower() in ('0', 'false', 'off', 'no'):
+        return None
+    with _shared_lock:
+        if _shared_scheduler is None:
+            state_dir = os.getenv('TPS_RATE_STATE_DIR', str(Path.home() / '.cache' / 'tps-star' / 'ratelimits'))
+            _shared_scheduler = RateLimitScheduler(state_dir)
+        return _shared_scheduler
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Circuit Breakers and Hedged Requests
+====================================
+
+Keeps the report's tail latency bounded when a provider misbehaves. Both are
+applied by :class:`utils.http_transport.HTTPTransport` to every request that
+names its ``provider``:
+
+- :class:`CircuitBreaker`: after ``TPS_CIRCUIT_THRESHOLD`` consecutive
+  failures (connection errors, timeouts, 5xx) the provider's circuit opens
+  and calls fail fast with :class:`CircuitOpen` instead of waiting out their
+  timeouts. After the cool-down a single probe request is let through: a
+  success closes the circuit, a failure re-opens it for twice as long.
+  State is persisted per provider, so the next run (and parallel jobs)
+  start from what the previous one learnt.
+- :class:`LatencyTracker`: rolling per-provider latencies. An idempotent GET
+  still unanswered after the provider's p95 gets a second, hedged copy; the
+  first answer wins.
+
+Usage:
+    from utils.resilience import get_breaker
+
+    get_breaker().status('sentry')
+    # {'provider': 'sentry', 'state': 'open', 'failures': 3, 'retry_in': 241.0, ...}
+
+Environment:
+    TPS_CIRCUIT_BREAKER=0        disable the breaker
+    TPS_CIRCUIT_THRESHOLD=3      consecutive failures before opening
+    TPS_CIRCUIT_COOLDOWN=300     first cool-down in seconds (doubles per failed probe)
+    TPS_CIRCUIT_STATE_DIR=...    default ~/.cache/tps-star/circuits
+    TPS_HEDGE_REQUESTS=1         hedge slow GETs
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+import requests
+
+DEFAULT_THRESHOLD = 3
+DEFAULT_COOLDOWN = 300.0
+MAX_COOLDOWN = 3600.0
+PROBE_LEASE = 60.0  # another probe may start if the previous one never reported back
+
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+MIN_HEDGE_DELAY = 0.05
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """The provider's circuit is open: the call was not attempted."""
+
+
+class CircuitBreaker:
+    """Cross-process circuit breakers keyed by provider."""
+
+    def __init__(self, state_dir: Union[str, Path], threshold: int = DEFAULT_THRESHOLD,
+                 cooldown: float = DEFAULT_COOLDOWN, max_cooldown: float = MAX_COOLDOWN):
+        self.state_dir = Path(state_dir)
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    # -- shared state ---------------------------------------------------------
+
+    def _thread_lock(self, provider: str) -> threading.Lock:
+        with self._guard:
+            return self._thread_locks.setdefault(provider, threading.Lock())
+
+    @contextmanager
+    def _exclusive(self, provider: str):
+        with self._thread_lock(provider):
+            if fcntl is None:
+                yield
+                return
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.state_dir / f"circuit-{provider}.lock", 'a') as lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _state_path(self, provider: str) -> Path:
+        return self.state_dir / f"circuit-{provider}.json"
+
+    def _load(self, provider: str) -> Dict[str, Any]:
+        try:
+            with open(self._state_path(provider), 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {'state': 'closed', 'failures': 0, 'opened_until': 0.0,
+                    'cooldown': self.cooldown, 'probe_until': 0.0, 'last_error': None}
+
+    def _save(self, provider: str, state: Dict[str, Any]):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        path = self._state_path(provider)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(state, fh)
+        os.replace(tmp, path)
+
+    # -- public API -----------------------------------------------------------
+
+    def before(self, provider: str) -> bool:
+        """Admit one call to ``provider``; return True when it is the recovery probe.
+
+        Raises :class:`CircuitOpen` while the circuit is open, or while another
+        caller's probe is in flight.
+        """
+        with self._exclusive(provider):
+            state = self._load(provider)
+            if state['state'] == 'closed':
+                return False
+            now = time.time()
+            if now < state['opened_until']:
+                raise CircuitOpen(f"{provider}: circuit open, retry in {state['opened_until'] - now:.0f}s "
+                                  f"(last error: {state['last_error']})")
+            if state['state'] == 'half_open' and now < state['probe_until']:
+                raise CircuitOpen(f"{provider}: circuit half-open, recovery probe in flight")
+            state['state'] = 'half_open'
+            state['probe_until'] = now + PROBE_LEASE
+            self._save(provider, state)
+        print(f"🔌 {provider}: cool-down over, probing recovery")
+        return True
+
+    def success(self, provider: str):
+        with self._exclusive(provider):
+            state = self._load(provider)
+            if state['state'] == 'closed' and not state['failures']:
+                return
+            recovered = state['state'] != 'closed'
+            self._save(provider, {'state': 'closed', 'failures': 0, 'opened_until': 0.0,
+                                  'cooldown': self.cooldown, 'probe_until': 0.0, 'last_error': None})
+        if recovered:
+            print(f"✅ {provider}: recovered, circuit closed")
+
+    def failure(self, provider: str, error: Any) -> bool:
+        """Count one failed call; return True when the circuit is (now) open."""
+        with self._exclusive(provider):
+            state = self._load(provider)
+            now = time.time()
+            state['failures'] += 1
+            state['last_error'] = str(error)[:200]
+            if state['state'] == 'half_open':
+                # Failed probe: back off for longer
+                state['cooldown'] = min(self.max_cooldown, state['cooldown'] * 2)
+            elif state['state'] == 'open' or state['failures'] < self.threshold:
+                self._save(provider, state)
+                return state['state'] == 'open'
+            state['state'] = 'open'
+            state['opened_until'] = now + state['cooldown']
+            state['probe_until'] = 0.0
+            self._save(provider, state)
+        print(f"🔌 {provider}: circuit open after {state['failures']} failure(s), "
+              f"failing fast for {state['cooldown']:.0f}s ({state['last_error']})")
+        return True
+
+    def status(self, provider: str) -> Dict[str, Any]:
+        with self._exclusive(provider):
+            state = self._load(provider)
+        return {
+            'provider': provider,
+            'state': state['state'],
+            'failures': state['failures'],
+            'retry_in': round(max(0.0, state['opened_until'] - time.time()), 1),
+            'cooldown': state['cooldown'],
+            'last_error': state['last_error'],
+        }
+
+    def reset(self, provider: str):
+        with self._exclusive(provider):
+            try:
+                self._state_path(provider).unlink()
+            except OSError:
+                pass
+
+
+class LatencyTracker:
+    """Rolling latency samples per provider (in-process)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_LATENCY_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, provider: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, provider: str, q: float = 0.95) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(provider) or ())
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """Seconds to wait before hedging a GET (None until enough samples)."""
+        p95 = self.percentile(provider)
+        return None if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+
+_shared_breaker: Optional[CircuitBreaker] = None
+_shared_lock = threading.Lock()
+
+
+def get_breaker() -> Optional[CircuitBreaker]:
+    """Process-wide breaker (None when TPS_CIRCUIT_BREAKER=0)."""
+    global _shared_breaker
+    if os.getenv('TPS_CIRCUIT_BREAKER', '1').lower() in ('0', 'false', 'off', 'no'):
+        return None
+    with _shared_lock:
+        if _shared_breaker is None:
+            state_dir = os.getenv('TPS_CIRCUIT_STATE_DIR', str(Path.home() / '.cache' / 'tps-star' / 'circuits'))
+            _shared_breaker = CircuitBreaker(
+                state_dir,
+                threshold=int(os.getenv('TPS_CIRCUIT_THRESHOLD', DEFAULT_THRESHOLD)),
+                cooldown=float(os.getenv('TPS_CIRCUIT_COOLDOWN', DEFAULT_COOLDOWN)),
+            )
+        return _shared_breaker
+
+
+def hedging_from_env() -> bool:
+    return os.getenv('TPS_HEDGE_REQUESTS', '0').lower() in ('1', 'true', 'on', 'yes')
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Immutable-Day Response Cache
+============================
+
+On-disk cache sitting in :class:`utils.http_transport.HTTPTransport`, below
+every connector. Entries are content-addressed: the key is a SHA-256 of
+provider, method, URL, query parameters, request body and the last calendar
+day the request covers (``as_of``).
+
+- ``as_of`` on a closed day (before today, minus a per-provider settle lag)
+  -> cached forever; finished days never change.
+- ``as_of`` today (or still settling) -> short TTL.
+- Requests without ``as_of`` are never cached.
+
+Total size is bounded; least-recently-used entries are evicted (hits touch
+the entry's mtime).
+
+Environment:
+    TPS_RESPONSE_CACHE=0                 disable
+    TPS_RESPONSE_CACHE_DIR=...           default ~/.cache/tps-star/responses
+    TPS_RESPONSE_CACHE_MAX_MB=512        size bound
+    TPS_RESPONSE_CACHE_TODAY_TTL=900     seconds, for open days
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Providers that keep revising recent days (GA4 processing can take ~48h)
+SETTLE_DAYS = {
+    'ga4': 2,
+}
+
+# Headers worth replaying (pagination cursors, rate-limit hints, content type)
+_KEPT_HEADERS = ('content-type', 'link', 'x-shopify-shop-api-call-limit',
+                 'x-sentry-rate-limit-remaining', 'retry-after')
+
+_DAYS_AGO_RE = re.compile(r'^(\d+)daysAgo$')
+
+
+def resolve_day(value: Union[str, date, datetime], today: Optional[date] = None) -> date:
+    """Resolve a date (or GA4-style relative date) to a calendar day."""
+    today = today or date.today()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value == 'today':
+        return today
+    if value == 'yesterday':
+        return today - timedelta(days=1)
+    match = _DAYS_AGO_RE.match(value)
+    if match:
+        return today - timedelta(days=int(match.group(1)))
+    return datetime.fromisoformat(value[:10]).date()
+
+
+class ResponseCache:
+    """Content-addressed, size-bounded LRU cache of HTTP responses."""
+
+    def __init__(self, root: Union[str, Path], max_bytes: int = 512 * 1024 * 1024,
+                 today_ttl: float = 900.0):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.today_ttl = today_ttl
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(provider: Optional[str], method: str, url: str, params: Any = None,
+            body: Any = None, as_of: Optional[date] = None) -> str:
+        material = json.dumps({
+            'provider': provider,
+            'method': method.upper(),
+            'url': url,
+            'params': params,
+            'body': body,
+            'as_of': as_of.isoformat() if as_of else None,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def is_closed(self, provider: Optional[str], as_of: date, today: Optional[date] = None) -> bool:
+        today = today or date.today()
+        return as_of < today - timedelta(days=SETTLE_DAYS.get(provider or '', 0))
+
+    def get(self, key: str) -> Optional[requests.Response]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        expires_at = entry.get('expires_at')
+        if expires_at is not None and expires_at < time.time():
+            self.misses += 1
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)  # LRU bookkeeping
+        except OSError:
+            pass
+        self.hits += 1
+        return self._to_response(entry)
+
+    def put(self, key: str, response: requests.Response, provider: Optional[str], as_of: date):
+        expires_at = None if self.is_closed(provider, as_of) else time.time() + self.today_ttl
+        entry = {
+            'provider': provider,
+            'as_of': as_of.isoformat(),
+            'stored_at': time.time(),
+            'expires_at': expires_at,
+            'url': response.url,
+            'status_code': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in _KEPT_HEADERS},
+            'body_b64': base64.b64encode(response.content).decode('ascii'),
+        }
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(entry, fh)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += path.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    @staticmethod
+    def _to_response(entry: Dict[str, Any]) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry['status_code']
+        response.headers = CaseInsensitiveDict(entry.get('headers') or {})
+        response.headers['X-TPS-Cache'] = 'hit'
+        response._content = base64.b64decode(entry['body_b64'])
+        response.url = entry.get('url')
+        response.encoding = 'utf-8'
+        return response
+
+    def _entries(self):
+        if not self.root.exists():
+            return []
+        return [p for p in self.root.glob('*/*.json')]
+
+    def _scan_size(self) -> int:
+        total = 0
+        for path in self._entries():
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _remove(self, path: Path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _evict(self):
+        """Drop least-recently-used entries until under 90% of the bound."""
+        target = int(self.max_bytes * 0.9)
+        stats = []
+        for path in self._entries():
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            stats.append((st.st_mtime, st.st_size, path))
+        stats.sort()
+        size = sum(s for _, s, _ in stats)
+        for _, entry_size, path in stats:
+            if size <= target:
+                break
+            try:
+                path.unlink()
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
+
+
+def cache_from_env() -> Optional[ResponseCache]:
+    """Build the response cache configured by TPS_RESPONSE_CACHE_* (None when disabled)."""
+    if os.getenv('TPS_RESPONSE_CACHE', '1').lower() in ('0', 'false', 'off', 'no'):
+        return None
+    root = os.getenv('TPS_RESPONSE_CACHE_DIR', str(Path.home() / '.cache' / 'tps-star' / 'responses'))
+    return ResponseCache(
+        root,
+        max_bytes=int(float(os.getenv('TPS_RESPONSE_CACHE_MAX_MB', '512')) * 1024 * 1024),
+        today_ttl=float(os.getenv('TPS_RESPONSE_CACHE_TODAY_TTL', '900')),
+    )
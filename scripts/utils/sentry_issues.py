@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Sentry Issue and Error-Count Collector
+======================================
+
+Builds the weekly Sentry section from the real API:
+
+1. walks the project's issue list with Sentry's ``Link`` cursor pagination
+   (``rel="next"; results="true"; cursor="..."``),
+2. fetches each issue's daily event counts (``events-stats``, ``interval=1d``)
+   on a bounded thread pool, starting as soon as each page arrives,
+3. folds the series into daily error totals and the top-N issues.
+
+Every issue seen in the window is counted, whatever its status: an issue
+resolved on Wednesday still raised its Monday errors. Only the top-N list
+is limited to issues that are still unresolved.
+
+Requests go through the shared transport with ``provider='sentry'`` (rate
+limits) and ``as_of`` (closed weeks are served from the response cache).
+
+Usage:
+    from utils.sentry_issues import collect_sentry_errors
+
+    section = collect_sentry_errors(org, project, token, start, end)
+
+    # A quarter fetched once, folded week by week
+    issues, series = SentryIssueCollector(org, project, token).collect_series(quarter_start, quarter_end)
+    week = fold_issue_series(issues, series, week_start, week_end)
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.http_transport import HTTPTransport, get_transport
+
+API_ROOT = "https://sentry.io/api/0/"
+PAGE_LIMIT = 100
+DEFAULT_WORKERS = 8
+TOP_N = 10
+
+_LINK_PART_RE = re.compile(r'<([^>]+)>((?:\s*;\s*[a-z]+="?[^";,]*"?)*)')
+_LINK_ATTR_RE = re.compile(r';\s*([a-z]+)="?([^";,]*)"?')
+
+
+def parse_sentry_links(link_header: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """``Link`` header -> ``{rel: {'url', 'cursor', 'results'}}``.
+
+    Sentry always sends a ``next`` link; ``results="false"`` marks the end.
+    """
+    links: Dict[str, Dict[str, Any]] = {}
+    for url, attrs in _LINK_PART_RE.findall(link_header or ''):
+        values = dict(_LINK_ATTR_RE.findall(attrs))
+        if 'rel' in values:
+            links[values['rel']] = {
+                'url': url,
+                'cursor': values.get('cursor'),
+                'results': values.get('results', 'false') == 'true',
+            }
+    return links
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _iso(value: datetime) -> str:
+    return _utc(value).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class SentryIssueCollector:
+    """Paginated issue listing plus concurrent per-issue daily counts."""
+
+    def __init__(self, organization: str, project: str, auth_token: str,
+                 api_root: str = API_ROOT, transport: HTTPTransport = None,
+                 max_workers: int = None):
+        self.organization = organization
+        self.project = project
+        self.api_root = api_root.rstrip('/') + '/'
+        self.headers = {'Authorization': f'Bearer {auth_token}'}
+        self.transport = transport or get_transport()
+        self.max_workers = max_workers or int(os.getenv('SENTRY_MAX_WORKERS', DEFAULT_WORKERS))
+        self.requests_made = 0
+
+    def _get(self, url: str, params: Dict[str, Any], as_of) -> Tuple[Any, Optional[str]]:
+        response = self.transport.request('GET', url, params=params, headers=self.headers,
+                                          provider='sentry', as_of=as_of)
+        self.requests_made += 1
+        response.raise_for_status()
+        return response.json(), response.headers.get('Link')
+
+    def iter_issue_pages(self, start: datetime, end: datetime,
+                         query: str = '') -> Iterator[List[Dict[str, Any]]]:
+        """Yield one page of issues (seen in the window) at a time; every status unless ``query`` says otherwise."""
+        url = f"{self.api_root}projects/{self.organization}/{self.project}/issues/"
+        # Sentry applies 'is:unresolved' when no query is sent at all: send an empty one
+        params = {'start': _iso(start), 'end': _iso(end), 'query': query, 'limit': PAGE_LIMIT}
+        while True:
+            issues, link = self._get(url, params, end.date())
+            if issues:
+                yield issues
+            following = parse_sentry_links(link).get('next')
+            if not following or not following['results'] or not following['cursor']:
+                return
+            params = dict(params, cursor=following['cursor'])
+
+    def issue_series(self, issue: Dict[str, Any], start: datetime, end: datetime) -> List[Tuple[str, int]]:
+        """Daily event counts of one issue as ``[(YYYY-MM-DD, count), ...]``."""
+        url = f"{self.api_root}organizations/{self.organization}/events-stats/"
+        params = {
+            'query': f"issue.id:{issue['id']}",
+            'start': _iso(start),
+            'end': _iso(end),
+            'interval': '1d',
+            'yAxis': 'count()',
+        }
+        project_id = (issue.get('project') or {}).get('id')
+        if project_id:
+            params['project'] = project_id
+        payload, _ = self._get(url, params, end.date())
+        series = []
+        for timestamp, values in payload.get('data') or []:
+            day = datetime.fromtimestamp(int(timestamp), tz=timezone.utc).strftime('%Y-%m-%d')
+            series.append((day, int(sum(v.get('count') or 0 for v in values))))
+        return series
+
+    def collect(self, start: datetime, end: datetime, top_n: int = TOP_N) -> Dict[str, Any]:
+        """Daily error totals and top-N issues for ``(start, end]`` (see :func:`fold_issue_series`)."""
+        issues, series = self.collect_series(start, end)
+        return fold_issue_series(issues, series, start, end, top_n)
+
+    def collect_series(self, start: datetime, end: datetime) -> Tuple[List[Dict[str, Any]], List[List[Tuple[str, int]]]]:
+        """Issues seen in ``[start, end]`` and their daily counts, unfolded.
+
+        Fetch a long window once and fold it per week with
+        :func:`fold_issue_series` (only each week's days are counted).
+        """
+        issues: List[Dict[str, Any]] = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sentry') as pool:
+            # Series requests start while later issue pages are still being walked
+            for page in self.iter_issue_pages(start, end):
+                for issue in page:
+                    issues.append(issue)
+                    futures.append(pool.submit(self.issue_series, issue, start, end))
+            series = [f.result() for f in futures]
+        return issues, series
+
+
+def fold_issue_series(issues: List[Dict[str, Any]], series: List[List[Tuple[str, int]]],
+                      start: datetime, end: datetime, top_n: int = TOP_N) -> Dict[str, Any]:
+    """Fold per-issue daily counts into the weekly Sentry section.
+
+    ``start`` is exclusive: the days after its day through ``end``'s day are
+    counted, so the reports' ``end - 7 days`` folds exactly the 7 report
+    days and consecutive weeks never share one. Totals count every issue;
+    ``top_errors`` only lists unresolved ones.
+    """
+    first, last = _utc(start).date() + timedelta(days=1), _utc(end).date()
+    days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    daily = dict.fromkeys(days, 0)
+
+    ranked = []
+    for issue, points in zip(issues, series):
+        total = 0
+        for day, count in points:
+            if day in daily:
+                daily[day] += count
+                total += count
+        if total:
+            ranked.append((total, issue))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    open_issues = [(total, issue) for total, issue in ranked if issue.get('status', 'unresolved') == 'unresolved']
+
+    return {
+        'total_errors': sum(daily.values()),
+        'unique_errors': len(ranked),
+        'issues_scanned': len(issues),
+        'daily_errors': [{'date': day, 'count': daily[day]} for day in days],
+        'top_errors': [
+            {
+                'error': issue.get('title'),
+                'count': total,
+                'issue_id': issue.get('id'),
+                'culprit': issue.get('culprit'),
+                'level': issue.get('level'),
+                'users': int(issue.get('userCount') or 0),
+                'permalink': issue.get('permalink'),
+            }
+            for total, issue in open_issues[:top_n]
+        ],
+    }
+
+
+def collect_sentry_errors(organization: str, project: str, auth_token: str,
+                          start: datetime, end: datetime, **kwargs: Any) -> Dict[str, Any]:
+    """One-call helper around :class:`SentryIssueCollector`."""
+    collector = SentryIssueCollector(organization, project, auth_token, **kwargs)
+    section = collector.collect(start, end)
+    section['api_requests'] = collector.requests_made
+    return section
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Shopify Bulk Operation Export
+=============================
+
+Full-history order export for backfills and year-over-year comparisons.
+Instead of paging the REST endpoint it:
+
+1. submits a GraphQL ``bulkOperationRunQuery`` for the order window (once:
+   an unanswered submit is checked against ``currentBulkOperation`` before
+   it is sent again),
+2. polls ``currentBulkOperation`` until Shopify reports COMPLETED,
+3. streams the resulting JSONL file line by line into per-day totals.
+
+The download is never materialised: memory is bounded by the number of days
+in the window, not by the number of orders, so multi-million-line results
+run in a fixed budget.
+
+The Admin API root is a parameter, so the whole flow can be pointed at a
+local stub (see ``scripts/shopify_bulk_stub.py``).
+
+Usage:
+    from utils.shopify_bulk import run_bulk_order_export
+
+    daily = run_bulk_order_export(base_url, headers, since, until)
+"""
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+from utils.http_transport import RETRY_STATUSES, HTTPTransport, get_transport
+from utils.rate_limits import get_scheduler
+from utils.resilience import CircuitOpen
+
+BULK_ORDERS_QUERY = """
+{
+  orders(query: "created_at:>='%(since)s' AND created_at:<='%(until)s'") {
+    edges {
+      node {
+        id
+        createdAt
+        totalPriceSet { shopMoney { amount } }
+        totalRefundedSet { shopMoney { amount } }
+      }
+    }
+  }
+}
+"""
+
+RUN_MUTATION = """
+mutation bulkRun($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+STATUS_QUERY = """
+{
+  currentBulkOperation {
+    id status errorCode objectCount url partialDataUrl query createdAt
+  }
+}
+"""
+
+TERMINAL_STATUSES = {'COMPLETED', 'FAILED', 'CANCELED', 'EXPIRED'}
+ACTIVE_STATUSES = {'CREATED', 'RUNNING'}
+READ_CHUNK_SIZE = 64 * 1024
+SUBMIT_ATTEMPTS = 5
+# Tolerated difference between our clock and Shopify's when matching createdAt
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+class BulkOperationError(RuntimeError):
+    """Raised when Shopify rejects or fails a bulk operation."""
+
+
+class ShopifyBulkClient:
+    """Minimal GraphQL client for bulk operations."""
+
+    def __init__(self, base_url: str, headers: Dict[str, str], transport: HTTPTransport = None):
+        self.graphql_url = f"{base_url.rstrip('/')}/graphql.json"
+        self.headers = dict(headers, **{'Content-Type': 'application/json'})
+        self.transport = transport or get_transport()
+
+    def _graphql(self, query: str, variables: Dict[str, Any] = None, retry: bool = True) -> Dict[str, Any]:
+        body = {'query': query}
+        if variables:
+            body['variables'] = variables
+        response = self.transport.request('POST', self.graphql_url, json=body, headers=self.headers,
+                                          provider='shopify_graphql', retry=retry)
+        response.raise_for_status()
+        payload = response.json()
+        self._record_cost(payload)
+        if payload.get('errors'):
+            raise BulkOperationError(f"GraphQL errors: {payload['errors']}")
+        return payload.get('data') or {}
+
+    @staticmethod
+    def _record_cost(payload: Dict[str, Any]):
+        """Sync the ``shopify_graphql`` bucket with the reported throttle status."""
+        scheduler = get_scheduler()
+        cost = (payload.get('extensions') or {}).get('cost') or {}
+        throttle = cost.get('throttleStatus') or {}
+        if scheduler is None or not throttle:
+            return
+        scheduler.record('shopify_graphql',
+                         remaining=throttle.get('currentlyAvailable'),
+                         capacity=throttle.get('maximumAvailable'),
+                         refill=throttle.get('restoreRate'),
+                         cost=cost.get('requestedQueryCost'))
+
+    def current(self) -> Dict[str, Any]:
+        return self._graphql(STATUS_QUERY).get('currentBulkOperation') or {}
+
+    def _submitted(self, query: str, since: datetime) -> Optional[Dict[str, Any]]:
+        """The current operation if it runs ``query`` and was started by us (or still runs)."""
+        operation = self.current()
+        if (operation.get('query') or '').strip() != query.strip():
+            return None
+        if operation.get('status') in ACTIVE_STATUSES:
+            return operation
+        created = operation.get('createdAt')
+        try:
+            created = datetime.fromisoformat(created.replace('Z', '+00:00')) if created else None
+        except ValueError:
+            created = None
+        return operation if created is not None and created >= since - CLOCK_SKEW else None
+
+    def submit(self, query: str, attempts: int = SUBMIT_ATTEMPTS) -> str:
+        """Start the bulk operation for ``query``; never starts it twice.
+
+        The mutation is not idempotent, so the transport does not retry it.
+        An attempt that gets no answer (network error, 429, 5xx) may still
+        have reached Shopify: ``currentBulkOperation`` is checked first and
+        the operation it reports is adopted when it runs the same query.
+        """
+        started = datetime.now(timezone.utc)
+        for attempt in range(attempts):
+            try:
+                data = self._graphql(RUN_MUTATION, {'query': query}, retry=False)
+                break
+            except CircuitOpen:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                status = getattr(e.response, 'status_code', None)
+                if (status is not None and status not in RETRY_STATUSES) or attempt == attempts - 1:
+                    raise
+                operation = self._submitted(query, started)
+                if operation is not None:
+                    print(f"📦 Bulk operation already submitted: {operation.get('id')} ({operation.get('status')})")
+                    return operation.get('id')
+                # Throttled: the scheduler holds the next attempt back
+                delay = 0.0 if status == 429 else min(30.0, 2.0 ** attempt)
+                print(f"↻ bulkOperationRunQuery: {status or e.__class__.__name__}, "
+                      f"not submitted, retrying in {delay:.0f}s")
+                time.sleep(delay)
+        result = data.get('bulkOperationRunQuery') or {}
+        if result.get('userErrors'):
+            raise BulkOperationError(f"bulkOperationRunQuery rejected: {result['userErrors']}")
+        operation = result.get('bulkOperation') or {}
+        print(f"📦 Bulk operation submitted: {operation.get('id')} ({operation.get('status')})")
+        return operation.get('id')
+
+    def wait(self, operation_id: Optional[str] = None, poll_interval: float = 2.0,
+             max_interval: float = 30.0, timeout: float = 3600.0) -> Dict[str, Any]:
+        """Poll until the current bulk operation reaches a terminal status."""
+        deadline = time.monotonic() + timeout
+        interval = poll_interval
+        while True:
+            operation = self.current()
+            if operation_id and operation.get('id') not in (None, operation_id):
+                raise BulkOperationError(f"Another bulk operation is running: {operation.get('id')}")
+            status = operation.get('status')
+            if status in TERMINAL_STATUSES:
+                if status != 'COMPLETED':
+                    raise BulkOperationError(f"Bulk operation {status}: {operation.get('errorCode')}")
+                print(f"✅ Bulk operation completed: {operation.get('objectCount')} objects")
+                return operation
+            if time.monotonic() >= deadline:
+                raise BulkOperationError(f"Bulk operation still {status} after {timeout:.0f}s")
+            time.sleep(interval)
+            # Long exports: back off rather than hammering the status query
+            interval = min(max_interval, interval * 1.5)
+
+    def iter_results(self, url: str) -> Iterator[Dict[str, Any]]:
+        """Yield one parsed object per JSONL line, streaming the download."""
+        response = self.transport.request('GET', url, stream=True)
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(chunk_size=READ_CHUNK_SIZE):
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+
+def _money(obj: Optional[Dict[str, Any]]) -> float:
+    try:
+        return float(obj['shopMoney']['amount'])
+    except (TypeError, KeyError, ValueError):
+        return 0.0
+
+
+def fold_orders_by_day(records: Iterator[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Fold bulk order records into ``{YYYY-MM-DD: {orders, revenue, refunds}}``.
+
+    Child lines (``__parentId``) from nested connections are ignored.
+    """
+    daily: Dict[str, Dict[str, float]] = {}
+    for record in records:
+        if '__parentId' in record or 'createdAt' not in record:
+            continue
+        day = record['createdAt'][:10]
+        bucket = daily.get(day)
+        if bucket is None:
+            bucket = daily[day] = {'orders': 0, 'revenue': 0.0, 'refunds': 0.0}
+        bucket['orders'] += 1
+        bucket['revenue'] += _money(record.get('totalPriceSet'))
+        bucket['refunds'] += _money(record.get('totalRefundedSet'))
+    return daily
+
+
+def run_bulk_order_export(base_url: str, headers: Dict[str, str], since: datetime, until: datetime,
+                          transport: HTTPTransport = None, poll_interval: float = 2.0,
+                          timeout: float = 3600.0) -> Dict[str, Dict[str, float]]:
+    """Submit, await and stream a bulk order export; return per-day totals."""
+    client = ShopifyBulkClient(base_url, headers, transport=transport)
+    query = BULK_ORDERS_QUERY % {'since': since.isoformat(), 'until': until.isoformat()}
+    operation_id = client.submit(query)
+    operation = client.wait(operation_id, poll_interval=poll_interval, timeout=timeout)
+
+    if not operation.get('url'):
+        # Shopify returns no file when the query matched nothing
+        return {}
+    return fold_orders_by_day(client.iter_results(operation['url']))
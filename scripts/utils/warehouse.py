@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Columnar Metrics Warehouse
+==========================
+
+One local store for every metric the exporters and reports produce, in long
+format::
+
+    date        source   market  metric           dimensions         value
+    2026-10-12  ga4      all     sessions                            1843.0
+    2026-10-12  ahrefs   all     domain_rating    domain=rival.com     38.0
+    2026-10-12  weekly   all     top_pages.views  page=/               912.0
+
+``market`` is kept out of ``dimensions`` because reports join and fan out on
+it; ``dimensions`` holds every other breakdown as sorted ``key=value`` pairs
+(empty for totals).
+
+Data is partitioned Hive-style by source and month::
+
+    <root>/source=ga4/month=2026-10/data.parquet
+
+Readers list partitions from the directory names first, so a query for one
+source over one quarter opens three files, and only the requested columns
+are read from them. Parquet needs ``pyarrow`` (optional); without it the
+same layout is written as CSV.
+
+Writes are upserts on ``(date, market, metric, dimensions)``: re-exporting a
+day replaces its values instead of duplicating them.
+
+Usage:
+    from utils.warehouse import MetricsWarehouse
+
+    warehouse = MetricsWarehouse()
+    warehouse.record('shopify', day, {'total_orders': 42, 'total_revenue': 3120.5})
+    warehouse.read(sources=['ga4'], metrics=['sessions'], start=date(2026, 1, 1))
+
+Environment:
+    TPS_WAREHOUSE_DIR=...        default report_data/warehouse
+    TPS_WAREHOUSE=0              disable writes (reads still work)
+"""
+
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except ImportError:
+    pa = None
+    pq = None
+    _HAS_PYARROW = False
+
+DEFAULT_WAREHOUSE_DIR = 'report_data/warehouse'
+DEFAULT_MARKET = 'all'
+COLUMNS = ['date', 'source', 'market', 'metric', 'dimensions', 'value']
+KEY_COLUMNS = ['date', 'market', 'metric', 'dimensions']
+WEEK_WINDOW = 'window=7d'
+
+# Display names (of the 7-day window totals) used by the business report,
+# the executive summary and the Streamlit dashboard
+REPORT_LABELS = {
+    'shopify': {
+        'total_orders': 'Conversions (7d)',
+        'total_revenue': 'Revenue (7d)',
+        'avg_order_value': 'AOV (7d)',
+        'net_revenue': 'Net Revenue (7d)',
+    },
+    'ga4': {
+        'sessions': 'Sessions (7d)',
+        'active_users': 'Users (7d)',
+        'pageviews': 'Pageviews (7d)',
+        'ecommerce.revenue': 'Revenue (7d)',
+        'ecommerce.transactions': 'Conversions (7d)',
+    },
+    'ahrefs': {
+        'domain_rating': 'Domain Rating',
+        'backlinks': 'Backlinks',
+        'ref_domains': 'Referring Domains',
+    },
+}
+
+# Sources whose rows are point-in-time totals rather than daily / window sums
+SNAPSHOT_SOURCES = ('ahrefs',)
+
+DateLike = Union[str, date, datetime]
+
+
+def _day(value: DateLike) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)[:10]
+
+
+def encode_dimensions(dimensions: Optional[Dict[str, Any]]) -> str:
+    """``{'target': 'a.com', 'role': 'site'}`` -> ``'role=site;target=a.com'``."""
+    if not dimensions:
+        return ''
+    return ';'.join(f"{k}={str(v).replace(';', ',')}" for k, v in sorted(dimensions.items()) if v is not None)
+
+
+def decode_dimensions(value: str) -> Dict[str, str]:
+    if not isinstance(value, str) or not value:
+        return {}
+    return dict(part.split('=', 1) for part in value.split(';') if '=' in part)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def _label_key(item: Dict[str, Any]) -> Optional[str]:
+    for key, value in item.items():
+        if isinstance(value, str):
+            return key
+    return None
+
+
+def flatten_metrics(payload: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, Dict[str, str], float]]:
+    """Yield ``(metric, dimensions, value)`` for every number in a nested section.
+
+    Nested dicts become dotted metric names; lists of records become one
+    metric per numeric field, labelled by the record's first string field
+    (``top_pages: [{'page': '/', 'views': 912}]`` -> ``top_pages.views``,
+    ``page=/``). Keys starting with ``_`` (bookkeeping) are skipped.
+    """
+    for key, value in (payload or {}).items():
+        if str(key).startswith('_'):
+            continue
+        name = f"{prefix}{key}"
+        if _is_number(value):
+            if np.isfinite(value):
+                yield name, {}, float(value)
+        elif isinstance(value, dict):
+            yield from flatten_metrics(value, prefix=f"{name}.")
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            for item in value:
+                label = _label_key(item)
+                dims = {label: item[label]} if label else {}
+                for field, number in item.items():
+                    if field != label and _is_number(number) and np.isfinite(number):
+                        yield f"{name}.{field}", dims, float(number)
+
+
+def to_long(source: str, day: DateLike, payload: Dict[str, Any], market: str = DEFAULT_MARKET,
+            dimensions: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Long rows for one nested metrics section measured on ``day``."""
+    rows = []
+    for metric, dims, value in flatten_metrics(payload):
+        rows.append((metric, encode_dimensions({**(dimensions or {}), **dims}), value))
+    frame = pd.DataFrame(rows, columns=['metric', 'dimensions', 'value'])
+    frame.insert(0, 'market', market)
+    frame.insert(0, 'source', source)
+    frame.insert(0, 'date', _day(day))
+    return frame[COLUMNS]
+
+
+def daily_to_long(source: str, frame: pd.DataFrame, market: str = DEFAULT_MARKET,
+                  dimension_columns: Iterable[str] = ()) -> pd.DataFrame:
+    """Wide daily table (``date`` + one column per metric) -> long rows.
+
+    ``dimension_columns`` become dimensions; other non-numeric columns are dropped.
+    """
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    frame = frame.copy()
+    frame['date'] = frame['date'].map(_day)
+    labels = [c for c in dimension_columns if c in frame.columns]
+    numeric = [c for c in frame.columns if c != 'date' and c not in labels
+               and pd.api.types.is_numeric_dtype(frame[c])]
+    if labels:
+        frame['dimensions'] = [encode_dimensions(dict(zip(labels, values)))
+                               for values in frame[labels].itertuples(index=False)]
+    else:
+        frame['dimensions'] = ''
+    long = frame.melt(id_vars=['date', 'dimensions'], value_vars=numeric, var_name='metric', value_name='value')
+    long = long.dropna(subset=['value'])
+    long['source'] = source
+    long['market'] = market
+    long['value'] = long['value'].astype(float)
+    return long[COLUMNS]
+
+
+class MetricsWarehouse:
+    """Hive-partitioned (source, month) long-format metric store."""
+
+    def __init__(self, root: Union[str, Path] = None, fmt: Optional[str] = None):
+        self.root = Path(root or os.getenv('TPS_WAREHOUSE_DIR', DEFAULT_WAREHOUSE_DIR))
+        self.fmt = fmt or ('parquet' if _HAS_PYARROW else 'csv')
+        if self.fmt == 'parquet' and not _HAS_PYARROW:
+            raise ValueError('parquet warehouse requires pyarrow')
+
+    # -- layout ---------------------------------------------------------------
+
+    def partition_path(self, source: str, month: str) -> Path:
+        return self.root / f"source={source}" / f"month={month}" / f"data.{self.fmt}"
+
+    def partitions(self, sources: Optional[Iterable[str]] = None, start: Optional[DateLike] = None,
+                   end: Optional[DateLike] = None) -> List[Tuple[str, str, Path]]:
+        """``(source, month, path)`` of every partition that can hold matching rows.
+
+        Pruning only looks at directory names; no file is opened.
+        """
+        wanted = set(sources) if sources else None
+        first = _day(start)[:7] if start else None
+        last = _day(end)[:7] if end else None
+        found = []
+        for source_dir in sorted(self.root.glob('source=*')):
+            source = source_dir.name.split('=', 1)[1]
+            if wanted is not None and source not in wanted:
+                continue
+            for month_dir in sorted(source_dir.glob('month=*')):
+                month = month_dir.name.split('=', 1)[1]
+                if (first and month < first) or (last and month > last):
+                    continue
+                path = month_dir / f"data.{self.fmt}"
+                if path.exists():
+                    found.append((source, month, path))
+        return found
+
+    def _read_file(self, path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        if self.fmt == 'parquet':
+            return pq.read_table(path, columns=columns).to_pandas()
+        dtypes = {'date': str, 'source': str, 'market': str, 'metric': str, 'dimensions': str, 'value': float}
+        frame = pd.read_csv(path, usecols=columns, dtype={c: t for c, t in dtypes.items()
+                                                            if columns is None or c in columns},
+                            keep_default_na=False, na_values={'value': ['']})
+        return frame
+
+    def _write_file(self, path: Path, frame: pd.DataFrame):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        if self.fmt == 'parquet':
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp)
+        else:
+            frame.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+
+    # -- writing --------------------------------------------------------------
+
+    def write(self, frame: pd.DataFrame) -> int:
+        """Upsert long rows; returns the number of rows written."""
+        if frame is None or frame.empty or not warehouse_enabled():
+            return 0
+        frame = frame[COLUMNS].copy()
+        frame['date'] = frame['date'].map(_day)
+        frame['dimensions'] = frame['dimensions'].fillna('').astype(str)
+        frame['market'] = frame['market'].fillna(DEFAULT_MARKET).astype(str)
+        frame['value'] = frame['value'].astype(float)
+        frame = frame.drop_duplicates(subset=['source'] + KEY_COLUMNS, keep='last')
+
+        for (source, month), part in frame.groupby(['source', frame['date'].str[:7]], sort=False):
+            path = self.partition_path(source, month)
+            if path.exists():
+                current = self._read_file(path)
+                # New rows win: drop stored rows with the same key
+                stale = current.set_index(KEY_COLUMNS).index.isin(part.set_index(KEY_COLUMNS).index)
+                part = pd.concat([current[~stale], part], ignore_index=True)
+            part = part.sort_values(KEY_COLUMNS).reset_index(drop=True)
+            self._write_file(path, part[COLUMNS])
+        return len(frame)
+
+    def record(self, source: str, day: DateLike, payload: Dict[str, Any], market: str = DEFAULT_MARKET,
+               dimensions: Optional[Dict[str, Any]] = None) -> int:
+        """Store every number of a (nested) metrics section measured on ``day``."""
+        return self.write(to_long(source, day, payload, market=market, dimensions=dimensions))
+
+    def record_daily(self, source: str, frame: pd.DataFrame, market: str = DEFAULT_MARKET,
+                     dimension_columns: Iterable[str] = ()) -> int:
+        """Store a wide daily table (``date`` + metric columns)."""
+        return self.write(daily_to_long(source, frame, market=market, dimension_columns=dimension_columns))
+
+    # -- reading --------------------------------------------------------------
+
+    def read(self, sources: Optional[Iterable[str]] = None, metrics: Optional[Iterable[str]] = None,
+             start: Optional[DateLike] = None, end: Optional[DateLike] = None,
+             markets: Optional[Iterable[str]] = None, dimensions: Optional[str] = None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rows matching the filters, reading only the partitions and columns needed.
+
+        ``dimensions=''`` keeps totals only; None keeps every breakdown.
+        """
+        columns = list(columns or COLUMNS)
+        filters = {'date': start is not None or end is not None, 'metric': metrics is not None,
+                   'market': markets is not None, 'dimensions': dimensions is not None}
+        needed = [c for c in COLUMNS if c in columns or filters.get(c)]
+        frames = []
+        for source, _, path in self.partitions(sources, start, end):
+            part = self._read_file(path, [c for c in needed if c != 'source'])
+            if 'source' in needed:
+                part['source'] = source
+            frames.append(part)
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        frame = pd.concat(frames, ignore_index=True)
+
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= (frame['date'] >= _day(start)).to_numpy()
+        if end is not None:
+            mask &= (frame['date'] <= _day(end)).to_numpy()
+        if metrics is not None:
+            mask &= frame['metric'].isin(list(metrics)).to_numpy()
+        if markets is not None:
+            mask &= frame['market'].isin(list(markets)).to_numpy()
+        if dimensions is not None:
+            mask &= (frame['dimensions'] == dimensions).to_numpy()
+        return frame.loc[mask, columns].reset_index(drop=True)
+
+    def pivot(self, sources: Optional[Iterable[str]] = None, metrics: Optional[Iterable[str]] = None,
+              start: Optional[DateLike] = None, end: Optional[DateLike] = None,
+              markets: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Totals as a wide frame: one row per (date, market), one column per ``source.metric``."""
+        frame = self.read(sources, metrics, start, end, markets, dimensions='',
+                          columns=['date', 'source', 'market', 'metric', 'value'])
+        if frame.empty:
+            return pd.DataFrame()
+        frame['column'] = frame['source'] + '.' + frame['metric']
+        return frame.pivot_table(index=['date', 'market'], columns='column', values='value', aggfunc='last')
+
+    def last_days(self, markets: Optional[Iterable[str]] = None) -> Dict[str, pd.Timestamp]:
+        """Last day with totals (daily or 7-day windows), per source.
+
+        Only each source's newest partition holding such rows is opened.
+        """
+        marks: Dict[str, pd.Timestamp] = {}
+        wanted = list(markets) if markets is not None else None
+        for source, _, path in sorted(self.partitions(), key=lambda found: found[:2], reverse=True):
+            if source in marks:
+                continue
+            part = self._read_file(path, ['date', 'market', 'dimensions'])
+            keep = part['dimensions'].isin(['', WEEK_WINDOW])
+            if wanted is not None:
+                keep &= part['market'].isin(wanted)
+            if keep.any():
+                marks[source] = pd.Timestamp(part.loc[keep, 'date'].max())
+        return marks
+
+    def latest(self, source: str, market: str = DEFAULT_MARKET, dimensions: str = '') -> Dict[str, float]:
+        """Most recent value of every metric of ``source`` (totals by default)."""
+        frame = self.read([source], markets=[market], dimensions=dimensions,
+                          columns=['date', 'metric', 'value'])
+        if frame.empty:
+            return {}
+        frame = frame.sort_values('date').drop_duplicates('metric', keep='last')
+        return dict(zip(frame['metric'], frame['value']))
+
+    def labelled(self, source: str, market: str = DEFAULT_MARKET) -> Dict[str, float]:
+        """Latest 7-day totals keyed by the report labels of :data:`REPORT_LABELS`."""
+        labels = REPORT_LABELS.get(source, {})
+        if source in SNAPSHOT_SOURCES:
+            values = self.latest(source, market)
+        else:
+            values = self.latest(source, market, dimensions=WEEK_WINDOW)
+        return {labels[m]: v for m, v in values.items() if m in labels}
+
+
+def warehouse_enabled() -> bool:
+    return os.getenv('TPS_WAREHOUSE', '1').lower() not in ('0', 'false', 'off', 'no')
@@ -17,6 +17,10 @@ import requests
 from datetime import datetime
 from typing import Dict, List, Tuple
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from utils.http_transport import get_transport
+from utils.resilience import CircuitOpen
+
 class CredentialValidator:
     def __init__(self):
         self.results = []
@@ -58,13 +62,16 @@ class CredentialValidator:
             # Use a simple endpoint that should return project info
             url = "https://amplitude.com/api/2/export"
             params = {
-                'start': '20241101',
-                'end': '20241101'
+                'start': '20241101T00',
+                'end': '20241101T00'
             }
 
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            # Stream: only the status is needed, never download the (zipped) export itself
+            response = get_transport().request('GET', url, headers=headers, params=params, timeout=10,
+                                               stream=True, retry=False, provider='amplitude')
+            response.close()
 
-            if response.status_code == 200:
+            if response.status_code in (200, 404):  # 404: valid credentials, no data that hour
                 return "✅", "Connected successfully", "API credentials valid"
             elif response.status_code == 401:
                 return "❌", "Authentication failed", "Check API key and secret"
@@ -73,6 +80,8 @@ class CredentialValidator:
             else:
                 return "⚠️", f"HTTP {response.status_code}", "Check API documentation"
 
+        except CircuitOpen as e:
+            return "⚠️", "Provider down (circuit open)", str(e)
         except requests.exceptions.Timeout:
             return "⚠️", "Connection timeout", "Network or API issue"
         except Exception as e:
@@ -91,7 +100,8 @@ class CredentialValidator:
             headers = {'Authorization': f'Bearer {auth_token}'}
             url = f"https://sentry.io/api/0/organizations/{org}/"
 
-            response = requests.get(url, headers=headers, timeout=10)
+            response = get_transport().request('GET', url, headers=headers, timeout=10,
+                                               retry=False, provider='sentry')
 
             if response.status_code == 200:
                 org_data = response.json()
@@ -103,6 +113,8 @@ class CredentialValidator:
             else:
                 return "⚠️", f"HTTP {response.status_code}", "Check Sentry API status"
 
+        except CircuitOpen as e:
+            return "⚠️", "Provider down (circuit open)", str(e)
         except Exception as e:
             return "❌", "Connection failed", str(e)
 
@@ -118,7 +130,8 @@ class CredentialValidator:
             headers = {'X-Shopify-Access-Token': access_token}
             url = f"{store_url}/admin/api/2023-07/shop.json"
 
-            response = requests.get(url, headers=headers, timeout=10)
+            response = get_transport().request('GET', url, headers=headers, timeout=10,
+                                               retry=False, provider='shopify')
 
             if response.status_code == 200:
                 shop_data = response.json()
@@ -131,6 +144,8 @@ class CredentialValidator:
             else:
                 return "⚠️", f"HTTP {response.status_code}", "Check Shopify API status"
 
+        except CircuitOpen as e:
+            return "⚠️", "Provider down (circuit open)", str(e)
         except Exception as e:
             return "❌", "Connection failed", str(e)
 